@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from alembic import context
 from src.core.config import settings
+from src.core.database import get_connect_args
 from src.db_models import Base
 
 # this is the Alembic Config object, which provides
@@ -72,6 +73,7 @@ async def run_async_migrations() -> None:
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        connect_args=get_connect_args('asyncpg'),
     )
 
     async with connectable.connect() as connection:
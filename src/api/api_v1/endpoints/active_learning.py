@@ -10,6 +10,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 import src.db_models as db_models
 from celery.result import AsyncResult
 from src.celery import AL_QUEUE, READER_QUEUE
+from src.celery.registry import (
+    PROCESS_SLIDE_TASK_NAME,
+    SYNCHRONIZE_SLIDES_TASK_NAME,
+)
 from src.core.celery import celery_app
 from src.core.database import get_async_session
 from src.core.redis import get_redis_session
@@ -32,8 +36,6 @@ from src.utils.pagination import PaginatedParams, paginate
 
 router = APIRouter()
 
-PROCESS_SLIDE_TASK_NAME = 'src.celery.active_learning.tasks.process_slide'
-
 
 @router.get(
     '/active_learning/models/mc',
@@ -256,7 +258,7 @@ async def synchronize_slides() -> AsyncTaskResponse:
     """
 
     task = celery_app.send_task(
-        'src.celery.active_learning.tasks.synchronize_slides',
+        SYNCHRONIZE_SLIDES_TASK_NAME,
         ignore_result=True,
         queue=READER_QUEUE
     )
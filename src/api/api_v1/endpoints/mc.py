@@ -3,19 +3,49 @@ import uuid
 import numpy as np
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
+from PIL.Image import Image
 from redis import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from celery.result import AsyncResult
+from src.celery.registry import PREDICT_MC_TASK_NAME
 from src.core.celery import celery_app
+from src.core.database import get_async_session
 from src.core.redis import get_redis_session
 from src.schemas.celery import AsyncTaskResponse
 from src.schemas.mc import MCPredictRequest, MCPredictResponse, MitosisLabel
-from src.schemas.shared import HTTPError
-from src.utils.api import exist_task, load_image
+from src.schemas.shared import HTTPError, Keypoint
+from src.utils.api import (
+    IMAGE_UPLOAD_OPENAPI_EXTRA,
+    exist_task,
+    get_offset,
+    get_slide_path,
+    load_image,
+    load_uploaded_image,
+    send_task_with_region,
+)
+from src.utils.geometry import (
+    GEOMETRY_RESPONSES,
+    GeometryEncoding,
+    geometry_response,
+    get_geometry_encoding,
+    pack_bboxes,
+)
 
 router = APIRouter()
 
-PREDICT_MC_TASK_NAME = 'src.celery.mc.tasks.predict_mc_task'
+
+def _send_predict_mc_task(
+    image: np.ndarray,
+    offset: Keypoint | None
+) -> AsyncTaskResponse:
+    """Sends the mitosis detection task to the worker."""
+    task = celery_app.send_task(PREDICT_MC_TASK_NAME, kwargs={
+        'image': image,
+        'offset': [offset.x, offset.y] if offset is not None else [0, 0]
+    })
+
+    return {'task_id': task.task_id, 'status': task.status}
 
 
 @router.post(
@@ -23,33 +53,62 @@ PREDICT_MC_TASK_NAME = 'src.celery.mc.tasks.predict_mc_task'
     response_model=AsyncTaskResponse,
     status_code=202
 )
-async def predict_mc(request: MCPredictRequest) -> AsyncTaskResponse:
-    """Endpoint for initiating a mitosis detection task."""
+async def predict_mc(
+    request: MCPredictRequest,
+    db: AsyncSession = Depends(get_async_session)
+) -> AsyncTaskResponse:
+    """Endpoint for initiating a mitosis detection task.
+    The image is either sent in the request or read from the slide region by the worker.
+    """
+    if request.region is not None:
+        slide_path = await get_slide_path(db, request.region)
+        offset = request.offset if request.offset is not None \
+            else Keypoint(x=request.region.x, y=request.region.y)
+
+        task = send_task_with_region(
+            PREDICT_MC_TASK_NAME,
+            request.region,
+            slide_path,
+            kwargs={'offset': [offset.x, offset.y]}
+        )
+
+        return {'task_id': task.task_id, 'status': task.status}
+
     image = await load_image(request.image)
     image = np.array(image)
 
-    offset = [request.offset.x, request.offset.y] \
-        if request.offset is not None else [0, 0]
+    return _send_predict_mc_task(image, request.offset)
 
-    task = celery_app.send_task(PREDICT_MC_TASK_NAME, kwargs={
-        'image': image,
-        'offset': offset
-    })
 
-    return {'task_id': task.task_id, 'status': task.status}
+@router.post(
+    '/models/mc/upload',
+    response_model=AsyncTaskResponse,
+    status_code=202,
+    openapi_extra=IMAGE_UPLOAD_OPENAPI_EXTRA
+)
+async def predict_mc_upload(
+    image: Image = Depends(load_uploaded_image),
+    offset: Keypoint | None = Depends(get_offset)
+) -> AsyncTaskResponse:
+    """Endpoint for initiating a mitosis detection task on an uploaded image.
+    The image must be at least 512x512px.
+    """
+    return _send_predict_mc_task(np.array(image), offset)
 
 
 @router.get(
     '/models/mc',
     response_model=MCPredictResponse,
     responses={
+        **GEOMETRY_RESPONSES,
         202: {'model': AsyncTaskResponse},
         404: {'model': HTTPError}
     }
 )
 async def get_mc_result(
     task_id: uuid.UUID,
-    db_redis: Redis = Depends(get_redis_session)
+    db_redis: Redis = Depends(get_redis_session),
+    encoding: GeometryEncoding | None = Depends(get_geometry_encoding)
 ) -> MCPredictResponse:
     """Endpoint for retrieving the result of a mitosis detection task.
     The task result is deleted immediately after the first read.
@@ -74,6 +133,22 @@ async def get_mc_result(
         children_task.forget()
     task.forget()
 
+    if encoding is not None:
+        return geometry_response({
+            'mitosis': {
+                'bboxes': pack_bboxes([res['bbox'] for res in results]),
+                'confidences': np.array(
+                    [res['conf'] for res in results],
+                    dtype=np.float32
+                ),
+                'labels': [
+                    MitosisLabel.mitosis.value if res['label'] == 0
+                    else MitosisLabel.hard_negative_mitosis.value
+                    for res in results
+                ]
+            }
+        }, encoding)
+
     def _transform_bbox(bbox: np.ndarray) -> dict[str, float]:
         x1, y1, x2, y2 = bbox
 
@@ -3,19 +3,40 @@ import uuid
 import numpy as np
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import JSONResponse
+from PIL.Image import Image
 from redis import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from celery.result import AsyncResult
+from src.celery.registry import PREDICT_NP_TASK_NAME
 from src.core.celery import celery_app
+from src.core.database import get_async_session
 from src.core.redis import get_redis_session
 from src.schemas.celery import AsyncTaskResponse
 from src.schemas.np import NPLabel, NPPredictRequest, NPPredictResponse
 from src.schemas.shared import HTTPError
-from src.utils.api import exist_task, load_image
+from src.utils.api import (
+    IMAGE_UPLOAD_OPENAPI_EXTRA,
+    exist_task,
+    get_slide_path,
+    load_image,
+    load_uploaded_image,
+    send_task_with_region,
+)
 
 router = APIRouter()
 
-PREDICT_NP_TASK_NAME = 'src.celery.np.tasks.predict_np_task'
+
+def _send_predict_np_task(image: np.ndarray) -> AsyncTaskResponse:
+    """Sends the nuclear pleomorphism classification task to the worker."""
+    task = celery_app.send_task(PREDICT_NP_TASK_NAME, kwargs={
+        'image': image
+    })
+
+    return {
+        'task_id': task.task_id,
+        'status': task.status
+    }
 
 
 @router.post(
@@ -23,19 +44,47 @@ PREDICT_NP_TASK_NAME = 'src.celery.np.tasks.predict_np_task'
     response_model=AsyncTaskResponse,
     status_code=202
 )
-async def predict_np(request: NPPredictRequest) -> AsyncTaskResponse:
-    """Endpoint for initiating a nuclear pleomorphism classification task."""
+async def predict_np(
+    request: NPPredictRequest,
+    db: AsyncSession = Depends(get_async_session)
+) -> AsyncTaskResponse:
+    """Endpoint for initiating a nuclear pleomorphism classification task.
+    The image is either sent in the request or read from the slide region by the worker.
+    """
+    if request.region is not None:
+        slide_path = await get_slide_path(db, request.region)
+
+        task = send_task_with_region(
+            PREDICT_NP_TASK_NAME,
+            request.region,
+            slide_path,
+            kwargs={}
+        )
+
+        return {
+            'task_id': task.task_id,
+            'status': task.status
+        }
+
     image = await load_image(request.image)
     image = np.array(image)
 
-    task = celery_app.send_task(PREDICT_NP_TASK_NAME, kwargs={
-        'image': image
-    })
+    return _send_predict_np_task(image)
 
-    return {
-        'task_id': task.task_id,
-        'status': task.status
-    }
+
+@router.post(
+    '/models/np/upload',
+    response_model=AsyncTaskResponse,
+    status_code=202,
+    openapi_extra=IMAGE_UPLOAD_OPENAPI_EXTRA
+)
+async def predict_np_upload(
+    image: Image = Depends(load_uploaded_image)
+) -> AsyncTaskResponse:
+    """Endpoint for initiating a nuclear pleomorphism classification task
+    on an uploaded image. The image must be at least 256x256px from x20 magnification.
+    """
+    return _send_predict_np_task(np.array(image))
 
 
 @router.get(
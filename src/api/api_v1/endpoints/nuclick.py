@@ -1,12 +1,15 @@
 import asyncio
 import uuid
+from typing import Annotated
 
 import numpy as np
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import JSONResponse
+from PIL.Image import Image
 from redis import Redis
 
 from celery.result import AsyncResult
+from src.celery.registry import PREDICT_NUCLICK_TASK_NAME
 from src.core.celery import celery_app
 from src.core.redis import get_redis_session
 from src.schemas.celery import AsyncTaskResponse
@@ -16,33 +19,60 @@ from src.schemas.nuclick import (
     NuclickPredictRequest,
     NuclickPredictResponse,
 )
-from src.schemas.shared import HTTPError
-from src.utils.api import exist_task, load_image
+from src.schemas.shared import BoundingBox, HTTPError
+from src.utils.api import (
+    IMAGE_UPLOAD_OPENAPI_EXTRA,
+    exist_task,
+    get_offset,
+    load_image,
+    load_uploaded_image,
+    parse_bboxes,
+    parse_keypoints,
+)
+from src.utils.geometry import (
+    GEOMETRY_RESPONSES,
+    GeometryEncoding,
+    geometry_response,
+    get_geometry_encoding,
+    pack_polygons,
+)
+from src.utils.polygons import polygons_to_keypoints
 
 router = APIRouter()
 
-PREDICT_NUCLICK_TASK_NAME = 'src.celery.nuclick.tasks.predict_nuclick_task'
-
 
-@router.post(
-    '/models/nuclick',
-    response_model=NuclickPredictResponse,
-)
-async def predict_nuclick(
-    request: NuclickPredictRequest,
-    r: Redis = Depends(get_redis_session)
+def _nuclick_response(
+    polygons: list[np.ndarray],
+    encoding: GeometryEncoding | None
 ) -> NuclickPredictResponse:
-    """Endpoint for the nuclei segmentation."""
-    image = await load_image(request.image)
-    image = np.array(image)
+    """Creates the response with the polygons of the segmented nuclei
+    in the negotiated format."""
+    if encoding is not None:
+        return geometry_response(
+            {'segmented_nuclei': pack_polygons(polygons, encoding.delta)},
+            encoding
+        )
+
+    return {
+        'segmented_nuclei': polygons_to_keypoints(polygons)
+    }
 
+
+async def _predict_nuclick(
+    image: np.ndarray,
+    keypoints: list[Keypoint],
+    offset: Keypoint | None,
+    r: Redis,
+    encoding: GeometryEncoding | None
+) -> NuclickPredictResponse:
+    """Sends the nuclei segmentation task to the worker and waits for the result."""
     task = celery_app.send_task(
         PREDICT_NUCLICK_TASK_NAME,
         kwargs={
             'image': image,
-            'keypoints': request.keypoints,
-            'offset': (0, 0) if request.offset is None
-            else (request.offset.x, request.offset.y)
+            'keypoints': keypoints,
+            'offset': (0, 0) if offset is None
+            else (offset.x, offset.y)
         }
     )
 
@@ -54,31 +84,21 @@ async def predict_nuclick(
     result = task.get()
     task.forget()
 
-    return {
-        'segmented_nuclei': result
-    }
+    return _nuclick_response(result, encoding)
 
 
-@router.post(
-    '/models/nuclick/bbox-dense',
-    response_model=AsyncTaskResponse
-)
-async def predict_bbox_dense_annotation(
-    request: NuclickBBoxDensePredictRequest
+def _send_predict_bbox_dense_task(
+    image: np.ndarray,
+    bboxes: list[BoundingBox],
+    offset: Keypoint | None
 ) -> AsyncTaskResponse:
-    """Endpoint for the nuclei segmentation defined by bounding boxes.
-    The endpoint uses NuClick for the dense prediction and it simulates the user click
-    by using the center of the bounding box.
-    """
-    image = await load_image(request.image)
-    image = np.array(image)
-
+    """Sends the nuclei segmentation task defined by bounding boxes to the worker."""
     keypoints = [
         Keypoint(
             x=bbox.x + bbox.width / 2,
             y=bbox.y + bbox.height / 2
         )
-        for bbox in request.bboxes
+        for bbox in bboxes
     ]
 
     task = celery_app.send_task(
@@ -86,8 +106,8 @@ async def predict_bbox_dense_annotation(
         kwargs={
             'image': image,
             'keypoints': keypoints,
-            'offset': (0, 0) if request.offset is None
-            else (request.offset.x, request.offset.y)
+            'offset': (0, 0) if offset is None
+            else (offset.x, offset.y)
         }
     )
 
@@ -97,17 +117,120 @@ async def predict_bbox_dense_annotation(
     }
 
 
+@router.post(
+    '/models/nuclick',
+    response_model=NuclickPredictResponse,
+    responses=GEOMETRY_RESPONSES
+)
+async def predict_nuclick(
+    request: NuclickPredictRequest,
+    r: Redis = Depends(get_redis_session),
+    encoding: GeometryEncoding | None = Depends(get_geometry_encoding)
+) -> NuclickPredictResponse:
+    """Endpoint for the nuclei segmentation."""
+    image = await load_image(request.image)
+    image = np.array(image)
+
+    return await _predict_nuclick(
+        image,
+        request.keypoints,
+        request.offset,
+        r,
+        encoding
+    )
+
+
+@router.post(
+    '/models/nuclick/upload',
+    response_model=NuclickPredictResponse,
+    responses=GEOMETRY_RESPONSES,
+    openapi_extra=IMAGE_UPLOAD_OPENAPI_EXTRA
+)
+async def predict_nuclick_upload(
+    keypoints: Annotated[
+        list[str],
+        Query(
+            min_length=1,
+            max_length=16,
+            description="A list of user-defined keypoints in the format `x,y` "
+            "relative to the top left corner of the image."
+        )
+    ],
+    image: Image = Depends(load_uploaded_image),
+    offset: Keypoint | None = Depends(get_offset),
+    r: Redis = Depends(get_redis_session),
+    encoding: GeometryEncoding | None = Depends(get_geometry_encoding)
+) -> NuclickPredictResponse:
+    """Endpoint for the nuclei segmentation of an uploaded image.
+    The image must be at least 128x128px.
+    """
+    return await _predict_nuclick(
+        np.array(image),
+        parse_keypoints(keypoints),
+        offset,
+        r,
+        encoding
+    )
+
+
+@router.post(
+    '/models/nuclick/bbox-dense',
+    response_model=AsyncTaskResponse
+)
+async def predict_bbox_dense_annotation(
+    request: NuclickBBoxDensePredictRequest
+) -> AsyncTaskResponse:
+    """Endpoint for the nuclei segmentation defined by bounding boxes.
+    The endpoint uses NuClick for the dense prediction and it simulates the user click
+    by using the center of the bounding box.
+    """
+    image = await load_image(request.image)
+    image = np.array(image)
+
+    return _send_predict_bbox_dense_task(image, request.bboxes, request.offset)
+
+
+@router.post(
+    '/models/nuclick/bbox-dense/upload',
+    response_model=AsyncTaskResponse,
+    openapi_extra=IMAGE_UPLOAD_OPENAPI_EXTRA
+)
+async def predict_bbox_dense_annotation_upload(
+    bboxes: Annotated[
+        list[str],
+        Query(
+            min_length=1,
+            max_length=16,
+            description="A list of user-defined bounding boxes in the format "
+            "`x,y,width,height` relative to the top left corner of the image."
+        )
+    ],
+    image: Image = Depends(load_uploaded_image),
+    offset: Keypoint | None = Depends(get_offset)
+) -> AsyncTaskResponse:
+    """Endpoint for the nuclei segmentation of an uploaded image defined
+    by bounding boxes. The image must be at least 128x128px.
+    """
+    return _send_predict_bbox_dense_task(
+        np.array(image),
+        parse_bboxes(bboxes),
+        offset
+    )
+
+
 @router.get(
     '/models/nuclick/bbox-dense',
     response_model=NuclickPredictResponse,
     responses={
+        **GEOMETRY_RESPONSES,
         202: {'model': AsyncTaskResponse},
         404: {'model': HTTPError}
     }
 )
 async def get_predict_bbox_dense_annotation_result(
     task_id: uuid.UUID,
-    db_redis: Redis = Depends(get_redis_session)
+    db_redis: Redis = Depends(get_redis_session),
+    encoding: GeometryEncoding | None = Depends(get_geometry_encoding)
 ) -> NuclickPredictResponse:
     """Endpoint for retrieving the result of a nuclei segmentation task.
     The task result is deleted immediately after the first read.
@@ -129,6 +252,4 @@ async def get_predict_bbox_dense_annotation_result(
     result = task.get()
     task.forget()
 
-    return {
-        'segmented_nuclei': result
-    }
+    return _nuclick_response(result, encoding)
@@ -7,10 +7,17 @@ from typing import Annotated, Any
 import numpy as np
 from fastapi import APIRouter, Body, Depends, HTTPException
 from fastapi.responses import JSONResponse
+from PIL.Image import Image
 from redis import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from celery.result import AsyncResult
+from src.celery.registry import (
+    GET_SAM_EMBEDDINGS_TASK_NAME,
+    PREDICT_SAM_TASK_NAME,
+)
 from src.core.celery import celery_app
+from src.core.database import get_async_session
 from src.core.redis import get_redis_session
 from src.schemas.celery import AsyncTaskResponse
 from src.schemas.sam import (
@@ -20,22 +27,28 @@ from src.schemas.sam import (
     SAMPredictResponse,
 )
 from src.schemas.shared import BoundingBox, HTTPError
-from src.utils.api import exist_task, load_image
+from src.utils.api import (
+    IMAGE_UPLOAD_OPENAPI_EXTRA,
+    exist_task,
+    get_slide_path,
+    load_image,
+    load_uploaded_image,
+    send_task_with_region,
+)
+from src.utils.geometry import (
+    GEOMETRY_RESPONSES,
+    GeometryEncoding,
+    geometry_response,
+    get_geometry_encoding,
+    pack_polygons,
+)
+from src.utils.polygons import polygons_to_keypoints
 
 router = APIRouter()
 
-GET_SAM_EMBEDDINGS_TASK_NAME = 'src.celery.sam.tasks.get_sam_embeddings_task'
-
-
-@router.post(
-    '/models/sam/embeddings',
-    response_model=AsyncTaskResponse,
-)
-async def get_sam_embeddings(request: GetSAMEmbeddingsRequest) -> AsyncTaskResponse:
-    """Endpoint for the extraction of SAM encoder embeddings."""
-    image = await load_image(request.image)
-    image = np.array(image)
 
+def _send_get_sam_embeddings_task(image: np.ndarray) -> AsyncTaskResponse:
+    """Sends the SAM embeddings extraction task to the worker."""
     task = celery_app.send_task(
         GET_SAM_EMBEDDINGS_TASK_NAME,
         kwargs={
@@ -49,6 +62,50 @@ async def get_sam_embeddings(request: GetSAMEmbeddingsRequest) -> AsyncTaskRespo
     }
 
 
+@router.post(
+    '/models/sam/embeddings',
+    response_model=AsyncTaskResponse,
+)
+async def get_sam_embeddings(
+    request: GetSAMEmbeddingsRequest,
+    db: AsyncSession = Depends(get_async_session)
+) -> AsyncTaskResponse:
+    """Endpoint for the extraction of SAM encoder embeddings.
+    The image is either sent in the request or read from the slide region by the worker.
+    """
+    if request.region is not None:
+        slide_path = await get_slide_path(db, request.region)
+
+        task = send_task_with_region(
+            GET_SAM_EMBEDDINGS_TASK_NAME,
+            request.region,
+            slide_path,
+            kwargs={}
+        )
+
+        return {
+            'task_id': task.task_id,
+            'status': task.status
+        }
+
+    image = await load_image(request.image)
+    image = np.array(image)
+
+    return _send_get_sam_embeddings_task(image)
+
+
+@router.post(
+    '/models/sam/embeddings/upload',
+    response_model=AsyncTaskResponse,
+    openapi_extra=IMAGE_UPLOAD_OPENAPI_EXTRA
+)
+async def get_sam_embeddings_upload(
+    image: Image = Depends(load_uploaded_image)
+) -> AsyncTaskResponse:
+    """Endpoint for the extraction of SAM encoder embeddings of an uploaded image."""
+    return _send_get_sam_embeddings_task(np.array(image))
+
+
 @router.get(
     '/models/sam/embeddings',
     response_model=AsyncTaskResponse,
@@ -86,7 +143,8 @@ async def get_sam_embeddings_result(
 
 @router.post(
     '/models/sam',
-    response_model=SAMPredictResponse
+    response_model=SAMPredictResponse,
+    responses=GEOMETRY_RESPONSES
 )
 async def predict_sam(
     request: Annotated[
@@ -96,7 +154,8 @@ async def predict_sam(
             ['json_schema_extra']['openapi_examples']
         )
     ],
-    r: Redis = Depends(get_redis_session)
+    r: Redis = Depends(get_redis_session),
+    encoding: GeometryEncoding | None = Depends(get_geometry_encoding)
 ) -> SAMPredictResponse:
     """Endpoint for the SAM segmentation."""
     def _transform_keypoints(
@@ -128,7 +187,7 @@ async def predict_sam(
         if request.offset is not None else [0, 0]
 
     task = celery_app.send_task(
-        'src.celery.sam.tasks.predict_sam',
+        PREDICT_SAM_TASK_NAME,
         kwargs={
             'embeddings_task_id': request.embeddings_task_id,
             'previous_predict_task_id': request.previous_predict_task_id,
@@ -148,7 +207,16 @@ async def predict_sam(
 
     result = task.get()
 
+    if encoding is not None:
+        return geometry_response({
+            'segmented_objects': pack_polygons(
+                result['segmented_objects'],
+                encoding.delta
+            ),
+            'previous_predict_task_id': task.task_id
+        }, encoding)
+
     return {
-        'segmented_objects': result['segmented_objects'],
+        'segmented_objects': polygons_to_keypoints(result['segmented_objects']),
         "previous_predict_task_id": task.task_id
     }
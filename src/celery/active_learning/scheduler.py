@@ -0,0 +1,231 @@
+import logging
+import time
+from typing import NamedTuple
+
+from redis import Redis
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = 'annotaid:slide_scan'
+# The rotation of the slides with the waiting or the running tiles
+_SLIDES_KEY = f'{_KEY_PREFIX}:slides'
+_LOCK_KEY = f'{_KEY_PREFIX}:lock'
+# Seconds the scheduler may hold the lock
+_LOCK_TIMEOUT = 30
+
+
+class ScheduledTile(NamedTuple):
+    """The tile of the slide scan to be processed."""
+    slide_path: str
+    tile_size: int
+    x: int
+    y: int
+
+
+def _pending_key(slide_path: str) -> str:
+    """The list of the waiting tiles of the slide."""
+    return f'{_KEY_PREFIX}:{slide_path}:pending'
+
+
+def _running_key(slide_path: str) -> str:
+    """The sorted set of the running tiles of the slide scored by their deadline."""
+    return f'{_KEY_PREFIX}:{slide_path}:running'
+
+
+def _tile_size_key(slide_path: str) -> str:
+    """The size of the tiles of the slide scan."""
+    return f'{_KEY_PREFIX}:{slide_path}:tile_size'
+
+
+def _retries_key(slide_path: str) -> str:
+    """The hash of the times the timed out tiles of the slide were requeued."""
+    return f'{_KEY_PREFIX}:{slide_path}:retries'
+
+
+def _encode_tile(x: int, y: int) -> str:
+    return f'{x},{y}'
+
+
+def _decode_tile(tile: bytes) -> tuple[int, int]:
+    x, y = tile.split(b',')
+
+    return int(x), int(y)
+
+
+def enqueue_tiles(
+    client: Redis,
+    slide_path: str,
+    tile_size: int,
+    coords: list[tuple[int, int]]
+) -> None:
+    """Adds the tiles of the slide to the scan. The waiting tiles of the previous
+    scan of the slide and their retries are replaced. The scheduler lock is held,
+    so the slide is not removed as finished by acquire_tiles in the meantime.
+
+    Args:
+        client (Redis): The Redis client.
+        slide_path (str): The path to the slide.
+        tile_size (int): The size of the tiles.
+        coords (list[tuple[int, int]]): The coordinates of the tiles.
+    """
+    with client.lock(_LOCK_KEY, timeout=_LOCK_TIMEOUT), client.pipeline() as pipeline:
+        pipeline.delete(_pending_key(slide_path), _retries_key(slide_path))
+
+        if coords:
+            pipeline.rpush(
+                _pending_key(slide_path),
+                *(_encode_tile(int(x), int(y)) for x, y in coords)
+            )
+
+        pipeline.set(_tile_size_key(slide_path), tile_size)
+        pipeline.lrem(_SLIDES_KEY, 0, slide_path)
+        pipeline.rpush(_SLIDES_KEY, slide_path)
+        pipeline.execute()
+
+
+def _requeue_timed_out_tiles(
+    client: Redis,
+    slide_paths: list[str],
+    now: float
+) -> None:
+    """Moves the timed out running tiles (e.g. of the lost workers) back
+    to the waiting tiles. A tile is requeued at most AL_SCAN_TILE_RETRIES times,
+    then it is dropped from the scan.
+
+    Args:
+        client (Redis): The Redis client.
+        slide_paths (list[str]): The paths to the slides.
+        now (float): The current time.
+    """
+    with client.pipeline(transaction=False) as pipeline:
+        for slide_path in slide_paths:
+            pipeline.zrangebyscore(_running_key(slide_path), '-inf', now)
+
+        timed_out = pipeline.execute()
+
+    for slide_path, tiles in zip(slide_paths, timed_out):
+        if not tiles:
+            continue
+
+        with client.pipeline() as pipeline:
+            pipeline.zrem(_running_key(slide_path), *tiles)
+
+            for tile in tiles:
+                pipeline.hincrby(_retries_key(slide_path), tile)
+
+            retries = pipeline.execute()[1:]
+
+        requeued = [
+            tile for tile, count in zip(tiles, retries)
+            if count <= settings.AL_SCAN_TILE_RETRIES
+        ]
+        dropped = [tile.decode() for tile in tiles if tile not in requeued]
+
+        if requeued:
+            client.rpush(_pending_key(slide_path), *requeued)
+
+        if dropped:
+            logger.warning(
+                f'Tiles {dropped} of the scan of {slide_path} timed out '
+                f'{settings.AL_SCAN_TILE_RETRIES + 1} times and are dropped'
+            )
+
+
+def acquire_tiles(client: Redis) -> list[ScheduledTile]:
+    """Takes the waiting tiles which can be started. The slides take turns,
+    so the scans of several slides progress fairly, while at most
+    AL_SCAN_TILES_PER_SLIDE tiles of a slide and AL_SCAN_MAX_TILES tiles
+    of all the slides are running. The timed out tiles are requeued
+    and the finished scans are removed.
+
+    Args:
+        client (Redis): The Redis client.
+
+    Returns:
+        list[ScheduledTile]: The tiles to be started.
+    """
+    with client.lock(_LOCK_KEY, timeout=_LOCK_TIMEOUT):
+        now = time.time()
+        slide_paths = [slide.decode() for slide in client.lrange(_SLIDES_KEY, 0, -1)]
+
+        _requeue_timed_out_tiles(client, slide_paths, now)
+
+        with client.pipeline(transaction=False) as pipeline:
+            for slide_path in slide_paths:
+                pipeline.zcard(_running_key(slide_path))
+                pipeline.llen(_pending_key(slide_path))
+                pipeline.get(_tile_size_key(slide_path))
+
+            results = pipeline.execute()
+
+        running = dict(zip(slide_paths, results[0::3]))
+        pending = dict(zip(slide_paths, results[1::3]))
+        tile_sizes = dict(zip(slide_paths, results[2::3]))
+
+        total_running = sum(running.values())
+        tiles: list[ScheduledTile] = []
+        acquired = True
+
+        # a tile of each slide in turn until the limits are reached
+        while acquired and total_running < settings.AL_SCAN_MAX_TILES:
+            acquired = False
+
+            for slide_path in slide_paths:
+                if total_running >= settings.AL_SCAN_MAX_TILES:
+                    break
+
+                is_full = running[slide_path] >= settings.AL_SCAN_TILES_PER_SLIDE
+
+                if pending[slide_path] == 0 or is_full:
+                    continue
+
+                tile = client.lpop(_pending_key(slide_path))
+
+                if tile is None:
+                    pending[slide_path] = 0
+                    continue
+
+                client.zadd(
+                    _running_key(slide_path),
+                    {tile: now + settings.AL_SCAN_TILE_TIMEOUT}
+                )
+
+                pending[slide_path] -= 1
+                running[slide_path] += 1
+                total_running += 1
+                acquired = True
+
+                tiles.append(ScheduledTile(
+                    slide_path,
+                    int(tile_sizes[slide_path]),
+                    *_decode_tile(tile)
+                ))
+
+        for slide_path in slide_paths:
+            if pending[slide_path] == 0 and running[slide_path] == 0:
+                client.lrem(_SLIDES_KEY, 0, slide_path)
+                client.delete(
+                    _pending_key(slide_path),
+                    _running_key(slide_path),
+                    _tile_size_key(slide_path),
+                    _retries_key(slide_path)
+                )
+
+        # the next slide starts the next turn
+        client.lmove(_SLIDES_KEY, _SLIDES_KEY, 'LEFT', 'RIGHT')
+
+        return tiles
+
+
+def release_tile(client: Redis, slide_path: str, x: int, y: int) -> None:
+    """Marks the running tile as completed (or failed).
+
+    Args:
+        client (Redis): The Redis client.
+        slide_path (str): The path to the slide.
+        x (int): The x coordinate of the tile.
+        y (int): The y coordinate of the tile.
+    """
+    client.zrem(_running_key(slide_path), _encode_tile(x, y))
@@ -1,5 +1,6 @@
 import base64
 import copy
+from functools import lru_cache
 from io import BytesIO
 
 import cv2
@@ -13,20 +14,130 @@ import src.db_models as db_models
 from celery import Task, shared_task
 from celery.canvas import Signature
 from celery.result import AsyncResult
+from redis import Redis
 from src.celery import AL_QUEUE, AL_QUEUE_1, READER_QUEUE
 from src.celery.database import get_session
-from src.celery.mc.tasks import _predict_mc_task
+from src.celery.mc.tasks import (
+    _predict_mc_task,
+    apply_offset_to_bboxes,
+    predict_mc_first_stage_task,
+    predict_mc_second_stage_task,
+)
 from src.celery.shared import dmap, expand_args
+from src.celery.shared.stain import get_tile_stain_parameters
 from src.core.celery import celery_app
 from src.core.config import settings
+from src.core.metrics import span
+from src.core.redis import connection_pool
 from src.models.mc.custom_types import MitosisPrediction
+from src.models.stain import StainParameters, estimate_stain_parameters
 
 from .definitions import GetSlideMetadataResponse
+from .scheduler import acquire_tiles, enqueue_tiles, release_tile
 from .utils import convert_bbox_to_wkt, join_url, transform_label
 
 MITOSIS_MEAN_LAB = np.array([52.357067, 29.037254, -30.11074], dtype=np.float32)
 
 
+def _fetch_tile(
+    level: int,
+    slide_path: str,
+    x: int,
+    y: int,
+    width: int,
+    height: int
+) -> bytes:
+    """Fetch an encoded tile from the reader service.
+
+    Args:
+        level (int): The level of the slide.
+        slide_path (str): The path to the slide.
+        x (int): The x coordinate of the tile.
+        y (int): The y coordinate of the tile.
+        width (int): The width of the tile.
+        height (int): The height of the tile.
+
+    Returns:
+        bytes: The encoded tile.
+    """
+    response = httpx.get(
+        join_url(settings.READER_URL, slide_path),
+        params={
+            'z': level,
+            'x': x,
+            'y': y,
+            'w': width,
+            'h': height
+        }
+    )
+    response.raise_for_status()
+
+    return response.content
+
+
+def _fetch_crop(
+    slide_path: str,
+    x: int,
+    y: int,
+    width: int,
+    height: int
+) -> bytes:
+    """Fetch an encoded crop of the full resolution slide from the reader service.
+
+    Args:
+        slide_path (str): The path to the slide.
+        x (int): The x coordinate of the crop.
+        y (int): The y coordinate of the crop.
+        width (int): The width of the crop.
+        height (int): The height of the crop.
+
+    Returns:
+        bytes: The encoded crop.
+    """
+    response = httpx.get(
+        join_url(settings.READER_URL, f"/crop/{slide_path}"),
+        params={
+            'x': x,
+            'y': y,
+            'w': width,
+            'h': height
+        }
+    )
+    response.raise_for_status()
+
+    return base64.b64decode(response.json()['base64Image'])
+
+
+@lru_cache(maxsize=settings.READER_REGION_CACHE_SIZE)
+def _fetch_region(
+    slide_path: str,
+    x: int,
+    y: int,
+    width: int,
+    height: int,
+    level: int | None
+) -> bytes:
+    """Fetch an encoded region of the slide. The recently fetched regions
+    are cached in the worker process.
+
+    Args:
+        slide_path (str): The path to the slide.
+        x (int): The x coordinate of the region.
+        y (int): The y coordinate of the region.
+        width (int): The width of the region.
+        height (int): The height of the region.
+        level (int | None): The level of the slide. When None, the region
+        is cropped from the full resolution slide.
+
+    Returns:
+        bytes: The encoded region.
+    """
+    if level is None:
+        return _fetch_crop(slide_path, x, y, width, height)
+
+    return _fetch_tile(level, slide_path, x, y, width, height)
+
+
 @shared_task(
     ignore_result=True,
     acks_late=True,
@@ -56,17 +167,9 @@ def download_tile(
     Returns:
         np.ndarray: The tile as a numpy array.
     """
-    response = httpx.get(
-        join_url(settings.READER_URL, slide_path),
-        params={
-            'z': level,
-            'x': x,
-            'y': y,
-            'w': tile_size,
-            'h': tile_size
-        }
-    )
-    return np.array(Image.open(BytesIO(response.content)))
+    content = _fetch_tile(level, slide_path, x, y, tile_size, tile_size)
+
+    return np.array(Image.open(BytesIO(content)))
 
 
 @shared_task(
@@ -96,18 +199,48 @@ def crop_tile(
     Returns:
         np.ndarray: The cropped tile as a numpy array.
     """
-    response = httpx.get(
-        join_url(settings.READER_URL, f"/crop/{slide_path}"),
-        params={
-            'x': x,
-            'y': y,
-            'w': tile_size,
-            'h': tile_size
-        }
-    )
-    response = response.json()
+    content = _fetch_crop(slide_path, x, y, tile_size, tile_size)
+
+    return np.array(Image.open(BytesIO(content)))
+
+
+@shared_task(
+    ignore_result=True,
+    # the failure is propagated to the pre-stored result of the chained task
+    store_errors_even_if_ignored=True,
+    acks_late=True,
+    autoretry_for=(httpx.HTTPError,),
+    max_retries=5,
+    retry_backoff=True,
+    retry_backoff_max=500,
+    retry_jitter=True,
+    queue=READER_QUEUE
+)
+def download_region(
+    slide_path: str,
+    x: int,
+    y: int,
+    width: int,
+    height: int,
+    level: int | None = None
+) -> np.ndarray:
+    """Download a region of the slide from the reader service.
+
+    Args:
+        slide_path (str): The path to the slide.
+        x (int): The x coordinate of the region.
+        y (int): The y coordinate of the region.
+        width (int): The width of the region.
+        height (int): The height of the region.
+        level (int | None): The level of the slide. When None, the region
+        is cropped from the full resolution slide.
+
+    Returns:
+        np.ndarray: The region as an RGB numpy array.
+    """
+    content = _fetch_region(slide_path, x, y, width, height, level)
 
-    return np.array(Image.open(BytesIO(base64.b64decode(response['base64Image']))))
+    return np.array(Image.open(BytesIO(content)).convert('RGB'))
 
 
 @shared_task(
@@ -200,7 +333,9 @@ def clean_data(
     image: np.ndarray
 ) -> list[MitosisPrediction]:
     """Clean the data by removing false positives.
-    It compares the predicted mitoses and hard-negative mitoses to the reference image.
+    It compares the predicted mitoses and hard-negative mitoses to the reference image,
+    a prediction is kept if at least 2% of the pixels of its bbox are close
+    to the mean color of the mitoses.
 
     Args:
         mitoses (list[MitosisPrediction]): The predicted mitoses and
@@ -211,30 +346,41 @@ def clean_data(
         list[MitosisPrediction]: The cleaned predicted mitoses and
         hard-negative mitoses.
     """
-    cleared_mitoses: list[MitosisPrediction] = []
-
-    for mitos in mitoses:
-        bbox = mitos['bbox']
-        x1, y1, x2, y2 = bbox
+    if not mitoses:
+        return []
+
+    # the pixels of the tile close to the mean color of the mitoses
+    image_lab = cv2.cvtColor(image.astype(np.float32) / 255.0, cv2.COLOR_RGB2LAB)
+    difference = image_lab - MITOSIS_MEAN_LAB
+    # the channels of the squared difference are summed by cv2.transform
+    difference_image = cv2.sqrt(
+        cv2.transform(difference * difference, np.ones((1, 3), dtype=np.float32))
+    )
+    mitosis_colored = (difference_image <= 20).astype(np.uint8)
 
-        patch = image[y1:y2, x1:x2]
-        patch = cv2.cvtColor(patch.astype(np.float32) / 255.0, cv2.COLOR_RGB2LAB)
+    # the summed-area table counts the close pixels of any bbox in O(1)
+    integral = cv2.integral(mitosis_colored)
 
-        difference_image = np.sqrt(
-            np.sum(np.power((patch - MITOSIS_MEAN_LAB), 2), axis=2)
-        )
+    height, width = mitosis_colored.shape
+    bboxes = np.array([mitos['bbox'] for mitos in mitoses], dtype=np.int64)
+    x1, x2 = np.clip(bboxes[:, [0, 2]], 0, width).T
+    y1, y2 = np.clip(bboxes[:, [1, 3]], 0, height).T
 
-        difference_threshold = cv2.threshold(
-            src=difference_image,
-            thresh=20,
-            maxval=255,
-            type=cv2.THRESH_BINARY_INV
-        )[1]
+    counts = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
 
-        if np.sum(difference_threshold == 255) / difference_threshold.size >= 0.02:
-            cleared_mitoses.append(mitos)
+    fractions = np.divide(
+        counts,
+        areas,
+        out=np.zeros(len(mitoses), dtype=np.float64),
+        where=areas > 0
+    )
 
-    return cleared_mitoses
+    return [
+        mitos
+        for mitos, fraction in zip(mitoses, fractions)
+        if fraction >= 0.02
+    ]
 
 
 @celery_app.task(ignore_result=True, queue=AL_QUEUE)
@@ -311,7 +457,7 @@ def store_predictions(
     Returns:
         None
     """
-    with get_session() as session:
+    with span('postgis.store_predictions'), get_session() as session:
         slide = session.query(
             db_models.WholeSlideImage
         ).filter_by(
@@ -385,21 +531,57 @@ def add_offset(
     return copied_mitosis
 
 
+@lru_cache(maxsize=settings.STAIN_CACHE_SIZE)
+def _get_slide_stain_parameters(
+    slide_path: str,
+    tile_size: int
+) -> StainParameters | None:
+    """Estimate the stains of the slide on the thumbnail the tissue mask
+    is created from. The stains of the recent slides are cached in the worker process.
+
+    Args:
+        slide_path (str): The path to the slide.
+        tile_size (int): The size of the tile.
+
+    Returns:
+        StainParameters | None: The stain parameters, None if the thumbnail
+        is the background.
+    """
+    mask_magnification, _, _ = get_slide_best_magnification(slide_path, tile_size)
+
+    thumbnail = download_tile(
+        level=mask_magnification,
+        slide_path=slide_path,
+        x=0,
+        y=0,
+        tile_size=tile_size
+    )
+
+    try:
+        with span('stain.estimate_slide'):
+            return estimate_stain_parameters(thumbnail[..., :3])
+    except ValueError:
+        return None
+
+
 @celery_app.task(bind=True, ignore_result=True, queue=AL_QUEUE)
 def predict_mitoses_and_clean_result(
     self: Task,
-    image: np.ndarray
+    image: np.ndarray,
+    stain_parameters: StainParameters | None = None
 ) -> list[MitosisPrediction]:
     """Predict mitoses and clean the false positive results.
 
     Args:
         image (np.ndarray): The image.
+        stain_parameters (StainParameters | None): The stain parameters of the slide,
+        the stains are estimated on the image if not given.
 
     Returns:
         list[MitosisPrediction]: The cleaned predictions as Signature.
     """
     sig = _predict_mc_task.s(
-        image=image, offset=(0, 0)
+        image=image, offset=(0, 0), stain_parameters=stain_parameters
     ).set(queue=AL_QUEUE) | clean_data.s(
         image=image
     )
@@ -425,12 +607,19 @@ def process_tile(
     Returns:
         Signature: The signature of the task.
     """
+    stain_parameters = None
+
+    if settings.STAIN_NORMALIZATION_SCOPE == 'slide':
+        stain_parameters = _get_slide_stain_parameters(slide_path, tile_size)
+
     sig = crop_tile.s(
         slide_path=slide_path,
         x=coords[0],
         y=coords[1],
         tile_size=tile_size
-    ) | predict_mitoses_and_clean_result.s() | add_offset.s(
+    ) | predict_mitoses_and_clean_result.s(
+        stain_parameters=stain_parameters
+    ) | add_offset.s(
         offset=(coords[0], coords[1])
     ) | store_predictions.s(
         slide_path=slide_path
@@ -439,6 +628,63 @@ def process_tile(
     return self.replace(sig)
 
 
+@celery_app.task(
+    ignore_result=True,
+    acks_late=True,
+    autoretry_for=(httpx.HTTPError,),
+    max_retries=5,
+    retry_backoff=True,
+    retry_backoff_max=500,
+    retry_jitter=True,
+    queue=AL_QUEUE
+)
+def execute_tile(
+    coords: np.ndarray,
+    slide_path: str,
+    tile_size: int
+) -> None:
+    """Process a tile in the current worker process. It runs the same steps
+    as process_tile (crops the tile, predicts mitoses, cleans the results,
+    adds an offset, and stores the predictions in the database) without
+    sending the tile between the tasks. The latency of each step is measured
+    as the tile.* stage.
+
+    Args:
+        coords (np.ndarray): The coordinates of the tile.
+        slide_path (str): The path to the slide.
+        tile_size (int): The size of the tile.
+    """
+    x, y = int(coords[0]), int(coords[1])
+
+    with span('tile.read'):
+        content = _fetch_crop(slide_path, x, y, tile_size, tile_size)
+        image = np.array(Image.open(BytesIO(content)))
+
+    with span('tile.stain'):
+        stain_parameters = None
+
+        if settings.STAIN_NORMALIZATION_SCOPE == 'slide':
+            stain_parameters = _get_slide_stain_parameters(slide_path, tile_size)
+
+        if stain_parameters is None:
+            stain_parameters = get_tile_stain_parameters(image)
+
+    # the tasks of the stages are run as functions in this process
+    with span('tile.detect'):
+        candidates = predict_mc_first_stage_task(image, stain_parameters)
+
+    with span('tile.classify'):
+        mitoses = predict_mc_second_stage_task(candidates, image, stain_parameters)
+
+    with span('tile.clean'):
+        mitoses = clean_data(mitoses, image)
+
+    mitoses = apply_offset_to_bboxes(mitoses, (x, y))
+
+    with span('tile.store'):
+        store_predictions(mitoses, slide_path)
+
+
 @shared_task(
     ignore_result=True,
     acks_late=True,
@@ -539,6 +785,70 @@ def get_coords(
     return self.replace(sig)
 
 
+def _dispatch_tiles() -> None:
+    """Start the waiting tiles of the slide scans up to the limits. Each tile
+    (in one task if AL_FUSED_TILES is set) completes with complete_tile,
+    which starts the next tiles."""
+    tile_task = execute_tile if settings.AL_FUSED_TILES else process_tile
+
+    for tile in acquire_tiles(Redis(connection_pool=connection_pool)):
+        # the callback is run whether the tile succeeded or failed
+        callback = complete_tile.si(slide_path=tile.slide_path, x=tile.x, y=tile.y)
+
+        sig = tile_task.s(
+            coords=np.array([tile.x, tile.y]),
+            slide_path=tile.slide_path,
+            tile_size=tile.tile_size
+        )
+        sig.link(callback)
+        sig.link_error(callback)
+        sig.apply_async()
+
+
+@celery_app.task(ignore_result=True, queue=AL_QUEUE)
+def schedule_tiles(
+    coords: list[tuple[int, int]],
+    slide_path: str,
+    tile_size: int
+) -> None:
+    """Schedule the tiles of the slide. The tiles wait in Redis and only a bounded
+    number of them is sent to the workers at once (AL_SCAN_TILES_PER_SLIDE for
+    the slide and AL_SCAN_MAX_TILES for all the slides).
+
+    Args:
+        coords (list[tuple[int, int]]): The coordinates of the tiles.
+        slide_path (str): The path to the slide.
+        tile_size (int): The size of the tile.
+    """
+    enqueue_tiles(Redis(connection_pool=connection_pool), slide_path, tile_size, coords)
+
+    _dispatch_tiles()
+
+
+@celery_app.task(ignore_result=True, queue=AL_QUEUE)
+def dispatch_scan_tiles() -> None:
+    """Start the waiting tiles of the slide scans, run periodically by celery beat
+    every AL_SCAN_DISPATCH_INTERVAL seconds. The tiles which did not complete
+    with complete_tile (e.g. their worker was lost) are requeued once they
+    time out, at most AL_SCAN_TILE_RETRIES times.
+    """
+    _dispatch_tiles()
+
+
+@celery_app.task(ignore_result=True, queue=AL_QUEUE)
+def complete_tile(slide_path: str, x: int, y: int) -> None:
+    """Release the completed (or failed) tile and start the next tiles.
+
+    Args:
+        slide_path (str): The path to the slide.
+        x (int): The x coordinate of the tile.
+        y (int): The y coordinate of the tile.
+    """
+    release_tile(Redis(connection_pool=connection_pool), slide_path, x, y)
+
+    _dispatch_tiles()
+
+
 @celery_app.task(ignore_result=True, track_started=True, queue=AL_QUEUE)
 def process_slide(
     path: str,
@@ -546,7 +856,7 @@ def process_slide(
 ) -> AsyncResult:
     """Process a slide. It gets the best magnification of the slide,
     the mask metadata, and the slide metadata.
-    Then, it gets the coordinates of the tiles and processes them.
+    Then, it gets the coordinates of the tiles and schedules them.
 
     Args:
         path (str): The path to the slide.
@@ -563,12 +873,10 @@ def process_slide(
             path=path,
             tile_size=tile_size
         )
-    ).set(queue=AL_QUEUE) | dmap.s(
-        process_tile.s(
-            slide_path=path,
-            tile_size=tile_size
-        )
-    ).set(queue=AL_QUEUE)
+    ).set(queue=AL_QUEUE) | schedule_tiles.s(
+        slide_path=path,
+        tile_size=tile_size
+    )
 
     return chain()
 
@@ -1,12 +1,22 @@
 from collections.abc import Generator
 from contextlib import contextmanager
+from typing import Any
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session, sessionmaker
 
+from celery.signals import worker_process_init
 from src.core.config import settings
+from src.core.database import get_engine_options
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_size=5, max_overflow=0)
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI,
+    **get_engine_options(
+        'psycopg2',
+        pool_size=settings.CELERY_POSTGRES_POOL_SIZE,
+        max_overflow=settings.CELERY_POSTGRES_MAX_OVERFLOW
+    )
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -27,3 +37,12 @@ def get_session() -> Generator[Session, None, None]:
         yield session
     finally:
         session.close()
+
+
+@worker_process_init.connect
+def dispose_engine_after_fork(**kwargs: Any) -> None:
+    """Drop the connections inherited from the parent process after the fork,
+    so the prefork child processes do not share the sockets of the parent pool.
+    The parent connections are left open for the parent process.
+    """
+    engine.dispose(close=False)
@@ -0,0 +1,109 @@
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Any, Generic, NamedTuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class _Request(NamedTuple):
+    """The request waiting for its batch."""
+    item: Any
+    future: Future[Any]
+
+
+class MicroBatcher(Generic[T, R]):
+    """Collects the concurrent requests into batches and runs each batch
+    in one call of the function on a background thread.
+
+    The batch is run when it reaches the maximum size or when the window
+    started by its first request elapses, so a single request waits
+    at most the window.
+    """
+
+    def __init__(
+        self,
+        function: Callable[[list[T]], list[R]],
+        max_batch_size: int,
+        window: float,
+        name: str
+    ) -> None:
+        """Initialize the batcher.
+
+        Args:
+            function (Callable[[list[T]], list[R]]): The function returning
+            a result for each item of the batch.
+            max_batch_size (int): The maximum number of items in a batch.
+            window (float): The time in seconds to wait for more items.
+            name (str): The name of the batcher thread.
+        """
+        self.function = function
+        self.max_batch_size = max_batch_size
+        self.window = window
+
+        self._requests: queue.SimpleQueue[_Request] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: T) -> Future[R]:
+        """Submits the item to the next batch.
+
+        Args:
+            item (T): The item.
+
+        Returns:
+            Future[R]: The result of the item.
+        """
+        future: Future[R] = Future()
+        self._requests.put(_Request(item, future))
+
+        return future
+
+    def _collect_batch(self) -> list[_Request]:
+        """Waits for the first request and collects the batch.
+
+        Returns:
+            list[_Request]: The requests of the batch.
+        """
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.window
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+
+            try:
+                batch.append(
+                    self._requests.get(timeout=timeout) if timeout > 0
+                    else self._requests.get_nowait()
+                )
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self) -> None:
+        """Runs the batches."""
+        while True:
+            batch = self._collect_batch()
+
+            try:
+                results = self.function([request.item for request in batch])
+
+                if len(results) != len(batch):
+                    raise ValueError(f'The function returned {len(results)} results '
+                                     f'for the batch of {len(batch)} items')
+            except Exception as e:
+                logger.exception(f'Batch of {self._thread.name} failed')
+
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
@@ -0,0 +1,132 @@
+import threading
+from multiprocessing.connection import Client, Connection
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from src.core.config import settings
+from src.core.serialization import dumps, loads
+
+from .ops import (
+    InferenceError,
+    execute_inference_op,
+    get_forward_op_name,
+    get_inference_op,
+    submit_inference_op,
+)
+
+if TYPE_CHECKING:
+    import torch
+
+
+class InferenceClient:
+    """The client of the inference server."""
+
+    def __init__(self) -> None:
+        authkey = settings.INFERENCE_SERVER_AUTHKEY
+
+        self._connection: Connection = Client(
+            str(settings.INFERENCE_SERVER_ADDRESS),
+            family='AF_UNIX',
+            authkey=authkey.get_secret_value().encode() if authkey else None
+        )
+
+    def call(self, name: str, *args: Any) -> Any:
+        """Runs the inference operation in the inference server.
+
+        Args:
+            name (str): The name of the operation.
+
+        Raises:
+            InferenceError: If the operation failed.
+
+        Returns:
+            Any: The result of the operation.
+        """
+        self._connection.send_bytes(dumps([name, list(args)]))
+        succeeded, result = loads(self._connection.recv_bytes())
+
+        if not succeeded:
+            raise InferenceError(result)
+
+        return result
+
+    def close(self) -> None:
+        """Closes the connection."""
+        self._connection.close()
+
+
+# The connection of each thread (e.g. of the threads pool) to the inference server
+_local = threading.local()
+
+
+def get_inference_client() -> InferenceClient:
+    """Gets the inference server client of the current thread.
+
+    Returns:
+        InferenceClient: The client.
+    """
+    client: InferenceClient | None = getattr(_local, 'client', None)
+
+    if client is None:
+        client = _local.client = InferenceClient()
+
+    return client
+
+
+def run_inference_op(name: str, *args: Any) -> Any:
+    """Runs the inference operation in the inference server if enabled,
+    otherwise on the model loaded in the current process. The local requests
+    are batched only if the batching window is set, as the prefork processes
+    run one task at a time (the threads pool runs them concurrently).
+
+    Args:
+        name (str): The name of the operation.
+
+    Raises:
+        InferenceError: If the operation failed.
+
+    Returns:
+        Any: The result of the operation.
+    """
+    if not settings.INFERENCE_SERVER_ENABLED:
+        if settings.INFERENCE_BATCH_WINDOW_MS > 0 and get_inference_op(name).batched:
+            return submit_inference_op(name, args).result()
+
+        return execute_inference_op(name, [args])[0]
+
+    client = get_inference_client()
+
+    try:
+        return client.call(name, *args)
+    except (OSError, EOFError):
+        # the server was restarted, the next call reconnects
+        client.close()
+        _local.client = None
+        raise
+
+
+class RemoteModel:
+    """The torch model running in the inference server. It is a drop-in
+    replacement of the model in the prediction functions calling its forward pass.
+    """
+
+    def __init__(self, model_name: str) -> None:
+        self.model_name = model_name
+
+    def __call__(self, inputs: 'torch.Tensor') -> 'torch.Tensor':
+        import torch
+
+        outputs = run_inference_op(
+            get_forward_op_name(self.model_name),
+            inputs.detach().cpu().numpy()
+        )
+
+        # the deserialized arrays are read-only
+        return torch.from_numpy(np.array(outputs)).to(inputs.device)
+
+    def eval(self) -> 'RemoteModel':
+        return self
+
+    def to(self, *args: Any, **kwargs: Any) -> 'RemoteModel':
+        return self
@@ -0,0 +1,205 @@
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from src.celery.shared.definitions import get_device, get_model_task
+from src.core.config import settings
+from src.core.metrics import observe_batch_size
+
+from .batching import MicroBatcher
+
+if TYPE_CHECKING:
+    import torch
+
+
+class InferenceError(RuntimeError):
+    """The inference operation failed."""
+
+
+@dataclass(frozen=True)
+class InferenceOp:
+    """The operation run on a model.
+
+    The batched operations get the arguments of several requests at once
+    and return a result for each of them.
+    """
+    name: str
+    model_name: str
+    function: Callable[..., Any]
+    batched: bool = False
+
+
+# The operations by their name
+_inference_ops: dict[str, InferenceOp] = {}
+
+# The batchers of the operations in the current process
+_batchers: dict[str, MicroBatcher[tuple[Any, ...], Any]] = {}
+_batchers_lock = threading.Lock()
+
+
+def _reset_batchers() -> None:
+    """Drops the batchers inherited from the parent process,
+    their threads do not exist after the fork.
+    """
+    global _batchers_lock
+
+    _batchers.clear()
+    _batchers_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_batchers)
+
+
+def inference_op(
+    name: str,
+    model_name: str,
+    batched: bool = False
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Registers the function as an inference operation. The function gets
+    the loaded model and its device followed by the request arguments
+    (or the list of the request arguments if batched).
+
+    Args:
+        name (str): The name of the operation.
+        model_name (str): The name of the model the operation runs on.
+        batched (bool): Whether the operation processes several requests at once.
+
+    Returns:
+        Callable[[Callable[..., Any]], Callable[..., Any]]: The decorator.
+    """
+    def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+        _inference_ops[name] = InferenceOp(name, model_name, function, batched)
+        return function
+
+    return decorator
+
+
+def get_inference_op(name: str) -> InferenceOp:
+    """Gets the inference operation.
+
+    Args:
+        name (str): The name of the operation.
+
+    Raises:
+        InferenceError: If the operation is not registered.
+
+    Returns:
+        InferenceOp: The inference operation.
+    """
+    if name not in _inference_ops:
+        raise InferenceError(f'Unknown inference operation: {name}')
+
+    return _inference_ops[name]
+
+
+def get_forward_op_name(model_name: str) -> str:
+    """Gets the name of the forward pass operation of the model.
+
+    Args:
+        model_name (str): The name of the model.
+
+    Returns:
+        str: The name of the operation.
+    """
+    return f'{model_name}.forward'
+
+
+def register_forward_op(model_name: str) -> None:
+    """Registers the batched forward pass of the torch model. The inputs
+    of the same shape are concatenated along the batch dimension.
+
+    Args:
+        model_name (str): The name of the model.
+    """
+    @inference_op(get_forward_op_name(model_name), model_name, batched=True)
+    def forward(
+        model: 'torch.nn.Module',
+        device: 'torch.device',
+        batch: list[tuple[np.ndarray]]
+    ) -> list[np.ndarray]:
+        import torch
+
+        model.eval()
+
+        results: list[np.ndarray] = [np.empty(0)] * len(batch)
+        groups: dict[tuple[Any, ...], list[int]] = {}
+
+        for index, (inputs,) in enumerate(batch):
+            groups.setdefault((inputs.dtype.str, inputs.shape[1:]), []).append(index)
+
+        for indices in groups.values():
+            group_inputs = [batch[index][0] for index in indices]
+
+            with torch.no_grad():
+                outputs = model(
+                    torch.from_numpy(np.concatenate(group_inputs)).to(device)
+                ).cpu().numpy()
+
+            sections = np.cumsum([len(x) for x in group_inputs])[:-1]
+
+            for index, output in zip(indices, np.split(outputs, sections)):
+                results[index] = output
+
+        return results
+
+
+def execute_inference_op(name: str, batch: list[tuple[Any, ...]]) -> list[Any]:
+    """Runs the inference operation on the model loaded in the current process.
+
+    Args:
+        name (str): The name of the operation.
+        batch (list[tuple[Any, ...]]): The arguments of the requests.
+
+    Raises:
+        InferenceError: If the operation is not registered.
+
+    Returns:
+        list[Any]: The result of each request.
+    """
+    op = get_inference_op(name)
+    model = get_model_task(op.model_name).get_loaded_model().model
+    device = get_device()
+
+    observe_batch_size(name, len(batch))
+
+    if op.batched:
+        return op.function(model, device, batch)
+
+    return [op.function(model, device, *args) for args in batch]
+
+
+def submit_inference_op(name: str, args: tuple[Any, ...]) -> Future[Any]:
+    """Submits the request to the batcher of the operation. The concurrent
+    requests of a batched operation are run in one batch, the requests
+    of the other operations one by one.
+
+    Args:
+        name (str): The name of the operation.
+        args (tuple[Any, ...]): The arguments of the operation.
+
+    Raises:
+        InferenceError: If the operation is not registered.
+
+    Returns:
+        Future[Any]: The result of the operation.
+    """
+    op = get_inference_op(name)
+
+    with _batchers_lock:
+        if name not in _batchers:
+            _batchers[name] = MicroBatcher(
+                partial(execute_inference_op, name),
+                max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE if op.batched else 1,
+                window=settings.INFERENCE_BATCH_WINDOW_MS / 1000 if op.batched else 0,
+                name=f'inference-{name}'
+            )
+
+        batcher = _batchers[name]
+
+    return batcher.submit(args)
@@ -0,0 +1,91 @@
+import importlib
+import logging
+import os
+import threading
+from multiprocessing.connection import Connection, Listener
+
+from src.celery.registry import TASK_PACKAGES
+from src.celery.shared.cpu import configure_process
+from src.celery.shared.definitions import preload_models
+from src.core.config import settings
+from src.core.serialization import dumps, loads
+
+from .ops import submit_inference_op
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceServer:
+    """The server owning the models of the node. The requests of each operation
+    are run by its batcher, the concurrent requests of the batched operations
+    (e.g. the forward pass of NuClick) are run in one batch.
+    """
+
+    def _handle_connection(self, connection: Connection) -> None:
+        """Processes the requests of the client until it disconnects.
+
+        Args:
+            connection (Connection): The client connection.
+        """
+        with connection:
+            while True:
+                try:
+                    name, args = loads(connection.recv_bytes())
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    response = [
+                        True,
+                        submit_inference_op(name, tuple(args)).result()
+                    ]
+                except Exception as e:
+                    response = [False, f'{type(e).__name__}: {e}']
+
+                connection.send_bytes(dumps(response))
+
+    def serve_forever(self) -> None:
+        """Accepts the client connections."""
+        address = settings.INFERENCE_SERVER_ADDRESS
+        authkey = settings.INFERENCE_SERVER_AUTHKEY
+
+        # the socket of the previous server
+        address.unlink(missing_ok=True)
+
+        with Listener(
+            str(address),
+            family='AF_UNIX',
+            authkey=authkey.get_secret_value().encode() if authkey else None
+        ) as listener:
+            os.chmod(address, 0o600)
+            logger.info(f'Inference server is listening on {address}')
+
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception:
+                    logger.exception('Cannot accept the connection')
+                    continue
+
+                threading.Thread(
+                    target=self._handle_connection,
+                    args=(connection,),
+                    daemon=True
+                ).start()
+
+
+def main() -> None:
+    """Run the inference server."""
+    # registers the model task bases and the inference operations
+    for package in TASK_PACKAGES:
+        importlib.import_module(f'{package}.definitions')
+
+    configure_process()
+    preload_models(settings.CELERY_PRELOAD_MODELS, settings.CELERY_PRELOAD_WARMUP)
+
+    InferenceServer().serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
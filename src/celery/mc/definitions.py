@@ -1,73 +1,300 @@
-import hashlib
-from typing import Any
+import shutil
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
-import torch
-from efficientnet_pytorch import EfficientNet
-from sahi import AutoDetectionModel
+import numpy as np
 
-from celery import Task
-from src.core.config import settings
+from src.celery.inference.ops import inference_op, register_forward_op
+from src.celery.shared.backends import (
+    ONNX_OPSET_VERSION,
+    ExportGraph,
+    ExportManifest,
+    get_forward_graph,
+)
+from src.celery.shared.definitions import ModelTask
+from src.celery.shared.quantization import sample_nuclei_points
+from src.core.config import InferenceBackend, settings
+from src.core.metrics import timed
 
+if TYPE_CHECKING:
+    import torch
+    from efficientnet_pytorch import EfficientNet
+    from sahi import AutoDetectionModel
 
-class MCFirstStageTask(Task):
+DETECT_MITOTIC_CANDIDATES_OP = 'mc_first_stage.detect'
+
+# The YOLO architecture of the first stage model with random weights
+FIRST_STAGE_ARCHITECTURE = 'yolov8s.yaml'
+
+
+class MCFirstStageTask(ModelTask):
     """The first stage of the mitotic count prediction pipeline.
     This stage is reposible for detecting candidates in the input image."""
     abstract = True
 
-    def __init__(self) -> None:
-        super().__init__()
+    model_name = 'mc_first_stage'
+    export_backends = ('torchscript', 'onnx')
+
+    @classmethod
+    def get_model_path(cls) -> Path:
+        return settings.MC_FIRST_STAGE_MODEL_PATH
+
+    @classmethod
+    def load_model(cls, device: 'torch.device') -> 'AutoDetectionModel':
+        from sahi import AutoDetectionModel
+
+        return AutoDetectionModel.from_pretrained(
+            model_type='yolov8',
+            model_path=settings.MC_FIRST_STAGE_MODEL_PATH,
+            confidence_threshold=0.25,
+            device=device,
+        )
 
-        self.model: AutoDetectionModel = None
-        self.model_hash: str | None = None
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    @classmethod
+    def create_model(cls, device: 'torch.device') -> 'AutoDetectionModel':
+        from sahi import AutoDetectionModel
+        from ultralytics import YOLO
 
-    def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        if not self.model:
-            self.model = AutoDetectionModel.from_pretrained(
-                model_type='yolov8',
-                model_path=settings.MC_FIRST_STAGE_MODEL_PATH,
-                confidence_threshold=0.25,
-                device=self.device,
+        # the architecture is built from the configuration bundled with ultralytics
+        return AutoDetectionModel.from_pretrained(
+            model_type='yolov8',
+            model=YOLO(FIRST_STAGE_ARCHITECTURE),
+            confidence_threshold=0.25,
+            device=device,
+        )
+
+    @classmethod
+    def get_export_graphs(
+        cls,
+        model: 'AutoDetectionModel',
+        device: 'torch.device'
+    ) -> dict[str, ExportGraph]:
+        import torch
+
+        image_size = cls.get_export_metadata(model)['image_size']
+
+        # the detection model of YOLO, the exported graph returns only
+        # the predictions (without the intermediate feature maps)
+        return {
+            'model': get_forward_graph(
+                model.model.model,
+                torch.rand((1, 3, image_size, image_size), device=device)
             )
+        }
+
+    @classmethod
+    def get_export_metadata(cls, model: 'AutoDetectionModel') -> dict[str, Any]:
+        # the exported YOLO has neither the training input size nor the class names
+        return {
+            'image_size': model.image_size or model.model.overrides.get('imgsz', 640),
+            'category_mapping': {
+                str(index): name for index, name in model.model.names.items()
+            },
+        }
+
+    @classmethod
+    def export_graph(
+        cls,
+        graph: ExportGraph,
+        backend: InferenceBackend,
+        path: Path
+    ) -> None:
+        from ultralytics import YOLO
+
+        # the exporter of ultralytics switches the detection head to the export mode
+        # and stores the metadata (e.g. the stride) read by its runtime
+        exported_path = YOLO(settings.MC_FIRST_STAGE_MODEL_PATH).export(
+            format=backend,
+            imgsz=graph.inputs[0].shape[-1],
+            dynamic=backend == 'onnx',
+            opset=ONNX_OPSET_VERSION,
+            device='cpu'
+        )
 
-            with open(settings.MC_FIRST_STAGE_MODEL_PATH, 'rb') as model_file:
-                self.model_hash = hashlib.md5(model_file.read()).hexdigest()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(exported_path, path)
 
-        return self.run(*args, **kwargs)
+    @classmethod
+    def load_exported_model(
+        cls,
+        manifest: ExportManifest,
+        device: 'torch.device'
+    ) -> 'AutoDetectionModel':
+        from sahi import AutoDetectionModel
 
+        # ultralytics runs the exported model in its own ONNX Runtime session
+        return AutoDetectionModel.from_pretrained(
+            model_type='yolov8',
+            model_path=str(settings.MODEL_EXPORT_DIR / manifest['graphs']['model']),
+            confidence_threshold=0.25,
+            device=device,
+            image_size=manifest['metadata']['image_size'],
+            category_mapping=manifest['metadata']['category_mapping'],
+        )
 
-class MCSecondStageTask(Task):
+    @classmethod
+    def share_memory(cls, model: 'AutoDetectionModel') -> None:
+        # the YOLO model wrapped by sahi
+        model.model.share_memory()
+
+    @classmethod
+    def warmup(cls, model: 'AutoDetectionModel', device: 'torch.device') -> None:
+        model.perform_inference(np.zeros((512, 512, 3), dtype=np.uint8))
+
+
+class MCSecondStageTask(ModelTask):
     """The second stage of the mitotic count prediction pipeline.
     This stage is responsible for classifying the candidates detected
     in the first stage."""
     abstract = True
 
-    def __init__(self) -> None:
-        super().__init__()
+    model_name = 'mc_second_stage'
+    export_backends = ('torchscript', 'onnx')
+    accuracy_metric = 'label_agreement'
 
-        self.model: EfficientNet = None
-        self.model_hash: str | None = None
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    @classmethod
+    def get_model_path(cls) -> Path:
+        return settings.MC_SECOND_STAGE_MODEL_PATH
 
-    def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        if not self.model:
-            checkpoint = torch.load(
-                settings.MC_SECOND_STAGE_MODEL_PATH,
-                map_location='cpu'
-            )
+    @classmethod
+    def create_model(cls, device: 'torch.device') -> 'EfficientNet':
+        from efficientnet_pytorch import EfficientNet
 
-            model = EfficientNet.from_name(
-                'efficientnet-b4',
-                in_channels=3,
-                num_classes=2
-            )
+        model = EfficientNet.from_name(
+            'efficientnet-b4',
+            in_channels=3,
+            num_classes=2
+        )
+        model.to(device)
+
+        return model
+
+    @classmethod
+    def load_model(cls, device: 'torch.device') -> 'EfficientNet':
+        import torch
+
+        checkpoint = torch.load(
+            settings.MC_SECOND_STAGE_MODEL_PATH,
+            map_location='cpu'
+        )
+
+        model = cls.create_model(device)
+        model.load_state_dict(checkpoint['model_state_dict'])
+
+        return model
+
+    @classmethod
+    def get_export_graphs(
+        cls,
+        model: 'EfficientNet',
+        device: 'torch.device'
+    ) -> dict[str, ExportGraph]:
+        import torch
+
+        # the memory efficient swish is a custom autograd function,
+        # which cannot be traced
+        model.set_swish(memory_efficient=False)
+
+        example_input = torch.rand((1, 3, 64, 64), device=device)
+
+        return {'model': get_forward_graph(model, example_input)}
+
+    @classmethod
+    def get_calibration_inputs(
+        cls,
+        model: 'EfficientNet',
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> dict[str, list[tuple[np.ndarray, ...]]]:
+        from src.models.mc.predict import prepare_second_stage_patches
+
+        patches = prepare_second_stage_patches(image, _sample_bboxes(image))
+
+        return {'model': [(patch[None].numpy(),) for _, patch in patches]}
+
+    @classmethod
+    def predict_for_evaluation(
+        cls,
+        model: 'EfficientNet',
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> np.ndarray:
+        import torch
+
+        from src.models.mc.predict import prepare_second_stage_patches
+
+        patches = [
+            patch
+            for _, patch in prepare_second_stage_patches(image, _sample_bboxes(image))
+        ]
+
+        if not patches:
+            return np.empty(0, dtype=np.int64)
+
+        with torch.no_grad():
+            outputs = model(torch.stack(patches).to(device))
+
+        # the label of each candidate
+        return outputs.argmax(dim=1).cpu().numpy()
+
+    @classmethod
+    def warmup(cls, model: 'EfficientNet', device: 'torch.device') -> None:
+        import torch
+
+        model.eval()
+
+        with torch.no_grad():
+            model(torch.zeros((1, 3, 64, 64), device=device))
+
+
+def _sample_bboxes(image: np.ndarray) -> list[np.ndarray]:
+    """Samples the candidate bounding boxes on the nuclei of the tile,
+    the second stage is evaluated without the detections of the first stage.
+
+    Args:
+        image (np.ndarray): The tile.
+
+    Returns:
+        list[np.ndarray]: The bounding boxes.
+    """
+    return [
+        np.array([x - 16, y - 16, x + 16, y + 16])
+        for x, y in sample_nuclei_points(image, count=64)
+    ]
+
+
+register_forward_op(MCSecondStageTask.model_name)
+
+
+@inference_op(DETECT_MITOTIC_CANDIDATES_OP, MCFirstStageTask.model_name)
+@timed('mc.detect')
+def detect_mitotic_candidates(
+    model: 'AutoDetectionModel',
+    device: 'torch.device',
+    image: np.ndarray
+) -> list[np.ndarray]:
+    """Detects the mitotic candidates in the normalized image.
 
-            model.load_state_dict(checkpoint['model_state_dict'])
-            model.to(self.device)
+    Args:
+        model (AutoDetectionModel): The first stage model.
+        device (torch.device): The device the model is loaded on.
+        image (np.ndarray): The stain normalized image.
 
-            self.model = model
+    Returns:
+        list[np.ndarray]: The bounding boxes of the detected candidates.
+    """
+    from sahi.predict import get_sliced_prediction
 
-            with open(settings.MC_SECOND_STAGE_MODEL_PATH, 'rb') as model_file:
-                self.model_hash = hashlib.md5(model_file.read()).hexdigest()
+    predicted_objects = get_sliced_prediction(
+        image=image,
+        detection_model=model,
+        slice_width=512,
+        slice_height=512,
+        overlap_width_ratio=0.25,
+        overlap_height_ratio=0.25,
+    )
 
-        return self.run(*args, **kwargs)
+    return [
+        np.array(object.bbox.to_xyxy(), dtype=np.int32)
+        for object in predicted_objects.object_prediction_list
+    ]
@@ -1,13 +1,23 @@
 import numpy as np
-from monai.apps.pathology.transforms.stain.array import NormalizeHEStains
-from sahi.predict import get_sliced_prediction
 
 from celery import Task
+from src.celery.inference.client import run_inference_op
+from src.celery.shared.stain import get_tile_stain_parameters
 from src.core.celery import celery_app
-from src.models import predict_mc_second_stage
+from src.core.metrics import span
 from src.models.mc.custom_types import MitosisPrediction
+from src.models.stain import (
+    StainParameters,
+    has_tissue,
+    normalize_he_stains,
+    normalize_stains,
+)
 
-from .definitions import MCFirstStageTask, MCSecondStageTask
+from .definitions import (
+    DETECT_MITOTIC_CANDIDATES_OP,
+    MCFirstStageTask,
+    MCSecondStageTask,
+)
 
 
 @celery_app.task(
@@ -17,37 +27,35 @@ from .definitions import MCFirstStageTask, MCSecondStageTask
 )
 def predict_mc_first_stage_task(
     self: MCFirstStageTask,
-    image: np.ndarray
+    image: np.ndarray,
+    stain_parameters: StainParameters | None = None
 ) -> list[np.ndarray]:
     """Gets the mitotic candidates.
 
     Args:
         image (np.ndarray): The input image.
+        stain_parameters (StainParameters | None): The stain parameters of the image
+        (or its slide), the stains are estimated on the image if not given.
     Returns:
         list[np.ndarray]: The bounding boxes of the detected candidates.
     """
-    candidates: list[np.ndarray] = []
-
-    try:
-        normalizer = NormalizeHEStains()
-        normalized_image = normalizer(image)
-    except ValueError:
-        return candidates
-
-    predicted_objects = get_sliced_prediction(
-        image=normalized_image,
-        detection_model=self.model,
-        slice_width=512,
-        slice_height=512,
-        overlap_width_ratio=0.25,
-        overlap_height_ratio=0.25,
+    # the background image has no candidates
+    with span('mc.normalize'):
+        if stain_parameters is None:
+            try:
+                normalized_image = normalize_he_stains(image)
+            except ValueError:
+                return []
+        elif has_tissue(image):
+            normalized_image = normalize_stains(image, stain_parameters)
+        else:
+            return []
+
+    candidates: list[np.ndarray] = run_inference_op(
+        DETECT_MITOTIC_CANDIDATES_OP,
+        normalized_image
     )
 
-    candidates.extend([
-        np.array(object.bbox.to_xyxy(), dtype=np.int32)
-        for object in predicted_objects.object_prediction_list
-    ])
-
     return candidates
 
 
@@ -60,23 +68,29 @@ def predict_mc_second_stage_task(
     self: MCSecondStageTask,
     bboxes: list[np.ndarray],
     image: np.ndarray,
+    stain_parameters: StainParameters | None = None
 ) -> list[MitosisPrediction]:
     """
     Classifies the mitotic candidates.
 
     Args:
         bboxes (list[np.ndarray]): The bounding boxes of the detected candidates.
-        image (np.ndarray): The normalized input image.
+        image (np.ndarray): The input image.
+        stain_parameters (StainParameters | None): The stain parameters of the image,
+        the stains are estimated on each candidate if not given.
 
     Returns:
         list[MitosisPrediction]: The predictions for the mitotic candidates.
     """
+    from src.models import predict_mc_second_stage
+
     return predict_mc_second_stage(
         model=self.model,
         image=image,
         bboxes=bboxes,
         device=self.device,
-        model_hash=self.model_hash
+        model_hash=self.model_hash,
+        stain_parameters=stain_parameters
     )
 
 
@@ -99,7 +113,8 @@ def apply_offset_to_bboxes(
     bbox_offset = np.array([*offset, *offset], dtype=np.int32)
 
     for result in mitosis_predictions:
-        result['bbox'] += bbox_offset
+        # the deserialized arrays are read-only
+        result['bbox'] = result['bbox'] + bbox_offset
 
     return mitosis_predictions
 
@@ -108,21 +123,31 @@ def apply_offset_to_bboxes(
 def _predict_mc_task(
     self: Task,
     image: np.ndarray,
-    offset: tuple[int, int]
+    offset: tuple[int, int],
+    stain_parameters: StainParameters | None = None
 ) -> list[MitosisPrediction]:
     """Detects the mitotic and hard-negative mitotic cells in the input image.
 
     Args:
         image (np.ndarray): The input image of at least 512x512 pixels.
         offset (tuple[int, int]): The offset to be applied to the bounding boxes.
+        stain_parameters (StainParameters | None): The stain parameters of the slide,
+        the stains are estimated on the image if not given.
     Returns:
         list[MitosisPrediction]: The predictions for the mitotic candidates.
     """
     queue = self.request.delivery_info['routing_key']
 
-    sig = predict_mc_first_stage_task.s(image=image).set(queue=queue) | \
-        predict_mc_second_stage_task.s(image=image).set(queue=queue) | \
-        apply_offset_to_bboxes.s(offset=offset).set(queue=queue)
+    if stain_parameters is None:
+        stain_parameters = get_tile_stain_parameters(image)
+
+    sig = predict_mc_first_stage_task.s(
+        image=image,
+        stain_parameters=stain_parameters
+    ).set(queue=queue) | predict_mc_second_stage_task.s(
+        image=image,
+        stain_parameters=stain_parameters
+    ).set(queue=queue) | apply_offset_to_bboxes.s(offset=offset).set(queue=queue)
 
     return self.replace(sig)
 
@@ -147,8 +172,14 @@ def predict_mc_task(
     """
     # When _predict_mc_task is called, it does not return a result, so we use noop
     # (temporary solution until we find a better way to handle this case)
-    sig = predict_mc_first_stage_task.s(image=image) | \
-        predict_mc_second_stage_task.s(image=image) | \
-        apply_offset_to_bboxes.s(offset=offset) | save_result.s()
+    stain_parameters = get_tile_stain_parameters(image)
+
+    sig = predict_mc_first_stage_task.s(
+        image=image,
+        stain_parameters=stain_parameters
+    ) | predict_mc_second_stage_task.s(
+        image=image,
+        stain_parameters=stain_parameters
+    ) | apply_offset_to_bboxes.s(offset=offset) | save_result.s()
 
     return sig()
@@ -1,36 +1,110 @@
-import hashlib
-from typing import Any
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-import torch
-from efficientnet_pytorch import EfficientNet
+import numpy as np
 
-from celery import Task
+from src.celery.inference.ops import register_forward_op
+from src.celery.shared.backends import ExportGraph, get_forward_graph
+from src.celery.shared.definitions import ModelTask
 from src.core.config import settings
 
+if TYPE_CHECKING:
+    import torch
+    from efficientnet_pytorch import EfficientNet
 
-class NPPredictTask(Task):
+
+class NPPredictTask(ModelTask):
     """The task for the nuclear pleomorphism prediction pipeline."""
     abstract = True
 
-    def __init__(self) -> None:
-        super().__init__()
+    model_name = 'np'
+    export_backends = ('torchscript', 'onnx')
+    accuracy_metric = 'label_agreement'
+
+    @classmethod
+    def get_model_path(cls) -> Path:
+        return settings.NP_MODEL_PATH
+
+    @classmethod
+    def create_model(cls, device: 'torch.device') -> 'EfficientNet':
+        from efficientnet_pytorch import EfficientNet
+
+        model = EfficientNet.from_name('efficientnet-b0', num_classes=3)
+        model.to(device)
+
+        return model
+
+    @classmethod
+    def load_model(cls, device: 'torch.device') -> 'EfficientNet':
+        import torch
+
+        model = cls.create_model(device)
+
+        checkpoint = torch.load(settings.NP_MODEL_PATH, map_location=device)
+
+        model.load_state_dict(checkpoint['model_state_dict'])
+
+        return model
+
+    @classmethod
+    def get_export_graphs(
+        cls,
+        model: 'EfficientNet',
+        device: 'torch.device'
+    ) -> dict[str, ExportGraph]:
+        import torch
+
+        # the memory efficient swish is a custom autograd function,
+        # which cannot be traced
+        model.set_swish(memory_efficient=False)
+
+        example_input = torch.rand((1, 3, 260, 260), device=device)
+
+        return {'model': get_forward_graph(model, example_input)}
+
+    @classmethod
+    def get_calibration_inputs(
+        cls,
+        model: 'EfficientNet',
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> dict[str, list[tuple[np.ndarray, ...]]]:
+        from src.models.np.predict import prepare_patches
+
+        return {
+            'model': [(patch[None].numpy(),) for patch in prepare_patches(image)]
+        }
+
+    @classmethod
+    def predict_for_evaluation(
+        cls,
+        model: 'EfficientNet',
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> np.ndarray:
+        import torch
+
+        from src.models.np.predict import prepare_patches
+
+        patches = prepare_patches(image)
+
+        if not patches:
+            return np.empty(0, dtype=np.int64)
 
-        self.model: EfficientNet = None
-        self.model_hash: str | None = None
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        with torch.no_grad():
+            outputs = model(torch.stack(patches).to(device))
 
-    def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        if not self.model:
-            model = EfficientNet.from_name('efficientnet-b0', num_classes=3)
-            model.to(self.device)
+        # the label of each patch
+        return outputs.argmax(dim=1).cpu().numpy()
 
-            checkpoint = torch.load(settings.NP_MODEL_PATH, map_location=self.device)
+    @classmethod
+    def warmup(cls, model: 'EfficientNet', device: 'torch.device') -> None:
+        import torch
 
-            model.load_state_dict(checkpoint['model_state_dict'])
+        model.eval()
 
-            self.model = model
+        with torch.no_grad():
+            model(torch.zeros((1, 3, 260, 260), device=device))
 
-            with open(settings.NP_MODEL_PATH, 'rb') as model_file:
-                self.model_hash = hashlib.md5(model_file.read()).hexdigest()
 
-        return self.run(*args, **kwargs)
+register_forward_op(NPPredictTask.model_name)
@@ -1,7 +1,7 @@
 import numpy as np
 
+from src.celery.shared.stain import get_tile_stain_parameters
 from src.core.celery import celery_app
-from src.models import predict_nuclear_pleomorphism
 
 from .definitions import NPPredictTask
 
@@ -23,8 +23,11 @@ def predict_np_task(
     Returns:
         int: The nuclear pleomorphism score (1, 2, or 3).
     """
+    from src.models import predict_nuclear_pleomorphism
+
     return predict_nuclear_pleomorphism(
         model=self.model,
         image=image,
-        device=self.device
+        device=self.device,
+        stain_parameters=get_tile_stain_parameters(image)
     )
@@ -1,39 +1,126 @@
-import hashlib
-from typing import Any
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-import torch
+import numpy as np
 
-from celery import Task
+from src.celery.inference.ops import register_forward_op
+from src.celery.shared.backends import ExportGraph, get_forward_graph
+from src.celery.shared.definitions import ModelTask
+from src.celery.shared.quantization import sample_nuclei_points
 from src.core.config import settings
-from src.models import NuClick_NN
+from src.schemas.shared import Keypoint
 
+if TYPE_CHECKING:
+    import torch
 
-class NuclickTask(Task):
+    from src.models.nuclick.architecture import NuClick_NN
+
+
+class NuclickTask(ModelTask):
     """The task for the NuClick prediction pipeline."""
     abstract = True
 
-    def __init__(self) -> None:
-        super().__init__()
+    model_name = 'nuclick'
+    export_backends = ('torchscript', 'onnx')
+    accuracy_metric = 'iou'
+
+    @classmethod
+    def get_model_path(cls) -> Path:
+        return settings.NUCLICK_MODEL_PATH
+
+    @classmethod
+    def create_model(cls, device: 'torch.device') -> 'NuClick_NN':
+        from src.models import NuClick_NN
+
+        model = NuClick_NN(n_channels=5, n_classes=1)
+
+        model.to(device)
+
+        return model
+
+    @classmethod
+    def load_model(cls, device: 'torch.device') -> 'NuClick_NN':
+        import torch
+
+        model = cls.create_model(device)
+
+        model_state = torch.load(
+            settings.NUCLICK_MODEL_PATH,
+            map_location=device
+        )
+        model.load_state_dict(model_state)
+
+        return model
+
+    @classmethod
+    def get_export_graphs(
+        cls,
+        model: 'NuClick_NN',
+        device: 'torch.device'
+    ) -> dict[str, ExportGraph]:
+        import torch
+
+        example_input = torch.rand((1, 5, 128, 128), device=device)
+
+        return {'model': get_forward_graph(model, example_input)}
+
+    @classmethod
+    def get_calibration_inputs(
+        cls,
+        model: 'NuClick_NN',
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> dict[str, list[tuple[np.ndarray, ...]]]:
+        from src.models.nuclick.predict import prepare_input
+
+        model_input, _, _ = prepare_input(image, _sample_keypoints(image))
+
+        return {'model': [(model_input,)]}
+
+    @classmethod
+    def predict_for_evaluation(
+        cls,
+        model: 'NuClick_NN',
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> np.ndarray:
+        from src.models import predict_nuclick
+
+        keypoints = _sample_keypoints(image)
+        instance_map = predict_nuclick(
+            model=model,
+            image=image,
+            keypoints=keypoints,
+            device=device
+        )
+
+        # the mask of each clicked nucleus
+        return np.stack([
+            instance_map == label for label in range(1, len(keypoints) + 1)
+        ])
+
+    @classmethod
+    def warmup(cls, model: 'NuClick_NN', device: 'torch.device') -> None:
+        import torch
+
+        model.eval()
 
-        self.model: NuClick_NN = None
-        self.model_hash: str | None = None
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        with torch.no_grad():
+            model(torch.zeros((1, 5, 128, 128), device=device))
 
-    def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        if not self.model:
-            model = NuClick_NN(n_channels=5, n_classes=1)
 
-            model.to(self.device)
+def _sample_keypoints(image: np.ndarray) -> list[Keypoint]:
+    """Samples the clicks on the nuclei of the tile, as many as in a request.
 
-            model_state = torch.load(
-                settings.NUCLICK_MODEL_PATH,
-                map_location=self.device
-            )
-            model.load_state_dict(model_state)
+    Args:
+        image (np.ndarray): The tile.
 
-            self.model = model
+    Returns:
+        list[Keypoint]: The clicks.
+    """
+    return [
+        Keypoint(x=x, y=y) for x, y in sample_nuclei_points(image, count=16)
+    ]
 
-            with open(settings.NUCLICK_MODEL_PATH, 'rb') as model_file:
-                self.model_hash = hashlib.md5(model_file.read()).hexdigest()
 
-        return self.run(*args, **kwargs)
+register_forward_op(NuclickTask.model_name)
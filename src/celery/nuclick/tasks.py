@@ -1,8 +1,7 @@
 import numpy as np
-from imantics import Mask
 
 from src.core.celery import celery_app
-from src.models import predict_nuclick
+from src.core.config import settings
 from src.schemas.nuclick import Keypoint
 
 from .definitions import NuclickTask
@@ -18,7 +17,7 @@ def predict_nuclick_task(
     image: np.ndarray,
     keypoints: list[Keypoint],
     offset: tuple[int, int]
-) -> list[list[Keypoint]]:
+) -> list[np.ndarray]:
     """Segments the nuclei in the input image based on the input keypoints
     using the NuClick model.
 
@@ -28,8 +27,12 @@ def predict_nuclick_task(
         to the top left corner of the image.
         offset (tuple[int, int]): The offset to be added to the keypoints.
     Returns:
-        list[list[Keypoint]]: The segmented nuclei in the form of a list of keypoints.
+        list[np.ndarray]: The polygons of the segmented nuclei, Kx2 arrays
+        of the (x, y) vertices.
     """
+    from src.models import predict_nuclick
+    from src.utils.polygons import instance_map_to_polygons
+
     self.model.eval()
 
     result = predict_nuclick(
@@ -39,15 +42,8 @@ def predict_nuclick_task(
         device=self.device
     )
 
-    polygons = Mask(result).polygons()
-
-    return [
-        [
-            {
-                "x": point[0] + offset[0],
-                "y": point[1] + offset[1]
-            }
-            for point in nuclei_points
-        ]
-        for nuclei_points in polygons.points
-    ]
+    return instance_map_to_polygons(
+        result,
+        tolerance=settings.POLYGON_SIMPLIFICATION_TOLERANCE,
+        offset=offset
+    )
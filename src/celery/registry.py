@@ -0,0 +1,24 @@
+"""The names of the celery tasks sent by the API.
+
+The API sends the tasks by name, so it never imports the task modules
+and their dependencies (torch, segment_anything, ultralytics, ...).
+The names must match the names under which the workers register the tasks.
+"""
+
+TASK_PACKAGES = [
+    'src.celery.nuclick',
+    'src.celery.mc',
+    'src.celery.np',
+    'src.celery.sam',
+    'src.celery.active_learning'
+]
+
+PREDICT_MC_TASK_NAME = 'src.celery.mc.tasks.predict_mc_task'
+PREDICT_NP_TASK_NAME = 'src.celery.np.tasks.predict_np_task'
+PREDICT_NUCLICK_TASK_NAME = 'src.celery.nuclick.tasks.predict_nuclick_task'
+GET_SAM_EMBEDDINGS_TASK_NAME = 'src.celery.sam.tasks.get_sam_embeddings_task'
+PREDICT_SAM_TASK_NAME = 'src.celery.sam.tasks.predict_sam'
+DOWNLOAD_REGION_TASK_NAME = 'src.celery.active_learning.tasks.download_region'
+PROCESS_SLIDE_TASK_NAME = 'src.celery.active_learning.tasks.process_slide'
+SYNCHRONIZE_SLIDES_TASK_NAME = 'src.celery.active_learning.tasks.synchronize_slides'
+DISPATCH_SCAN_TILES_TASK_NAME = 'src.celery.active_learning.tasks.dispatch_scan_tiles'
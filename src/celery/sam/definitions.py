@@ -1,14 +1,26 @@
-import hashlib
-from typing import Any, TypedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypedDict
 
 import numpy as np
-import torch
-from segment_anything import sam_model_registry
-from segment_anything.build_sam import Sam
 
-from celery import Task
+from src.celery.inference.ops import inference_op
+from src.celery.shared.backends import (
+    ExportGraph,
+    ExportManifest,
+    OnnxModel,
+    create_onnx_session,
+)
+from src.celery.shared.definitions import ModelTask
+from src.celery.shared.quantization import sample_nuclei_points
 from src.core.config import settings
-from src.schemas.shared import Keypoint
+from src.core.metrics import timed
+
+if TYPE_CHECKING:
+    import torch
+    from segment_anything.build_sam import Sam
+
+GET_SAM_EMBEDDINGS_OP = 'sam.embeddings'
+PREDICT_SAM_MASKS_OP = 'sam.predict'
 
 
 class SamPredictorConfig(TypedDict):
@@ -21,31 +33,536 @@ class SamPredictorConfig(TypedDict):
 
 class SamPredictTaskResult(TypedDict):
     """The result of the SAM prediction task."""
-    segmented_objects: list[list[Keypoint]]
-    low_res_mask: np.ndarray
+    # The polygons of the segmented objects, Kx2 arrays of the (x, y) vertices
+    segmented_objects: list[np.ndarray]
+
+
+class OnnxSamImageEncoder:
+    """The image encoder of SAM running in ONNX Runtime.
+    The encoder is exported for a single image.
+    """
+
+    def __init__(self, model: OnnxModel, img_size: int) -> None:
+        self.model = model
+        self.img_size = img_size
+
+    def __call__(self, images: 'torch.Tensor') -> 'torch.Tensor':
+        import torch
+
+        return torch.cat([self.model(image[None]) for image in images])
+
+
+class OnnxSam:
+    """SAM running in ONNX Runtime with the interface of Sam
+    used by the inference operations.
+    """
+
+    def __init__(
+        self,
+        image_encoder: OnnxSamImageEncoder,
+        mask_decoder: OnnxModel,
+        pixel_mean: list[float],
+        pixel_std: list[float],
+        mask_threshold: float
+    ) -> None:
+        self.image_encoder = image_encoder
+        self.mask_decoder = mask_decoder
+        self.pixel_mean = pixel_mean
+        self.pixel_std = pixel_std
+        self.mask_threshold = mask_threshold
+
+    def preprocess(self, x: 'torch.Tensor') -> 'torch.Tensor':
+        """Normalizes the pixel values and pads the image to the encoder input size,
+        the same as Sam.preprocess.
+
+        Args:
+            x (torch.Tensor): The resized image.
 
+        Returns:
+            torch.Tensor: The input of the image encoder.
+        """
+        import torch
+        import torch.nn.functional as F
 
-class SAMTask(Task):
+        pixel_mean = torch.tensor(self.pixel_mean, device=x.device).view(-1, 1, 1)
+        pixel_std = torch.tensor(self.pixel_std, device=x.device).view(-1, 1, 1)
+
+        x = (x - pixel_mean) / pixel_std
+
+        height, width = x.shape[-2:]
+        img_size = self.image_encoder.img_size
+
+        return F.pad(x, (0, img_size - width, 0, img_size - height))
+
+
+class SAMTask(ModelTask):
     """The task for the SAM prediction pipeline."""
     abstract = True
 
-    def __init__(self) -> None:
-        super().__init__()
+    model_name = 'sam'
+    # the prompt encoder and the mask decoder are exported
+    # with the ONNX wrapper of segment_anything
+    export_backends = ('onnx',)
+    # the light mask decoder stays in fp32
+    quantized_graphs = ('image_encoder',)
+    accuracy_metric = 'iou'
+
+    @classmethod
+    def get_model_path(cls) -> Path:
+        return settings.SAM_MODEL_PATH
+
+    @classmethod
+    def load_model(cls, device: 'torch.device') -> 'Sam':
+        from segment_anything import sam_model_registry
+
+        model = sam_model_registry[
+            settings.SAM_MODEL_VARIANT
+        ](settings.SAM_MODEL_PATH)
+        model.to(device)
+
+        return model
+
+    @classmethod
+    def create_model(cls, device: 'torch.device') -> 'Sam':
+        from segment_anything import sam_model_registry
+
+        model = sam_model_registry[settings.SAM_MODEL_VARIANT]()
+        model.to(device)
+
+        return model
+
+    @classmethod
+    def get_export_graphs(
+        cls,
+        model: 'Sam',
+        device: 'torch.device'
+    ) -> dict[str, ExportGraph]:
+        import torch
+        from segment_anything.utils.onnx import SamOnnxModel
+
+        img_size = model.image_encoder.img_size
+        embed_size = model.prompt_encoder.image_embedding_size
+
+        image_encoder = ExportGraph(
+            model.image_encoder,
+            (torch.rand((1, 3, img_size, img_size), device=device),),
+            input_names=['input'],
+            output_names=['image_embeddings'],
+            dynamic_axes={}
+        )
+
+        # all the masks are returned, they are selected as by SamPredictor.predict
+        mask_decoder = ExportGraph(
+            SamOnnxModel(model, return_single_mask=False),
+            (
+                torch.randn(
+                    (1, model.prompt_encoder.embed_dim, *embed_size),
+                    device=device
+                ),
+                torch.randint(0, img_size, (1, 5, 2), device=device).float(),
+                torch.randint(0, 4, (1, 5), device=device).float(),
+                torch.randn((1, 1, *[4 * x for x in embed_size]), device=device),
+                torch.tensor([1], dtype=torch.float, device=device),
+                torch.tensor([1500, 2250], dtype=torch.float, device=device),
+            ),
+            input_names=[
+                'image_embeddings',
+                'point_coords',
+                'point_labels',
+                'mask_input',
+                'has_mask_input',
+                'orig_im_size',
+            ],
+            output_names=['masks', 'iou_predictions', 'low_res_masks'],
+            dynamic_axes={
+                'point_coords': {1: 'num_points'},
+                'point_labels': {1: 'num_points'},
+            }
+        )
+
+        return {'image_encoder': image_encoder, 'mask_decoder': mask_decoder}
+
+    @classmethod
+    def get_export_metadata(cls, model: 'Sam') -> dict[str, Any]:
+        return {
+            'img_size': model.image_encoder.img_size,
+            'pixel_mean': model.pixel_mean.flatten().tolist(),
+            'pixel_std': model.pixel_std.flatten().tolist(),
+            'mask_threshold': model.mask_threshold,
+        }
+
+    @classmethod
+    def load_exported_model(
+        cls,
+        manifest: ExportManifest,
+        device: 'torch.device'
+    ) -> OnnxSam:
+        metadata = manifest['metadata']
+        graphs = {
+            name: OnnxModel(
+                create_onnx_session(settings.MODEL_EXPORT_DIR / file_name, device)
+            )
+            for name, file_name in manifest['graphs'].items()
+        }
+
+        return OnnxSam(
+            OnnxSamImageEncoder(graphs['image_encoder'], metadata['img_size']),
+            graphs['mask_decoder'],
+            pixel_mean=metadata['pixel_mean'],
+            pixel_std=metadata['pixel_std'],
+            mask_threshold=metadata['mask_threshold']
+        )
+
+    @classmethod
+    def get_calibration_inputs(
+        cls,
+        model: OnnxSam,
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> dict[str, list[tuple[np.ndarray, ...]]]:
+        input_image, _ = _prepare_sam_image(model, device, image)
+
+        return {'image_encoder': [(input_image.cpu().numpy(),)]}
+
+    @classmethod
+    def predict_for_evaluation(
+        cls,
+        model: OnnxSam,
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> np.ndarray:
+        (predictor_config,) = get_sam_embeddings(model, device, [(image,)])
+
+        # a single click on each of the sampled nuclei
+        results = predict_sam_masks(
+            model,
+            device,
+            [
+                (
+                    'evaluation',
+                    predictor_config,
+                    point[None],
+                    np.array([1]),
+                    None,
+                    None,
+                    False
+                )
+                for point in sample_nuclei_points(image, count=16)
+            ]
+        )
+
+        return np.concatenate([masks for masks, _, _ in results])
+
+    @classmethod
+    def warmup(cls, model: 'Sam | OnnxSam', device: 'torch.device') -> None:
+        # the inference operations support both the torch and the exported model
+        (predictor_config,) = get_sam_embeddings(
+            model,
+            device,
+            [(np.zeros((1024, 1024, 3), dtype=np.uint8),)]
+        )
+        predict_sam_masks(
+            model,
+            device,
+            [(
+                'warmup',
+                predictor_config,
+                np.array([[512, 512]]),
+                np.array([1]),
+                None,
+                None,
+                True
+            )]
+        )
+
+
+def _prepare_sam_image(
+    model: 'Sam | OnnxSam',
+    device: 'torch.device',
+    image: np.ndarray
+) -> tuple['torch.Tensor', tuple[int, ...]]:
+    """Prepares the input of the image encoder,
+    the same preprocessing as SamPredictor.set_image.
+
+    Args:
+        model (Sam | OnnxSam): The SAM model.
+        device (torch.device): The device the model is loaded on.
+        image (np.ndarray): The input image.
+
+    Returns:
+        tuple[torch.Tensor, tuple[int, ...]]: The input of the image encoder
+        and the size of the resized image.
+    """
+    import torch
+    from segment_anything.utils.transforms import ResizeLongestSide
+
+    transform = ResizeLongestSide(model.image_encoder.img_size)
+
+    input_image = torch.as_tensor(transform.apply_image(image), device=device)
+    input_image = input_image.permute(2, 0, 1).contiguous()[None, :, :, :]
+
+    return model.preprocess(input_image), tuple(input_image.shape[-2:])
+
+
+@inference_op(GET_SAM_EMBEDDINGS_OP, SAMTask.model_name, batched=True)
+@timed('sam.embed')
+def get_sam_embeddings(
+    model: 'Sam | OnnxSam',
+    device: 'torch.device',
+    batch: list[tuple[np.ndarray]]
+) -> list[SamPredictorConfig]:
+    """Gets the SAM encoder embeddings for the input images.
+    The images are encoded in one batch.
+
+    Args:
+        model (Sam | OnnxSam): The SAM model.
+        device (torch.device): The device the model is loaded on.
+        batch (list[tuple[np.ndarray]]): The input images.
+
+    Returns:
+        list[SamPredictorConfig]: The configuration for the SAM predictor
+        of each image.
+    """
+    import torch
+
+    input_images: list[torch.Tensor] = []
+    sizes: list[tuple[tuple[int, ...], tuple[int, ...]]] = []
+
+    for (image,) in batch:
+        input_image, input_size = _prepare_sam_image(model, device, image)
+
+        input_images.append(input_image)
+        sizes.append((image.shape[:2], input_size))
+
+    with torch.no_grad():
+        features = model.image_encoder(torch.cat(input_images)).cpu().numpy()
+
+    return [
+        {
+            'original_size': original_size,
+            'input_size': input_size,
+            'features': features[index:index + 1],
+            'is_image_set': True
+        }
+        for index, (original_size, input_size) in enumerate(sizes)
+    ]
+
+
+SamPredictRequest = tuple[
+    str,
+    SamPredictorConfig,
+    np.ndarray | None,
+    np.ndarray | None,
+    np.ndarray | None,
+    np.ndarray | None,
+    bool
+]
+
+SamPredictResult = tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _predict_sam_masks_batch(
+    model: 'Sam',
+    device: 'torch.device',
+    requests: list[SamPredictRequest]
+) -> list[SamPredictResult]:
+    """Predicts the masks from the prompts with the same embeddings and structure
+    (number of points, box and mask presence) in one decoder pass.
+
+    Args:
+        model (Sam): The SAM model.
+        device (torch.device): The device the model is loaded on.
+        requests (list[SamPredictRequest]): The requests.
+
+    Returns:
+        list[SamPredictResult]: The masks, their scores and the low resolution
+        logits of each request.
+    """
+    import torch
+    from segment_anything import SamPredictor
+
+    _, predictor_config, point_coords, _, mask_input, bbox, multimask_output = \
+        requests[0]
+
+    predictor = SamPredictor(model)
+    predictor.original_size = predictor_config['original_size']
+    predictor.input_size = predictor_config['input_size']
+    # the stored embeddings may be float16
+    predictor.features = torch.as_tensor(
+        predictor_config['features'],
+        dtype=torch.float32,
+        device=device
+    )
+    predictor.is_image_set = predictor_config['is_image_set']
+
+    original_size = predictor.original_size
+
+    coords_torch: torch.Tensor | None = None
+    labels_torch: torch.Tensor | None = None
+    box_torch: torch.Tensor | None = None
+    mask_input_torch: torch.Tensor | None = None
+
+    # the same prompt transformations as SamPredictor.predict
+    if point_coords is not None:
+        coords = np.stack([
+            predictor.transform.apply_coords(request[2], original_size)
+            for request in requests
+        ])
+        labels = np.stack([request[3] for request in requests])
+
+        coords_torch = torch.as_tensor(coords, dtype=torch.float, device=device)
+        labels_torch = torch.as_tensor(labels, dtype=torch.int, device=device)
+
+    if bbox is not None:
+        boxes = np.concatenate([
+            predictor.transform.apply_boxes(request[5], original_size)
+            for request in requests
+        ])
+
+        box_torch = torch.as_tensor(boxes, dtype=torch.float, device=device)
+
+    if mask_input is not None:
+        mask_input_torch = torch.as_tensor(
+            np.stack([request[4] for request in requests]),
+            dtype=torch.float,
+            device=device
+        )
+
+    masks, iou_predictions, low_res_masks = predictor.predict_torch(
+        coords_torch,
+        labels_torch,
+        box_torch,
+        mask_input_torch,
+        multimask_output
+    )
+
+    return [
+        (
+            masks[index].cpu().numpy(),
+            iou_predictions[index].cpu().numpy(),
+            low_res_masks[index].cpu().numpy()
+        )
+        for index in range(len(requests))
+    ]
+
+
+def _predict_sam_masks_onnx(
+    model: OnnxSam,
+    request: SamPredictRequest
+) -> SamPredictResult:
+    """Predicts the masks from the prompt with the exported mask decoder.
+    The prompt is encoded as by SamPredictor.predict, the corners of the box
+    are the points labeled 2 and 3 and the prompt without the box is padded
+    with the point labeled -1.
+
+    Args:
+        model (OnnxSam): The exported SAM model.
+        request (SamPredictRequest): The request.
+
+    Returns:
+        SamPredictResult: The masks, their scores and the low resolution logits.
+    """
+    from segment_anything.utils.transforms import ResizeLongestSide
+
+    _, predictor_config, point_coords, point_labels, mask_input, bbox, \
+        multimask_output = request
+
+    transform = ResizeLongestSide(model.image_encoder.img_size)
+    original_size = predictor_config['original_size']
+
+    coords: list[np.ndarray] = [np.zeros((0, 2))]
+    labels: list[np.ndarray] = [np.zeros(0)]
+
+    if point_coords is not None and point_labels is not None:
+        coords.append(transform.apply_coords(point_coords, original_size))
+        labels.append(point_labels)
+
+    if bbox is not None:
+        corners = transform.apply_boxes(bbox, original_size).reshape(-1, 2)
+
+        coords.append(corners)
+        labels.append(np.tile([2, 3], len(corners) // 2))
+    else:
+        coords.append(np.zeros((1, 2)))
+        labels.append(np.array([-1]))
+
+    has_mask_input = mask_input is not None
+
+    if mask_input is None:
+        mask_size = model.image_encoder.img_size // 4
+        mask_input = np.zeros((1, mask_size, mask_size))
+
+    masks, iou_predictions, low_res_masks = model.mask_decoder.run(
+        predictor_config['features'].astype(np.float32),
+        np.concatenate(coords)[None].astype(np.float32),
+        np.concatenate(labels)[None].astype(np.float32),
+        mask_input[None].astype(np.float32),
+        np.array([has_mask_input], dtype=np.float32),
+        np.array(original_size, dtype=np.float32)
+    )
+
+    # the first mask is predicted for the single mask output
+    outputs = slice(1, None) if multimask_output else slice(0, 1)
+
+    return (
+        masks[0, outputs] > model.mask_threshold,
+        iou_predictions[0, outputs],
+        low_res_masks[0, outputs]
+    )
+
+
+@inference_op(PREDICT_SAM_MASKS_OP, SAMTask.model_name, batched=True)
+@timed('sam.predict')
+def predict_sam_masks(
+    model: 'Sam | OnnxSam',
+    device: 'torch.device',
+    batch: list[SamPredictRequest]
+) -> list[SamPredictResult]:
+    """Predicts the masks from the prompts using the stored embeddings.
+    The prompts for the same embeddings are grouped and decoded together.
+
+    Each request contains the embeddings task ID, the configuration of the SAM
+    predictor with the embeddings, the coordinates and labels of the user clicks,
+    the low resolution mask of the previous prediction, the bounding box prompt
+    and whether to predict multiple masks.
+
+    Args:
+        model (Sam | OnnxSam): The SAM model.
+        device (torch.device): The device the model is loaded on.
+        batch (list[SamPredictRequest]): The requests.
+
+    Returns:
+        list[SamPredictResult]: The masks, their scores and the low resolution
+        logits of each request.
+    """
+    # the exported mask decoder is run for each prompt
+    if isinstance(model, OnnxSam):
+        return [_predict_sam_masks_onnx(model, request) for request in batch]
+
+    groups: dict[tuple[Any, ...], list[int]] = {}
+
+    for index, request in enumerate(batch):
+        embeddings_id, _, point_coords, _, mask_input, bbox, multimask_output = request
 
-        self.model: Sam = None
-        self.model_hash: str | None = None
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        key = (
+            embeddings_id,
+            None if point_coords is None else len(point_coords),
+            mask_input is None,
+            bbox is None,
+            multimask_output
+        )
+        groups.setdefault(key, []).append(index)
 
-    def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        if not self.model:
-            model = sam_model_registry[
-                settings.SAM_MODEL_VARIANT
-            ](settings.SAM_MODEL_PATH)
-            model.to(self.device)
+    results: list[SamPredictResult | None] = [None] * len(batch)
 
-            self.model = model
+    for indices in groups.values():
+        group_results = _predict_sam_masks_batch(
+            model,
+            device,
+            [batch[index] for index in indices]
+        )
 
-            with open(settings.SAM_MODEL_PATH, 'rb') as model_file:
-                self.model_hash = hashlib.md5(model_file.read()).hexdigest()
+        for index, result in zip(indices, group_results):
+            results[index] = result
 
-        return self.run(*args, **kwargs)
+    return results  # type: ignore
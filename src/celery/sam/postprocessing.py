@@ -0,0 +1,160 @@
+import numpy as np
+
+from src.schemas.sam import SAMPredictRequestPostprocessing
+
+# Pixels of the background kept around the mask in the processed region
+REGION_MARGIN = 2
+
+
+def get_mask_region(
+    mask: np.ndarray,
+    min_outside_area: int = 0
+) -> tuple[slice, slice] | None:
+    """Gets the bounding box of the mask with the margin. The whole mask is
+    the region if the background outside the box would not be a single
+    component of at least min_outside_area pixels.
+
+    Args:
+        mask (np.ndarray): The boolean mask.
+        min_outside_area (int): The minimum area of the background outside the box.
+
+    Returns:
+        tuple[slice, slice] | None: The rows and the columns of the region,
+        None if the mask is empty (and stays empty).
+    """
+    height, width = mask.shape
+    rows = np.flatnonzero(mask.any(axis=1))
+
+    if len(rows) == 0:
+        # the background of the empty mask is too small to be kept
+        if height * width < min_outside_area:
+            return slice(0, height), slice(0, width)
+
+        return None
+
+    columns = np.flatnonzero(mask.any(axis=0))
+
+    top = max(rows[0] - REGION_MARGIN, 0)
+    bottom = min(rows[-1] + REGION_MARGIN + 1, height)
+    left = max(columns[0] - REGION_MARGIN, 0)
+    right = min(columns[-1] + REGION_MARGIN + 1, width)
+
+    # the background outside the box is split by the box spanning the mask
+    split = (top == 0 and bottom == height) or (left == 0 and right == width)
+    outside_area = height * width - (bottom - top) * (right - left)
+
+    if split or outside_area < min_outside_area:
+        return slice(0, height), slice(0, width)
+
+    return slice(top, bottom), slice(left, right)
+
+
+def _fill_small_holes(
+    mask: np.ndarray,
+    area_threshold: int,
+    open_sides: tuple[bool, bool, bool, bool]
+) -> np.ndarray:
+    """Fills the holes of the region of the mask smaller than area_threshold
+    as remove_small_holes of scikit-image does for the whole mask.
+    The background touching the open sides continues outside the region,
+    so it is never a hole.
+
+    Args:
+        mask (np.ndarray): The boolean mask of the region.
+        area_threshold (int): The minimum area of the kept holes.
+        open_sides (tuple[bool, bool, bool, bool]): Whether the top, the bottom,
+        the left and the right side of the region are inside the image
+        (not on its border).
+
+    Returns:
+        np.ndarray: The boolean mask with the small holes filled.
+    """
+    from scipy import ndimage
+
+    labels, _ = ndimage.label(~mask)
+    sizes = np.bincount(labels.ravel())
+
+    sides = (labels[0], labels[-1], labels[:, 0], labels[:, -1])
+    outside = np.concatenate([
+        side for side, is_open in zip(sides, open_sides) if is_open
+    ] or [np.empty(0, dtype=labels.dtype)])
+
+    holes = sizes < area_threshold
+    holes[0] = False
+    holes[outside] = False
+
+    return mask | holes[labels]
+
+
+def postprocess_mask(
+    mask: np.ndarray,
+    point_coords: np.ndarray | None,
+    postprocessing: SAMPredictRequestPostprocessing | None
+) -> tuple[np.ndarray, tuple[int, int]]:
+    """Removes the small objects and holes of the SAM mask and reconstructs
+    the objects of the clicks. Only the bounding box of the mask (with
+    a margin) is processed, so the cost scales with the size of the object.
+
+    Args:
+        mask (np.ndarray): The boolean mask.
+        point_coords (np.ndarray | None): The (x, y) coordinates of the user clicks.
+        postprocessing (SAMPredictRequestPostprocessing | None): The postprocessing
+        configuration.
+
+    Returns:
+        tuple[np.ndarray, tuple[int, int]]: The boolean mask of the region
+        and the (x, y) of its top left corner in the mask (the whole mask
+        if it is empty).
+    """
+    from skimage.morphology import reconstruction, remove_small_objects
+
+    hole_threshold = 0
+
+    if postprocessing is not None:
+        hole_threshold = postprocessing.remove_holes_smaller_than or 0
+
+    region = get_mask_region(mask, min_outside_area=hole_threshold)
+
+    if region is None:
+        return mask, (0, 0)
+
+    rows, columns = region
+    region_mask = mask[region]
+
+    if postprocessing is None:
+        return region_mask, (columns.start, rows.start)
+
+    if postprocessing.min_object_size is not None:
+        region_mask = remove_small_objects(
+            region_mask,
+            min_size=postprocessing.min_object_size
+        )
+
+    if postprocessing.remove_holes_smaller_than is not None:
+        height, width = mask.shape
+
+        region_mask = _fill_small_holes(
+            region_mask,
+            postprocessing.remove_holes_smaller_than,
+            open_sides=(
+                rows.start > 0,
+                rows.stop < height,
+                columns.start > 0,
+                columns.stop < width
+            )
+        )
+
+    if postprocessing.reconstruction is not None:
+        marker_mask = np.zeros_like(region_mask)
+
+        if point_coords is not None:
+            for x, y in point_coords.astype(np.int64):
+                # the clicks outside the region are on the background
+                if rows.start <= y < rows.stop and columns.start <= x < columns.stop:
+                    y -= rows.start
+                    x -= columns.start
+                    marker_mask[y, x] = region_mask[y, x]
+
+        region_mask = reconstruction(marker_mask, region_mask) > 0.5
+
+    return region_mask, (columns.start, rows.start)
@@ -0,0 +1,270 @@
+import time
+from typing import Literal
+
+import numpy as np
+from redis import Redis
+
+from src.core.config import settings
+from src.core.serialization import dumps, loads
+
+from .definitions import SamPredictorConfig
+
+_KEY_PREFIX = 'annotaid:sam'
+# The hash of the sizes of the stored values in bytes
+_SIZES_KEY = f'{_KEY_PREFIX}:sizes'
+# The total size of the stored values in bytes
+_BYTES_KEY = f'{_KEY_PREFIX}:bytes'
+_LOCK_KEY = f'{_KEY_PREFIX}:lock'
+# Seconds the store may hold the lock
+_LOCK_TIMEOUT = 30
+
+_UINT8_MAX = np.iinfo(np.uint8).max
+
+StoredKind = Literal['embeddings', 'mask']
+
+_KINDS: tuple[StoredKind, ...] = ('embeddings', 'mask')
+
+
+def _value_key(kind: StoredKind, task_id: str) -> str:
+    """The embeddings of the embeddings task or the low resolution mask
+    of the predict task."""
+    return f'{_KEY_PREFIX}:{kind}:{task_id}'
+
+
+def _index_key(kind: StoredKind) -> str:
+    """The sorted set of the stored values of the kind scored by their last use."""
+    return f'{_KEY_PREFIX}:index:{kind}'
+
+
+def _get_ttl(kind: StoredKind) -> int:
+    """Seconds the values of the kind are kept after their last use."""
+    if kind == 'embeddings':
+        return settings.SAM_EMBEDDINGS_TTL
+
+    return settings.SAM_MASK_TTL
+
+
+def encode_embeddings(predictor_config: SamPredictorConfig) -> bytes:
+    """Encodes the predictor configuration with the embeddings
+    in SAM_EMBEDDINGS_DTYPE.
+
+    Args:
+        predictor_config (SamPredictorConfig): The configuration for the SAM predictor.
+
+    Returns:
+        bytes: The encoded configuration.
+    """
+    return dumps({
+        **predictor_config,
+        'features': predictor_config['features'].astype(
+            settings.SAM_EMBEDDINGS_DTYPE,
+            copy=False
+        ),
+    })
+
+
+def decode_embeddings(data: bytes) -> SamPredictorConfig:
+    """Decodes the predictor configuration. The embeddings are kept
+    in the stored precision, the mask decoder casts them to float32.
+
+    Args:
+        data (bytes): The encoded configuration.
+
+    Returns:
+        SamPredictorConfig: The configuration for the SAM predictor.
+    """
+    return loads(data)
+
+
+def encode_mask(mask: np.ndarray) -> bytes:
+    """Encodes the low resolution mask (logits) in SAM_MASK_ENCODING.
+
+    Args:
+        mask (np.ndarray): The float32 logits.
+
+    Returns:
+        bytes: The encoded mask.
+    """
+    if settings.SAM_MASK_ENCODING != 'uint8':
+        return dumps({'values': mask.astype(settings.SAM_MASK_ENCODING, copy=False)})
+
+    low = float(mask.min(initial=0))
+    high = float(mask.max(initial=0))
+    scale = (high - low) / _UINT8_MAX or 1.0
+
+    return dumps({
+        'values': np.rint((mask - low) / scale).astype(np.uint8),
+        'low': low,
+        'scale': scale,
+    })
+
+
+def decode_mask(data: bytes) -> np.ndarray:
+    """Decodes the low resolution mask.
+
+    Args:
+        data (bytes): The encoded mask.
+
+    Returns:
+        np.ndarray: The float32 logits.
+    """
+    encoded = loads(data)
+    values: np.ndarray = encoded['values']
+
+    if values.dtype != np.uint8:
+        return values.astype(np.float32)
+
+    scale = np.float32(encoded['scale'])
+    low = np.float32(encoded['low'])
+
+    return values.astype(np.float32) * scale + low
+
+
+def _forget(
+    client: Redis,
+    kind: StoredKind,
+    keys: list[bytes],
+    delete: bool = False
+) -> None:
+    """Removes the values from the size limit bookkeeping.
+
+    Args:
+        client (Redis): The Redis client.
+        kind (StoredKind): The kind of the values.
+        keys (list[bytes]): The keys of the values.
+        delete (bool): Whether the values are deleted too (evicted).
+    """
+    sizes = client.hmget(_SIZES_KEY, keys)
+
+    with client.pipeline() as pipeline:
+        if delete:
+            pipeline.delete(*keys)
+
+        pipeline.zrem(_index_key(kind), *keys)
+        pipeline.hdel(_SIZES_KEY, *keys)
+        pipeline.decrby(_BYTES_KEY, sum(int(size) for size in sizes if size))
+        pipeline.execute()
+
+
+def _prune(client: Redis, now: float) -> None:
+    """Removes the expired values (unused for their TTL) from the bookkeeping."""
+    for kind in _KINDS:
+        keys = client.zrangebyscore(_index_key(kind), '-inf', now - _get_ttl(kind))
+
+        if keys:
+            _forget(client, kind, keys)
+
+
+def _evict(client: Redis) -> None:
+    """Deletes the least recently used values until the stored values fit
+    in SAM_STORE_MAX_BYTES."""
+    while int(client.get(_BYTES_KEY) or 0) > settings.SAM_STORE_MAX_BYTES:
+        oldest: list[tuple[float, StoredKind, bytes]] = []
+
+        for kind in _KINDS:
+            entries = client.zrange(_index_key(kind), 0, 0, withscores=True)
+
+            if entries:
+                key, last_use = entries[0]
+                oldest.append((last_use, kind, key))
+
+        if not oldest:
+            return
+
+        _, kind, key = min(oldest)
+        _forget(client, kind, [key], delete=True)
+
+
+def _put(client: Redis, kind: StoredKind, task_id: str, data: bytes) -> None:
+    """Stores the value with the expiry. With SAM_STORE_MAX_BYTES its use
+    and size are recorded and the least recently used values are evicted."""
+    key = _value_key(kind, task_id)
+    client.set(key, data, ex=_get_ttl(kind))
+
+    if settings.SAM_STORE_MAX_BYTES == 0:
+        return
+
+    with client.lock(_LOCK_KEY, timeout=_LOCK_TIMEOUT):
+        now = time.time()
+        _prune(client, now)
+
+        # the value of the retried task is replaced
+        previous_size = int(client.hget(_SIZES_KEY, key) or 0)
+
+        with client.pipeline() as pipeline:
+            pipeline.zadd(_index_key(kind), {key: now})
+            pipeline.hset(_SIZES_KEY, key, len(data))
+            pipeline.incrby(_BYTES_KEY, len(data) - previous_size)
+            pipeline.execute()
+
+        _evict(client)
+
+
+def _get(client: Redis, kind: StoredKind, task_id: str) -> bytes | None:
+    """Gets the value and extends its expiry."""
+    key = _value_key(kind, task_id)
+    data: bytes | None = client.getex(key, ex=_get_ttl(kind))
+
+    if data is not None and settings.SAM_STORE_MAX_BYTES > 0:
+        # the value evicted in the meantime is not recorded again
+        client.zadd(_index_key(kind), {key: time.time()}, xx=True)
+
+    return data
+
+
+def store_embeddings(
+    client: Redis,
+    task_id: str,
+    predictor_config: SamPredictorConfig
+) -> None:
+    """Stores the embeddings of the embeddings task for SAM_EMBEDDINGS_TTL seconds.
+
+    Args:
+        client (Redis): The Redis client.
+        task_id (str): The ID of the embeddings task.
+        predictor_config (SamPredictorConfig): The configuration for the SAM predictor.
+    """
+    _put(client, 'embeddings', task_id, encode_embeddings(predictor_config))
+
+
+def load_embeddings(client: Redis, task_id: str) -> SamPredictorConfig | None:
+    """Loads the embeddings of the embeddings task and extends their expiry.
+
+    Args:
+        client (Redis): The Redis client.
+        task_id (str): The ID of the embeddings task.
+
+    Returns:
+        SamPredictorConfig | None: The configuration for the SAM predictor,
+        None if the embeddings expired or were evicted.
+    """
+    data = _get(client, 'embeddings', task_id)
+
+    return decode_embeddings(data) if data is not None else None
+
+
+def store_mask(client: Redis, task_id: str, mask: np.ndarray) -> None:
+    """Stores the low resolution mask of the predict task for SAM_MASK_TTL seconds.
+
+    Args:
+        client (Redis): The Redis client.
+        task_id (str): The ID of the predict task.
+        mask (np.ndarray): The float32 logits.
+    """
+    _put(client, 'mask', task_id, encode_mask(mask))
+
+
+def load_mask(client: Redis, task_id: str) -> np.ndarray | None:
+    """Loads the low resolution mask of the predict task and extends its expiry.
+
+    Args:
+        client (Redis): The Redis client.
+        task_id (str): The ID of the predict task.
+
+    Returns:
+        np.ndarray | None: The float32 logits, None if the mask expired
+        or was evicted.
+    """
+    data = _get(client, 'mask', task_id)
+
+    return decode_mask(data) if data is not None else None
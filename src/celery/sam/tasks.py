@@ -1,20 +1,23 @@
 import uuid
 
 import numpy as np
-import torch
 from celery.result import AsyncResult, allow_join_result
-from imantics import Mask
-from segment_anything import SamPredictor
-from skimage.morphology import (
-    reconstruction,
-    remove_small_holes,
-    remove_small_objects,
-)
+from redis import Redis
 
+from src.celery.inference.client import run_inference_op
 from src.core.celery import celery_app
+from src.core.config import settings
+from src.core.redis import connection_pool
 from src.schemas.sam import SAMPredictRequestPostprocessing
 
-from .definitions import SamPredictorConfig, SamPredictTaskResult, SAMTask
+from .definitions import (
+    GET_SAM_EMBEDDINGS_OP,
+    PREDICT_SAM_MASKS_OP,
+    SamPredictorConfig,
+    SamPredictTaskResult,
+    SAMTask,
+)
+from .store import load_embeddings, load_mask, store_embeddings, store_mask
 
 
 @celery_app.task(
@@ -26,29 +29,23 @@ from .definitions import SamPredictorConfig, SamPredictTaskResult, SAMTask
 def get_sam_embeddings_task(
     self: SAMTask,
     image: np.ndarray,
-) -> SamPredictorConfig:
-    """Gets the SAM encoder embeddings for the input image.
+) -> None:
+    """Gets the SAM encoder embeddings for the input image and stores them
+    under the task ID for the predict tasks.
 
     Args:
         image (np.ndarray): The input image.
-
-    Returns:
-        SamPredictorConfig: The configuration for the SAM predictor.
     """
-    predictor = SamPredictor(self.model)
-
-    predictor.set_image(image)
-
-    features = predictor.get_image_embedding().cpu().numpy()
-
-    predictor_config: SamPredictorConfig = {
-        'original_size': predictor.original_size,
-        'input_size': predictor.input_size,
-        'features': features,
-        'is_image_set': predictor.is_image_set
-    }
+    predictor_config: SamPredictorConfig = run_inference_op(
+        GET_SAM_EMBEDDINGS_OP,
+        image
+    )
 
-    return predictor_config
+    store_embeddings(
+        Redis(connection_pool=connection_pool),
+        self.request.id,
+        predictor_config
+    )
 
 
 @celery_app.task(
@@ -71,8 +68,9 @@ def predict_sam(
     Args:
         embeddings_task_id (uuid.UUID): The task ID with the stored embeddings.
         previous_predict_task_id (uuid.UUID | None): The task ID for the previous
-        predict task. If provided, the low resolution segmentation mask of the previous
-        prediction is fed to the model to help refine the segmentation result.
+        predict task. If provided, the stored low resolution segmentation mask
+        of the previous prediction is fed to the model to help refine
+        the segmentation result.
         point_coords (np.ndarray | None): The input coordinates of the user clicks.
         point_labels (np.ndarray | None): The labels of the user clicks
         (foreground / background).
@@ -84,6 +82,10 @@ def predict_sam(
     Returns:
         SamPredictTaskResult: The result of the SAM prediction task.
     """
+    from src.utils.polygons import mask_to_polygons
+
+    from .postprocessing import postprocess_mask
+
     embeddings_task = AsyncResult(str(embeddings_task_id))
     previous_predict_task = AsyncResult(str(previous_predict_task_id))
 
@@ -97,18 +99,26 @@ def predict_sam(
                          f'{previous_predict_task_id}')
 
     with allow_join_result():
-        predictor_config: SamPredictorConfig = embeddings_task.get()
+        # propagate the failures of the tasks
+        embeddings_task.get()
 
         if previous_predict_task_id is not None:
-            previous_predict_result: SamPredictTaskResult = previous_predict_task.get()
-            previous_mask_input = previous_predict_result['low_res_mask']
-            previous_mask_input = previous_mask_input[np.newaxis, ...]  # type: ignore
+            previous_predict_task.get()
 
-    predictor = SamPredictor(self.model)
-    predictor.original_size = predictor_config['original_size']
-    predictor.input_size = predictor_config['input_size']
-    predictor.features = torch.from_numpy(predictor_config['features']).to(self.device)
-    predictor.is_image_set = predictor_config['is_image_set']
+    r = Redis(connection_pool=connection_pool)
+    predictor_config = load_embeddings(r, str(embeddings_task_id))
+
+    if predictor_config is None:
+        raise ValueError(f'Embeddings have expired: {embeddings_task_id}')
+
+    if previous_predict_task_id is not None:
+        previous_mask = load_mask(r, str(previous_predict_task_id))
+
+        if previous_mask is None:
+            raise ValueError('Mask of the previous predict task has expired: '
+                             f'{previous_predict_task_id}')
+
+        previous_mask_input = previous_mask[np.newaxis, ...]
 
     multimask_output = True
 
@@ -121,57 +131,31 @@ def predict_sam(
     if postprocessing is not None and postprocessing.multimask_output is not None:
         multimask_output = postprocessing.multimask_output
 
-    masks, scores, logits = predictor.predict(
-        point_coords=point_coords,
-        point_labels=point_labels,
-        mask_input=previous_mask_input,
-        box=bbox,
-        multimask_output=multimask_output
+    masks, scores, logits = run_inference_op(
+        PREDICT_SAM_MASKS_OP,
+        str(embeddings_task_id),
+        predictor_config,
+        point_coords,
+        point_labels,
+        previous_mask_input,
+        bbox,
+        multimask_output
     )
 
     highest_score_index = np.argmax(scores)
     best_mask: np.ndarray = masks[highest_score_index]
-    low_res_mask: np.ndarray = logits[highest_score_index]
-
-    if postprocessing is not None:
-        if postprocessing.min_object_size is not None:
-            best_mask = remove_small_objects(
-                best_mask,
-                min_size=postprocessing.min_object_size
-            )
-        if postprocessing.remove_holes_smaller_than is not None:
-            best_mask = remove_small_holes(
-                best_mask,
-                area_threshold=postprocessing.remove_holes_smaller_than
-            )
-
-        if postprocessing.reconstruction is not None:
-            marker_mask = np.zeros_like(best_mask)
+    store_mask(r, self.request.id, logits[highest_score_index])
 
-            if point_coords is not None:
-                for point in point_coords:
-                    x, y = point
-                    x = int(x)
-                    y = int(y)
-
-                    marker_mask[y, x] = best_mask[y, x]
-
-            best_mask = reconstruction(marker_mask, best_mask)
-
-    best_mask = np.where(best_mask > 0.5, 255, 0)
-
-    polygons = Mask(best_mask).polygons()
+    region_mask, (region_x, region_y) = postprocess_mask(
+        best_mask,
+        point_coords,
+        postprocessing
+    )
 
     return {
-        "segmented_objects": [
-            [
-                {
-                    "x": point[0].item() + offset[0],
-                    "y": point[1].item() + offset[1]
-                }
-                for point in points
-            ]
-            for points in polygons.points
-        ],
-        "low_res_mask": low_res_mask
+        'segmented_objects': mask_to_polygons(
+            region_mask,
+            tolerance=settings.POLYGON_SIMPLIFICATION_TOLERANCE,
+            offset=(offset[0] + region_x, offset[1] + region_y)
+        )
     }
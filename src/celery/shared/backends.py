@@ -0,0 +1,418 @@
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, NamedTuple, TypedDict
+
+import numpy as np
+
+from src.core.config import InferenceBackend, ModelPrecision, settings
+
+from .cpu import get_process_threads
+
+if TYPE_CHECKING:
+    import onnxruntime
+    import torch
+
+# The file extensions of the exported graphs
+EXPORT_EXTENSIONS: dict[InferenceBackend, str] = {
+    'torchscript': 'torchscript',
+    'onnx': 'onnx',
+}
+
+ONNX_OPSET_VERSION = 17
+
+
+class ExportGraph(NamedTuple):
+    """The torch module exported as a single graph with its example inputs."""
+    module: 'torch.nn.Module'
+    inputs: tuple['torch.Tensor', ...]
+    input_names: list[str]
+    output_names: list[str]
+    dynamic_axes: dict[str, dict[int, str]]
+
+
+class ParityReport(TypedDict):
+    """The difference between the outputs of the exported and the torch graph."""
+    max_abs_diff: float
+    mean_abs_diff: float
+    passed: bool
+
+
+class AccuracyReport(TypedDict):
+    """The agreement of the int8 model with the fp32 model on the evaluation tiles."""
+    # label_agreement for the classifiers, iou for the segmentation models
+    metric: str
+    value: float
+    # The number of the compared labels or masks
+    samples: int
+    # The time of the predictions on the evaluation tiles
+    fp32_seconds: float
+    seconds: float
+
+
+class ExportManifest(TypedDict):
+    """The manifest of the exported model."""
+    model_name: str
+    backend: InferenceBackend
+    precision: ModelPrecision
+    # The fingerprint of the weights the model was exported from
+    source_fingerprint: str
+    # The file names of the graphs in the export directory by the graph name
+    graphs: dict[str, str]
+    parity: dict[str, ParityReport]
+    # The model specific data needed to load the model (e.g. the input size)
+    metadata: dict[str, Any]
+    # The accuracy of the int8 model, None for the fp32 model
+    accuracy: AccuracyReport | None
+
+
+def get_forward_graph(
+    module: 'torch.nn.Module',
+    example_input: 'torch.Tensor'
+) -> ExportGraph:
+    """Gets the graph of the model with a single input and output
+    batched along the first dimension.
+
+    Args:
+        module (torch.nn.Module): The model.
+        example_input (torch.Tensor): The example input with the batch of one.
+
+    Returns:
+        ExportGraph: The graph.
+    """
+    return ExportGraph(
+        module,
+        (example_input,),
+        input_names=['input'],
+        output_names=['output'],
+        dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}}
+    )
+
+
+def get_export_path(
+    model_name: str,
+    graph_name: str,
+    backend: InferenceBackend,
+    precision: ModelPrecision
+) -> Path:
+    """Gets the path to the exported graph of the model.
+
+    Args:
+        model_name (str): The name of the model.
+        graph_name (str): The name of the graph (e.g. the SAM image encoder).
+        backend (InferenceBackend): The backend the graph is exported for.
+        precision (ModelPrecision): The precision of the graph.
+
+    Returns:
+        Path: The path in the MODEL_EXPORT_DIR directory.
+    """
+    return settings.MODEL_EXPORT_DIR / \
+        f'{model_name}.{graph_name}.{precision}.{EXPORT_EXTENSIONS[backend]}'
+
+
+def get_export_manifest_path(
+    model_name: str,
+    backend: InferenceBackend,
+    precision: ModelPrecision
+) -> Path:
+    """Gets the path to the manifest of the exported model.
+
+    Args:
+        model_name (str): The name of the model.
+        backend (InferenceBackend): The backend the model is exported for.
+        precision (ModelPrecision): The precision of the model.
+
+    Returns:
+        Path: The path in the MODEL_EXPORT_DIR directory.
+    """
+    return settings.MODEL_EXPORT_DIR / f'{model_name}.{backend}.{precision}.json'
+
+
+def read_export_manifest(
+    model_name: str,
+    backend: InferenceBackend,
+    precision: ModelPrecision,
+    source_fingerprint: str
+) -> ExportManifest:
+    """Reads the manifest of the exported model and checks that the model
+    was exported from the current weights.
+
+    Args:
+        model_name (str): The name of the model.
+        backend (InferenceBackend): The backend the model is exported for.
+        precision (ModelPrecision): The precision of the model.
+        source_fingerprint (str): The fingerprint of the current weights.
+
+    Raises:
+        FileNotFoundError: If the model is not exported.
+        ValueError: If the model was exported from different weights.
+
+    Returns:
+        ExportManifest: The manifest.
+    """
+    manifest_path = get_export_manifest_path(model_name, backend, precision)
+
+    if not manifest_path.exists():
+        raise FileNotFoundError(
+            f'Model {model_name} is not exported for {backend} ({precision}), '
+            'run python -m src.scripts.export-models'
+        )
+
+    manifest: ExportManifest = json.loads(manifest_path.read_text())
+
+    if manifest['source_fingerprint'] != source_fingerprint:
+        raise ValueError(
+            f'Model {model_name} exported for {backend} ({precision}) is outdated, '
+            'run python -m src.scripts.export-models'
+        )
+
+    return manifest
+
+
+def write_export_manifest(manifest: ExportManifest) -> Path:
+    """Writes the manifest of the exported model.
+
+    Args:
+        manifest (ExportManifest): The manifest.
+
+    Returns:
+        Path: The path to the manifest.
+    """
+    manifest_path = get_export_manifest_path(
+        manifest['model_name'],
+        manifest['backend'],
+        manifest['precision']
+    )
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+
+    return manifest_path
+
+
+def export_onnx(graph: ExportGraph, path: Path) -> None:
+    """Exports the graph to ONNX.
+
+    Args:
+        graph (ExportGraph): The graph.
+        path (Path): The path to the exported graph.
+    """
+    import torch
+
+    graph.module.eval()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            graph.module,
+            graph.inputs,
+            str(path),
+            export_params=True,
+            opset_version=ONNX_OPSET_VERSION,
+            do_constant_folding=True,
+            input_names=graph.input_names,
+            output_names=graph.output_names,
+            dynamic_axes=graph.dynamic_axes
+        )
+
+
+def export_torchscript(graph: ExportGraph, path: Path) -> None:
+    """Exports the graph to TorchScript by tracing it.
+
+    Args:
+        graph (ExportGraph): The graph.
+        path (Path): The path to the exported graph.
+    """
+    import torch
+
+    graph.module.eval()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with torch.no_grad():
+        traced_module = torch.jit.trace(graph.module, graph.inputs)
+
+    torch.jit.save(torch.jit.freeze(traced_module), str(path))
+
+
+def is_accuracy_accepted(manifest: ExportManifest) -> bool:
+    """Checks that the int8 model is accurate enough to replace the fp32 model.
+
+    Args:
+        manifest (ExportManifest): The manifest of the int8 model.
+
+    Returns:
+        bool: Whether the agreement with the fp32 model reaches the configured
+        minimum, False if the model was not evaluated.
+    """
+    accuracy = manifest.get('accuracy')
+
+    if accuracy is None:
+        return False
+
+    minimum = settings.MODEL_INT8_MIN_LABEL_AGREEMENT \
+        if accuracy['metric'] == 'label_agreement' \
+        else settings.MODEL_INT8_MIN_IOU
+
+    return accuracy['value'] >= minimum
+
+
+def create_onnx_session(
+    path: Path,
+    device: 'torch.device'
+) -> 'onnxruntime.InferenceSession':
+    """Creates the ONNX Runtime session with the configured graph optimization
+    and thread pools.
+
+    Args:
+        path (Path): The path to the ONNX graph.
+        device (torch.device): The device the graph runs on.
+
+    Returns:
+        onnxruntime.InferenceSession: The session.
+    """
+    import onnxruntime
+
+    optimization_levels = {
+        'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = \
+        optimization_levels[settings.ONNX_GRAPH_OPTIMIZATION]
+    # the threads of the process (see configure_process) if not configured,
+    # 0 uses the default of ONNX Runtime (the number of physical cores)
+    options.intra_op_num_threads = \
+        settings.ONNX_INTRA_OP_THREADS or get_process_threads()
+    options.inter_op_num_threads = settings.ONNX_INTER_OP_THREADS
+
+    providers = ['CPUExecutionProvider']
+
+    if device.type == 'cuda':
+        providers.insert(0, 'CUDAExecutionProvider')
+
+    return onnxruntime.InferenceSession(str(path), options, providers=providers)
+
+
+def load_torchscript(path: Path, device: 'torch.device') -> 'torch.jit.ScriptModule':
+    """Loads the TorchScript graph on the device.
+
+    Args:
+        path (Path): The path to the TorchScript graph.
+        device (torch.device): The device to load the graph on.
+
+    Returns:
+        torch.jit.ScriptModule: The graph.
+    """
+    import torch
+
+    return torch.jit.load(str(path), map_location=device).eval()
+
+
+class OnnxModel:
+    """The exported graph running in ONNX Runtime. It is a drop-in replacement
+    of the torch model in the prediction functions calling its forward pass.
+    """
+
+    def __init__(self, session: 'onnxruntime.InferenceSession') -> None:
+        self.session = session
+        self.input_names = [x.name for x in session.get_inputs()]
+
+    def run(self, *inputs: np.ndarray) -> list[np.ndarray]:
+        """Runs the graph.
+
+        Returns:
+            list[np.ndarray]: The outputs of the graph.
+        """
+        return self.session.run(None, dict(zip(self.input_names, inputs)))
+
+    def __call__(
+        self,
+        *inputs: 'torch.Tensor'
+    ) -> 'torch.Tensor | tuple[torch.Tensor, ...]':
+        import torch
+
+        outputs = [
+            torch.from_numpy(output).to(inputs[0].device)
+            for output in self.run(*(x.detach().cpu().numpy() for x in inputs))
+        ]
+
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+    def eval(self) -> 'OnnxModel':
+        return self
+
+    def to(self, *args: Any, **kwargs: Any) -> 'OnnxModel':
+        return self
+
+
+def _to_numpy_outputs(outputs: Any) -> list[np.ndarray]:
+    """Converts the outputs of a graph to the list of arrays.
+    The nested outputs (e.g. the intermediate feature maps of YOLO)
+    are not exported and are skipped.
+
+    Args:
+        outputs (Any): The tensor or the tuple of tensors.
+
+    Returns:
+        list[np.ndarray]: The outputs.
+    """
+    import torch
+
+    if not isinstance(outputs, (tuple, list)):
+        outputs = (outputs,)
+
+    return [
+        output.detach().cpu().numpy()
+        for output in outputs
+        if isinstance(output, torch.Tensor)
+    ]
+
+
+def check_parity(
+    graph: ExportGraph,
+    path: Path,
+    backend: InferenceBackend,
+    atol: float,
+    rtol: float
+) -> ParityReport:
+    """Compares the outputs of the exported graph with the torch graph
+    on the example inputs.
+
+    Args:
+        graph (ExportGraph): The torch graph.
+        path (Path): The path to the exported graph.
+        backend (InferenceBackend): The backend the graph is exported for.
+        atol (float): The absolute tolerance.
+        rtol (float): The relative tolerance.
+
+    Returns:
+        ParityReport: The difference of the outputs.
+    """
+    import torch
+
+    device = graph.inputs[0].device
+    graph.module.eval()
+
+    with torch.no_grad():
+        expected = _to_numpy_outputs(graph.module(*graph.inputs))
+
+        if backend == 'onnx':
+            actual = OnnxModel(create_onnx_session(path, device)).run(
+                *(x.cpu().numpy() for x in graph.inputs)
+            )
+        else:
+            actual = _to_numpy_outputs(load_torchscript(path, device)(*graph.inputs))
+
+    differences = [
+        np.abs(a.astype(np.float64) - e.astype(np.float64))
+        for a, e in zip(actual, expected)
+    ]
+
+    return {
+        'max_abs_diff': float(max(d.max(initial=0) for d in differences)),
+        'mean_abs_diff': float(np.mean([d.mean() for d in differences])),
+        'passed': len(actual) == len(expected) and all(
+            a.shape == e.shape and np.allclose(a, e, atol=atol, rtol=rtol)
+            for a, e in zip(actual, expected)
+        )
+    }
@@ -0,0 +1,165 @@
+import logging
+import os
+import sys
+from pathlib import Path
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+NUMA_NODES_PATH = Path('/sys/devices/system/node')
+
+# The threads of torch within and across the operators in the current process,
+# applied when torch is imported
+_torch_threads: tuple[int, int] | None = None
+
+
+def parse_cpu_list(cpu_list: str) -> list[int]:
+    """Parses the CPU list of the kernel, e.g. 0-3,8-11.
+
+    Args:
+        cpu_list (str): The CPU list.
+
+    Returns:
+        list[int]: The CPUs.
+    """
+    cpus: list[int] = []
+
+    for cpu_range in cpu_list.strip().split(','):
+        if not cpu_range:
+            continue
+
+        start, _, end = cpu_range.partition('-')
+        cpus.extend(range(int(start), int(end or start) + 1))
+
+    return cpus
+
+
+def get_numa_nodes() -> list[list[int]]:
+    """Gets the CPUs of each NUMA node available to the current process.
+
+    Returns:
+        list[list[int]]: The CPUs of the nodes, a single node with all
+        the available CPUs if the topology is unknown.
+    """
+    available_cpus = os.sched_getaffinity(0)
+    nodes: list[list[int]] = []
+
+    for node_path in sorted(NUMA_NODES_PATH.glob('node[0-9]*')):
+        try:
+            cpus = parse_cpu_list((node_path / 'cpulist').read_text())
+        except (OSError, ValueError):
+            continue
+
+        cpus = [cpu for cpu in cpus if cpu in available_cpus]
+
+        if cpus:
+            nodes.append(cpus)
+
+    return nodes or [sorted(available_cpus)]
+
+
+def _split_cpus(cpus: list[int], parts: int, index: int) -> list[int]:
+    """Gets the part of the CPUs split into the contiguous parts of equal size.
+
+    Args:
+        cpus (list[int]): The CPUs.
+        parts (int): The number of the parts.
+        index (int): The index of the part.
+
+    Returns:
+        list[int]: The CPUs of the part, a single CPU if there are more parts
+        than the CPUs.
+    """
+    if parts >= len(cpus):
+        return [cpus[index % len(cpus)]]
+
+    size, remainder = divmod(len(cpus), parts)
+    start = index * size + min(index, remainder)
+
+    return cpus[start:start + size + (index < remainder)]
+
+
+def get_process_cpus(index: int, processes: int) -> list[int]:
+    """Gets the CPUs the pool process is pinned to by CELERY_CPU_AFFINITY.
+
+    Args:
+        index (int): The index of the process in the pool.
+        processes (int): The number of the processes in the pool.
+
+    Returns:
+        list[int]: The CPUs of the process.
+    """
+    if settings.CELERY_CPU_AFFINITY == 'numa':
+        nodes = get_numa_nodes()
+
+        # the processes are assigned to the nodes round-robin
+        node_index = index % len(nodes)
+        node_processes = len(range(node_index, processes, len(nodes)))
+
+        return _split_cpus(nodes[node_index], node_processes, index // len(nodes))
+
+    return _split_cpus(sorted(os.sched_getaffinity(0)), processes, index)
+
+
+def configure_process(index: int | None = None, processes: int = 1) -> None:
+    """Pins the process to its CPUs and sets the number of the threads of torch,
+    OpenMP and ONNX Runtime, so the processes of the pool do not oversubscribe
+    the CPUs. The memory allocated after the pinning (e.g. the models loaded
+    in the process) is local to the NUMA node of the CPUs.
+
+    Args:
+        index (int | None): The index of the process in the pool,
+        None for the only process.
+        processes (int): The number of the processes in the pool.
+    """
+    global _torch_threads
+
+    if index is not None and settings.CELERY_CPU_AFFINITY != 'none':
+        cpus = get_process_cpus(index, processes)
+        os.sched_setaffinity(0, cpus)
+
+        logger.info(f'Process {index} is pinned to the CPUs {cpus}')
+
+        threads = len(cpus)
+    else:
+        threads = max(1, len(os.sched_getaffinity(0)) // processes)
+
+    threads = settings.TORCH_NUM_THREADS or threads
+    _torch_threads = (threads, settings.TORCH_INTEROP_THREADS)
+
+    # read by OpenMP and MKL when torch is imported
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['MKL_NUM_THREADS'] = str(threads)
+
+    # e.g. the models shared by the parent process
+    if 'torch' in sys.modules:
+        apply_torch_threads()
+
+
+def get_process_threads() -> int:
+    """Gets the number of the threads within an operator in the current process.
+
+    Returns:
+        int: The number of the threads, 0 if the process is not configured.
+    """
+    return _torch_threads[0] if _torch_threads is not None else 0
+
+
+def apply_torch_threads() -> None:
+    """Sets the configured number of the threads of torch in the current process."""
+    if _torch_threads is None:
+        return
+
+    import torch
+
+    threads, interop_threads = _torch_threads
+
+    torch.set_num_threads(threads)
+
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # the inter-op thread pool is already started
+            logger.warning(f'Cannot set the inter-op threads: {e}')
@@ -0,0 +1,448 @@
+import logging
+import time
+from collections.abc import Iterable
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, ClassVar, Literal, NamedTuple
+
+import numpy as np
+
+from celery import Task
+from src.core.config import InferenceBackend, ModelName, ModelPrecision, settings
+
+from .backends import (
+    ExportGraph,
+    ExportManifest,
+    OnnxModel,
+    create_onnx_session,
+    export_onnx,
+    export_torchscript,
+    is_accuracy_accepted,
+    load_torchscript,
+    read_export_manifest,
+)
+from .cpu import apply_torch_threads
+from .fingerprint import get_model_fingerprint
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedModel(NamedTuple):
+    """The model loaded in the current process."""
+    model: Any
+    model_hash: str
+
+
+# The models loaded in the current process. The tasks using the same model
+# (e.g. the SAM embeddings and predict tasks) share a single instance.
+_loaded_models: dict[str, LoadedModel] = {}
+
+# The task bases by the name of their model
+_model_tasks: dict[str, type['ModelTask']] = {}
+
+
+@cache
+def get_device() -> 'torch.device':
+    """Gets the device the models are loaded on.
+
+    Returns:
+        torch.device: The configured device. If not configured, the CUDA device
+        if available, otherwise the CPU.
+    """
+    import torch
+
+    # the first model loaded in the process imports torch
+    apply_torch_threads()
+
+    if settings.MODEL_DEVICE != 'auto':
+        return torch.device(settings.MODEL_DEVICE)
+
+    return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+
+class ModelTask(Task):
+    """The base task for the tasks running a model.
+
+    The model and its dependencies (torch, ...) are loaded on the first access,
+    so the task can be registered (e.g. by the celery CLI or the workers
+    of the other queues) without importing them. If the inference server
+    is enabled, the model is never loaded in the worker.
+
+    The model runs in torch unless it is exported for another backend
+    (see MODEL_BACKENDS), its hash is always the fingerprint of the weights
+    the model is exported from.
+    """
+    abstract = True
+
+    model_name: ClassVar[ModelName]
+
+    # The backends the model can run on besides torch
+    export_backends: ClassVar[tuple[InferenceBackend, ...]] = ()
+    # The exported graphs quantized to int8, the other graphs stay in fp32
+    quantized_graphs: ClassVar[tuple[str, ...]] = ('model',)
+    # The comparison of the int8 and fp32 predictions, None if the model
+    # cannot be quantized
+    accuracy_metric: ClassVar[Literal['label_agreement', 'iou'] | None] = None
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+
+        # celery subclasses the base for every task, only the bases are registered
+        if 'model_name' in cls.__dict__:
+            _model_tasks[cls.model_name] = cls
+
+    @classmethod
+    def get_model_path(cls) -> Path:
+        """Gets the path to the model weights.
+
+        Returns:
+            Path: The path to the model weights.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def load_model(cls, device: 'torch.device') -> Any:
+        """Loads the model on the device.
+
+        Args:
+            device (torch.device): The device to load the model on.
+
+        Returns:
+            Any: The loaded model.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def create_model(cls, device: 'torch.device') -> Any:
+        """Creates the model with random weights on the device, e.g. for the
+        benchmarks without the weights.
+
+        Args:
+            device (torch.device): The device to create the model on.
+
+        Returns:
+            Any: The model.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def get_backend(cls) -> InferenceBackend:
+        """Gets the configured backend of the model.
+
+        Raises:
+            ValueError: If the model cannot run on the configured backend.
+
+        Returns:
+            InferenceBackend: The backend.
+        """
+        backend = settings.MODEL_BACKENDS.get(cls.model_name, 'torch')
+
+        if backend != 'torch' and backend not in cls.export_backends:
+            raise ValueError(f'Model {cls.model_name} cannot run on {backend}')
+
+        return backend
+
+    @classmethod
+    def get_precision(cls) -> ModelPrecision:
+        """Gets the configured precision of the exported model.
+
+        Raises:
+            ValueError: If the precision is not supported by the backend.
+
+        Returns:
+            ModelPrecision: The precision.
+        """
+        precision = settings.MODEL_PRECISIONS.get(cls.model_name, 'fp32')
+
+        if precision != 'fp32' and cls.get_backend() != 'onnx':
+            raise ValueError(
+                f'Model {cls.model_name} in {precision} requires the onnx backend'
+            )
+
+        return precision
+
+    @classmethod
+    def get_export_graphs(
+        cls,
+        model: Any,
+        device: 'torch.device'
+    ) -> dict[str, ExportGraph]:
+        """Gets the graphs of the loaded model exported for the other backends.
+
+        Args:
+            model (Any): The loaded model.
+            device (torch.device): The device the model is loaded on.
+
+        Returns:
+            dict[str, ExportGraph]: The graphs by their name.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def get_export_metadata(cls, model: Any) -> dict[str, Any]:
+        """Gets the data stored in the manifest of the exported model,
+        needed to load the exported model.
+
+        Args:
+            model (Any): The loaded model.
+
+        Returns:
+            dict[str, Any]: The metadata.
+        """
+        return {}
+
+    @classmethod
+    def export_graph(
+        cls,
+        graph: ExportGraph,
+        backend: InferenceBackend,
+        path: Path
+    ) -> None:
+        """Exports the graph of the model for the backend.
+
+        Args:
+            graph (ExportGraph): The graph.
+            backend (InferenceBackend): The backend.
+            path (Path): The path to the exported graph.
+        """
+        if backend == 'onnx':
+            export_onnx(graph, path)
+        else:
+            export_torchscript(graph, path)
+
+    @classmethod
+    def load_exported_model(
+        cls,
+        manifest: ExportManifest,
+        device: 'torch.device'
+    ) -> Any:
+        """Loads the exported model on the device. By default the model
+        is a single graph called with the same inputs as the torch model.
+
+        Args:
+            manifest (ExportManifest): The manifest of the exported model.
+            device (torch.device): The device to load the model on.
+
+        Returns:
+            Any: The loaded model.
+        """
+        path = settings.MODEL_EXPORT_DIR / manifest['graphs']['model']
+
+        if manifest['backend'] == 'onnx':
+            return OnnxModel(create_onnx_session(path, device))
+
+        return load_torchscript(path, device)
+
+    @classmethod
+    def get_export_manifest(cls, model_hash: str) -> ExportManifest:
+        """Gets the manifest of the exported model with the configured backend
+        and precision. The int8 model is replaced with the fp32 model if it is
+        less accurate than the configured minimum.
+
+        Args:
+            model_hash (str): The fingerprint of the current weights.
+
+        Raises:
+            FileNotFoundError: If the model is not exported.
+            ValueError: If the model was exported from different weights.
+
+        Returns:
+            ExportManifest: The manifest.
+        """
+        backend = cls.get_backend()
+        precision = cls.get_precision()
+
+        manifest = read_export_manifest(cls.model_name, backend, precision, model_hash)
+
+        if precision != 'fp32' and not is_accuracy_accepted(manifest):
+            logger.warning(
+                f'Model {cls.model_name} in {precision} does not reach the minimum '
+                f'accuracy ({manifest.get("accuracy")}), fp32 is used instead'
+            )
+            manifest = read_export_manifest(cls.model_name, backend, 'fp32', model_hash)
+
+        return manifest
+
+    @classmethod
+    def get_calibration_inputs(
+        cls,
+        model: Any,
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> dict[str, list[tuple[np.ndarray, ...]]]:
+        """Gets the inputs of the quantized graphs for the tile, the activation
+        ranges of the statically quantized graphs are calibrated on them.
+
+        Args:
+            model (Any): The fp32 exported model.
+            device (torch.device): The device the model is loaded on.
+            image (np.ndarray): The tile.
+
+        Returns:
+            dict[str, list[tuple[np.ndarray, ...]]]: The inputs by the graph name.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def predict_for_evaluation(
+        cls,
+        model: Any,
+        device: 'torch.device',
+        image: np.ndarray
+    ) -> np.ndarray:
+        """Predicts the tile with the model, the predictions of the int8
+        and fp32 models are compared by the accuracy metric.
+
+        Args:
+            model (Any): The exported model.
+            device (torch.device): The device the model is loaded on.
+            image (np.ndarray): The tile.
+
+        Returns:
+            np.ndarray: The predicted labels or masks.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def warmup(cls, model: Any, device: 'torch.device') -> None:
+        """Runs the model on a synthetic input, so the first task does not pay
+        for the lazy initialization (e.g. CUDA kernels, memory allocation).
+
+        Args:
+            model (Any): The loaded model.
+            device (torch.device): The device the model is loaded on.
+        """
+
+    @classmethod
+    def share_memory(cls, model: Any) -> None:
+        """Prepares the model to be shared with the forked processes. The weights
+        are moved to the shared memory, so they are never copied on write.
+
+        Args:
+            model (Any): The loaded model.
+        """
+        model.eval()
+        model.share_memory()
+
+    @classmethod
+    def get_loaded_model(cls) -> LoadedModel:
+        """Gets the model loaded in the current process, loads it if needed.
+
+        Returns:
+            LoadedModel: The loaded model.
+        """
+        if cls.model_name not in _loaded_models:
+            backend = cls.get_backend()
+            model_hash = get_model_fingerprint(cls.get_model_path())
+
+            if backend == 'torch':
+                model = cls.load_model(get_device())
+            else:
+                model = cls.load_exported_model(
+                    cls.get_export_manifest(model_hash),
+                    get_device()
+                )
+
+            _loaded_models[cls.model_name] = LoadedModel(model, model_hash)
+
+        return _loaded_models[cls.model_name]
+
+    @property
+    def device(self) -> 'torch.device':
+        if settings.INFERENCE_SERVER_ENABLED:
+            import torch
+
+            # the inputs are sent to the inference server from the CPU
+            return torch.device('cpu')
+
+        return get_device()
+
+    @property
+    def model(self) -> Any:
+        if settings.INFERENCE_SERVER_ENABLED:
+            # the inference package imports this module
+            from src.celery.inference.client import RemoteModel
+
+            return RemoteModel(self.model_name)
+
+        return self.get_loaded_model().model
+
+    @property
+    def model_hash(self) -> str:
+        if settings.INFERENCE_SERVER_ENABLED:
+            return get_model_fingerprint(self.get_model_path())
+
+        return self.get_loaded_model().model_hash
+
+
+def get_model_task(model_name: str) -> type[ModelTask]:
+    """Gets the task base of the model.
+
+    Args:
+        model_name (str): The name of the model.
+
+    Raises:
+        ValueError: If a model task base is not registered.
+
+    Returns:
+        type[ModelTask]: The task base.
+    """
+    if model_name not in _model_tasks:
+        raise ValueError(f'Unknown model: {model_name}')
+
+    return _model_tasks[model_name]
+
+
+def preload_models(model_names: Iterable[str], warmup: bool = True) -> None:
+    """Loads the models in the current process.
+
+    Args:
+        model_names (Iterable[str]): The names of the models.
+        warmup (bool): Whether to run the models on a synthetic input.
+
+    Raises:
+        ValueError: If a model task base is not registered.
+    """
+    for model_name in model_names:
+        task_class = get_model_task(model_name)
+        start = time.perf_counter()
+
+        loaded_model = task_class.get_loaded_model()
+
+        if warmup:
+            task_class.warmup(loaded_model.model, get_device())
+
+        logger.info(
+            f'Model {model_name} preloaded in {time.perf_counter() - start:.2f}s'
+        )
+
+
+def share_models(model_names: Iterable[str]) -> None:
+    """Loads the models on the CPU in the current process, so they are shared
+    with the processes forked later. The models are not run, the forward pass
+    (and the thread pools it starts) is left to the forked processes.
+
+    Args:
+        model_names (Iterable[str]): The names of the models.
+
+    Raises:
+        ValueError: If a model task base is not registered.
+    """
+    for model_name in model_names:
+        task_class = get_model_task(model_name)
+
+        # the thread pools of ONNX Runtime do not survive the fork
+        if task_class.get_backend() == 'onnx':
+            logger.info(f'Model {model_name} runs on onnx and is not shared')
+            continue
+
+        start = time.perf_counter()
+
+        task_class.share_memory(task_class.get_loaded_model().model)
+
+        logger.info(
+            f'Model {model_name} shared in {time.perf_counter() - start:.2f}s'
+        )
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_ALGORITHM = 'blake2b'
+
+
+def _get_manifest_path(model_path: Path) -> Path:
+    """Gets the path to the manifest storing the fingerprint of the model.
+
+    Args:
+        model_path (Path): The resolved path to the model weights.
+
+    Returns:
+        Path: The manifest path, next to the model weights
+        or in the MODEL_FINGERPRINT_DIR directory.
+    """
+    if settings.MODEL_FINGERPRINT_DIR is None:
+        return model_path.with_name(f'{model_path.name}.fingerprint.json')
+
+    # the models with the same name in different directories must not collide
+    path_hash = hashlib.blake2b(str(model_path).encode(), digest_size=8).hexdigest()
+
+    return settings.MODEL_FINGERPRINT_DIR / f'{model_path.name}.{path_hash}.json'
+
+
+def _read_manifest(manifest_path: Path) -> dict[str, Any] | None:
+    """Reads the manifest.
+
+    Args:
+        manifest_path (Path): The manifest path.
+
+    Returns:
+        dict[str, Any] | None: The manifest or None if it does not exist
+        or is not valid.
+    """
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+    return manifest if isinstance(manifest, dict) else None
+
+
+def _write_manifest(manifest_path: Path, manifest: dict[str, Any]) -> None:
+    """Writes the manifest atomically, so the concurrently starting workers
+    never read a partially written manifest. The failures (e.g. a read-only
+    file system) are logged and ignored, the fingerprint is computed again
+    on the next start.
+
+    Args:
+        manifest_path (Path): The manifest path.
+        manifest (dict[str, Any]): The manifest.
+    """
+    temp_path: str | None = None
+
+    try:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(
+            'w',
+            dir=manifest_path.parent,
+            prefix=f'.{manifest_path.name}.',
+            delete=False
+        ) as temp_file:
+            temp_path = temp_file.name
+            json.dump(manifest, temp_file)
+
+        os.replace(temp_path, manifest_path)
+    except OSError as e:
+        logger.warning(f'Cannot write the model fingerprint to {manifest_path}: {e}')
+
+        if temp_path is not None:
+            Path(temp_path).unlink(missing_ok=True)
+
+
+def compute_fingerprint(model_path: Path) -> str:
+    """Computes the fingerprint of the file. The file is read in chunks,
+    so it is never loaded into memory at once.
+
+    Args:
+        model_path (Path): The path to the file.
+
+    Returns:
+        str: The hex digest of the file.
+    """
+    with open(model_path, 'rb') as model_file:
+        return hashlib.file_digest(model_file, FINGERPRINT_ALGORITHM).hexdigest()
+
+
+def get_model_fingerprint(model_path: Path) -> str:
+    """Gets the fingerprint of the model weights. The fingerprint is cached
+    in a manifest keyed by the path, size and modification time of the file,
+    so the file is hashed only when it changes.
+
+    Args:
+        model_path (Path): The path to the model weights.
+
+    Returns:
+        str: The fingerprint of the model weights.
+    """
+    model_path = model_path.resolve()
+    stat = model_path.stat()
+
+    key = {
+        'path': str(model_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'algorithm': FINGERPRINT_ALGORITHM
+    }
+
+    manifest_path = _get_manifest_path(model_path)
+    manifest = _read_manifest(manifest_path)
+
+    if manifest is not None and all(manifest.get(k) == v for k, v in key.items()) \
+            and isinstance(manifest.get('fingerprint'), str):
+        return manifest['fingerprint']
+
+    fingerprint = compute_fingerprint(model_path)
+
+    _write_manifest(manifest_path, {**key, 'fingerprint': fingerprint})
+
+    return fingerprint
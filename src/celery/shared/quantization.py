@@ -0,0 +1,172 @@
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+
+# The file extensions of the saved tiles
+TILE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+
+CalibrationMethod = Literal['minmax', 'entropy', 'percentile']
+
+
+def load_tiles(directory: Path) -> Iterator[np.ndarray]:
+    """Loads the saved tiles in the order of their file names.
+
+    Args:
+        directory (Path): The directory of the tiles.
+
+    Yields:
+        np.ndarray: The RGB tile.
+    """
+    from PIL import Image
+
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() in TILE_EXTENSIONS:
+            with Image.open(path) as image:
+                yield np.asarray(image.convert('RGB'))
+
+
+def sample_nuclei_points(image: np.ndarray, count: int, seed: int = 0) -> np.ndarray:
+    """Samples the points on the darkest pixels of the tile, which are mostly
+    the nuclei stained by hematoxylin. The points stand in for the user clicks
+    and the candidate detections.
+
+    Args:
+        image (np.ndarray): The RGB tile.
+        count (int): The maximum number of points.
+        seed (int): The seed of the sampling.
+
+    Returns:
+        np.ndarray: The x and y coordinates of the points.
+    """
+    intensity = image[..., :3].mean(axis=-1)
+    ys, xs = np.nonzero(intensity <= np.percentile(intensity, 5))
+
+    indices = np.random.default_rng(seed).choice(
+        len(xs),
+        size=min(count, len(xs)),
+        replace=False
+    )
+
+    return np.stack([xs[indices], ys[indices]], axis=1)
+
+
+def quantize_onnx_dynamic(path: Path, quantized_path: Path) -> None:
+    """Quantizes the weights of the ONNX graph to int8, the activations
+    are quantized at runtime.
+
+    Args:
+        path (Path): The path to the fp32 graph.
+        quantized_path (Path): The path to the quantized graph.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(path), str(quantized_path), weight_type=QuantType.QInt8)
+
+
+def quantize_onnx_static(
+    path: Path,
+    quantized_path: Path,
+    calibration_inputs: list[tuple[np.ndarray, ...]],
+    calibration_method: CalibrationMethod = 'minmax'
+) -> None:
+    """Quantizes the weights and the activations of the ONNX graph to int8.
+    The activation ranges are calibrated on the inputs, the graph is stored
+    in the QDQ format with the weights quantized per channel.
+
+    Args:
+        path (Path): The path to the fp32 graph.
+        quantized_path (Path): The path to the quantized graph.
+        calibration_inputs (list[tuple[np.ndarray, ...]]): The inputs of the graph.
+        calibration_method (CalibrationMethod): The method of the range calibration.
+    """
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    calibration_methods = {
+        'minmax': CalibrationMethod.MinMax,
+        'entropy': CalibrationMethod.Entropy,
+        'percentile': CalibrationMethod.Percentile,
+    }
+
+    input_names = [
+        x.name for x in onnxruntime.InferenceSession(
+            str(path),
+            providers=['CPUExecutionProvider']
+        ).get_inputs()
+    ]
+
+    class DataReader(CalibrationDataReader):
+        def __init__(self) -> None:
+            self.inputs = iter(calibration_inputs)
+
+        def get_next(self) -> dict[str, np.ndarray] | None:
+            inputs = next(self.inputs, None)
+
+            return None if inputs is None else dict(zip(input_names, inputs))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # the shape inference and the graph optimizations, so more operators
+        # are quantized
+        preprocessed_path = Path(temp_dir) / path.name
+        quant_pre_process(str(path), str(preprocessed_path))
+
+        quantize_static(
+            str(preprocessed_path),
+            str(quantized_path),
+            DataReader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=calibration_methods[calibration_method]
+        )
+
+
+def compare_predictions(
+    metric: Literal['label_agreement', 'iou'],
+    references: list[np.ndarray],
+    predictions: list[np.ndarray]
+) -> tuple[float, int]:
+    """Compares the predictions of the int8 model with the fp32 model.
+
+    Args:
+        metric (Literal['label_agreement', 'iou']): The share of the equal labels
+        or the IoU of the masks (the intersection and the union are summed
+        over all the masks, so the empty masks do not skew the result).
+        references (list[np.ndarray]): The fp32 predictions of each tile.
+        predictions (list[np.ndarray]): The int8 predictions of each tile.
+
+    Returns:
+        tuple[float, int]: The value of the metric and the number of the compared
+        labels or masks.
+    """
+    samples = sum(len(reference) for reference in references)
+
+    if metric == 'label_agreement':
+        equal = sum(
+            int(np.sum(reference == prediction))
+            for reference, prediction in zip(references, predictions)
+        )
+
+        return (equal / samples if samples else 1.0), samples
+
+    intersection = sum(
+        int(np.logical_and(reference, prediction).sum())
+        for reference, prediction in zip(references, predictions)
+    )
+    union = sum(
+        int(np.logical_or(reference, prediction).sum())
+        for reference, prediction in zip(references, predictions)
+    )
+
+    return (intersection / union if union else 1.0), samples
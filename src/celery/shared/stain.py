@@ -0,0 +1,25 @@
+import numpy as np
+
+from src.core.config import settings
+from src.core.metrics import span
+from src.models.stain import StainParameters, estimate_stain_parameters
+
+
+def get_tile_stain_parameters(image: np.ndarray) -> StainParameters | None:
+    """Estimates the stains of the tile once for all the models and their patches.
+
+    Args:
+        image (np.ndarray): The tile.
+
+    Returns:
+        StainParameters | None: The stain parameters, None if the stains are estimated
+        on each patch (STAIN_NORMALIZATION_SCOPE=patch) or the tile is the background.
+    """
+    if settings.STAIN_NORMALIZATION_SCOPE == 'patch':
+        return None
+
+    try:
+        with span('stain.estimate'):
+            return estimate_stain_parameters(image)
+    except ValueError:
+        return None
@@ -0,0 +1,207 @@
+import logging
+import time
+from typing import Any
+
+from billiard.process import current_process
+from celery import Task
+from celery.concurrency import get_implementation
+from celery.concurrency.prefork import TaskPool as PreforkTaskPool
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_ready,
+    worker_shutdown,
+)
+from celery.worker import WorkController
+from src.celery.shared.cpu import configure_process
+from src.celery.shared.definitions import preload_models, share_models
+from src.core.config import settings
+from src.core.metrics import (
+    is_enabled,
+    mark_process_dead,
+    observe_queue_wait,
+    observe_stage,
+    start_metrics_server,
+)
+
+logger = logging.getLogger(__name__)
+
+# Whether the models are preloaded by the prefork child processes,
+# in that case the worker is ready once all the child processes report it
+_preload_in_child_processes = False
+
+# The number of the prefork child processes, None for the other pools
+_pool_processes: int | None = None
+
+# The start of the running tasks by their ID
+_task_starts: dict[str, float] = {}
+
+
+def _mark_ready() -> None:
+    """Creates the ready file if configured."""
+    if settings.CELERY_READY_FILE is not None:
+        settings.CELERY_READY_FILE.touch()
+
+
+def _mark_part_ready(part: str) -> None:
+    """Reports the readiness of the worker or of a prefork child process.
+    The ready file is created once the worker and all the child processes
+    reported, by the last of them.
+
+    Args:
+        part (str): The worker or the child process.
+    """
+    ready_file = settings.CELERY_READY_FILE
+
+    if ready_file is None or _pool_processes is None:
+        return
+
+    ready_file.with_name(f'{ready_file.name}.{part}').touch()
+
+    parts = ['worker', *(f'child-{index}' for index in range(_pool_processes))]
+
+    if all(ready_file.with_name(f'{ready_file.name}.{x}').exists() for x in parts):
+        _mark_ready()
+
+
+def _mark_not_ready() -> None:
+    """Removes the ready file and the readiness of the parts if configured."""
+    ready_file = settings.CELERY_READY_FILE
+
+    if ready_file is not None:
+        ready_file.unlink(missing_ok=True)
+        ready_file.with_name(f'{ready_file.name}.worker').unlink(missing_ok=True)
+
+        for part_file in ready_file.parent.glob(f'{ready_file.name}.child-*'):
+            part_file.unlink(missing_ok=True)
+
+
+def _is_prefork(worker: WorkController) -> bool:
+    """Checks whether the worker runs the tasks in the prefork child processes."""
+    return issubclass(get_implementation(worker.pool_cls), PreforkTaskPool)
+
+
+@worker_init.connect
+def configure_worker_cpus(sender: WorkController, **kwargs: Any) -> None:
+    """Configure the threads of the worker process, the prefork child processes
+    are configured when they start. The handlers are connected before
+    the preloading, so the models are loaded with the configured threads.
+    """
+    global _pool_processes
+
+    if _is_prefork(sender):
+        _pool_processes = sender.concurrency
+        return
+
+    configure_process()
+
+
+@worker_process_init.connect
+def configure_child_process_cpus(**kwargs: Any) -> None:
+    """Pin the prefork child process to its CPUs and configure its threads."""
+    if _pool_processes is not None:
+        configure_process(current_process().index, _pool_processes)
+
+
+@worker_init.connect
+def preload_models_in_worker(sender: WorkController, **kwargs: Any) -> None:
+    """Preload the configured models before the worker starts consuming tasks.
+    With the prefork pool the models are preloaded in the child processes,
+    optionally loaded once in the parent process and shared with the children.
+    """
+    global _preload_in_child_processes
+
+    _mark_not_ready()
+
+    # the models are preloaded by the inference server
+    if not settings.CELERY_PRELOAD_MODELS or settings.INFERENCE_SERVER_ENABLED:
+        return
+
+    if _is_prefork(sender):
+        _preload_in_child_processes = True
+
+        if settings.CELERY_SHARE_MODELS:
+            share_models(settings.CELERY_PRELOAD_MODELS)
+
+        return
+
+    preload_models(settings.CELERY_PRELOAD_MODELS, settings.CELERY_PRELOAD_WARMUP)
+
+
+@worker_process_init.connect
+def preload_models_in_child_process(**kwargs: Any) -> None:
+    """Preload the configured models in the prefork child process. The process
+    does not receive tasks until it is initialized.
+    """
+    if not _preload_in_child_processes:
+        return
+
+    preload_models(settings.CELERY_PRELOAD_MODELS, settings.CELERY_PRELOAD_WARMUP)
+    _mark_part_ready(f'child-{current_process().index}')
+
+
+@worker_ready.connect
+def mark_worker_ready(**kwargs: Any) -> None:
+    """Report the readiness. If the models are preloaded by the child processes,
+    the worker is ready once all of them reported too.
+    """
+    if _preload_in_child_processes:
+        _mark_part_ready('worker')
+    else:
+        _mark_ready()
+
+
+@worker_shutdown.connect
+def mark_worker_not_ready(**kwargs: Any) -> None:
+    """Remove the ready file when the worker stops."""
+    _mark_not_ready()
+
+
+@worker_init.connect
+def start_worker_metrics_server(sender: WorkController, **kwargs: Any) -> None:
+    """Export the metrics of the worker node on METRICS_WORKER_PORT."""
+    if not is_enabled():
+        return
+
+    if _is_prefork(sender) and settings.METRICS_MULTIPROC_DIR is None:
+        logger.warning(
+            'The metrics of the prefork processes are exported '
+            'only with METRICS_MULTIPROC_DIR'
+        )
+
+    start_metrics_server(settings.METRICS_WORKER_PORT)
+
+
+@worker_process_shutdown.connect
+def remove_child_process_metrics(pid: int, **kwargs: Any) -> None:
+    """Remove the live metrics of the stopped prefork child process."""
+    mark_process_dead(pid)
+
+
+@task_prerun.connect
+def start_task_timer(task_id: str, task: Task, **kwargs: Any) -> None:
+    """Record the time the task waited in the queue and start measuring it."""
+    if not is_enabled():
+        return
+
+    # stamped by the publisher, the clocks of the nodes may differ. The custom
+    # headers are the attributes of the request, or its headers in the eager mode.
+    sent_at: float | None = getattr(task.request, 'sent_at', None) \
+        or (task.request.headers or {}).get('sent_at')
+
+    if sent_at is not None:
+        observe_queue_wait(task.name, time.time() - sent_at)
+
+    _task_starts[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def stop_task_timer(task_id: str, task: Task, **kwargs: Any) -> None:
+    """Record the latency of the task."""
+    start = _task_starts.pop(task_id, None)
+
+    if start is not None:
+        observe_stage(task.name, time.perf_counter() - start)
@@ -1,18 +1,28 @@
+import time
 from typing import Any
 
 from celery import Celery, current_app
 from celery.signals import before_task_publish
+from src.celery.registry import DISPATCH_SCAN_TILES_TASK_NAME, TASK_PACKAGES
 from src.core.config import settings
+from src.core.metrics import is_enabled
+from src.core.serialization import (
+    CONTENT_TYPE,
+    SERIALIZER_NAME,
+    register_serializer,
+)
+
+register_serializer()
 
 celery_app = Celery(
     __name__,
     broker=str(settings.CELERY_BROKER_URL),
     backend=str(settings.CELERY_BACKEND_URL),
 )
-celery_app.conf.event_serializer = 'pickle'
-celery_app.conf.task_serializer = 'pickle'
-celery_app.conf.result_serializer = 'pickle'
-celery_app.conf.accept_content = ['application/json', 'application/x-python-serialize']
+celery_app.conf.event_serializer = 'json'
+celery_app.conf.task_serializer = SERIALIZER_NAME
+celery_app.conf.result_serializer = SERIALIZER_NAME
+celery_app.conf.accept_content = ['application/json', CONTENT_TYPE]
 celery_app.conf.result_extended = True
 celery_app.conf.broker_transport_options = {
     'queue_order_strategy': 'priority',
@@ -20,13 +30,21 @@ celery_app.conf.broker_transport_options = {
     'priority_steps': list(range(5))
 }
 
-celery_app.autodiscover_tasks([
-    'src.celery.nuclick',
-    'src.celery.mc',
-    'src.celery.np',
-    'src.celery.sam',
-    'src.celery.active_learning'
-])
+celery_app.conf.beat_schedule = {
+    # resumes the slide scans whose tile completions were lost
+    'dispatch-scan-tiles': {
+        'task': DISPATCH_SCAN_TILES_TASK_NAME,
+        'schedule': settings.AL_SCAN_DISPATCH_INTERVAL,
+    },
+}
+
+celery_app.autodiscover_tasks(TASK_PACKAGES)
+# Worker signal handlers (model preloading, readiness), imported only by the workers
+celery_app.conf.include = ['src.celery.worker']
+
+if settings.CELERY_PRELOAD_MODELS and not settings.INFERENCE_SERVER_ENABLED:
+    # The prefork child process reports that it is up after the models are preloaded
+    celery_app.conf.worker_proc_alive_timeout = settings.CELERY_PRELOAD_TIMEOUT
 
 
 class _Request:
@@ -43,6 +61,29 @@ class _Request:
         self.task = task
 
 
+def store_pending_result(
+    task_id: str,
+    task_name: str,
+    backend: Any | None = None
+) -> None:
+    """Store the PENDING state of a task in the backend, so the task can be found
+    before its message is published (e.g. the last task of a chain).
+
+    Args:
+        task_id (str): The task ID.
+        task_name (str): The task name.
+        backend (Any | None): The result backend. The app backend is used if None.
+    """
+    backend = backend if backend is not None else current_app.backend
+
+    backend.store_result(
+        task_id,
+        None,
+        'PENDING',
+        request=_Request(task_name)
+    )
+
+
 @before_task_publish.connect
 def create_result_key_in_backend(
     sender: str | None = None,
@@ -63,9 +104,13 @@ def create_result_key_in_backend(
     task_name: str = headers.get('task', '')
 
     if not ignore_result and task_name.startswith('src.'):
-        backend.store_result(
-            headers['id'],
-            None,
-            'PENDING',
-            request=_Request(task_name)
-        )
+        store_pending_result(headers['id'], task_name, backend)
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers: dict[str, Any] | None = None, **kwargs: Any) -> None:
+    """Store the publish time in the task headers, the worker records
+    the time the task waited in the queue (see src.celery.worker).
+    """
+    if headers is not None and is_enabled():
+        headers['sent_at'] = time.time()
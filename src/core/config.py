@@ -3,13 +3,25 @@ from typing import Literal
 
 from pydantic import (
     AnyHttpUrl,
+    Field,
+    NonNegativeFloat,
+    NonNegativeInt,
+    PositiveFloat,
+    PositiveInt,
     PostgresDsn,
     RedisDsn,
+    SecretStr,
     ValidationInfo,
     field_validator,
 )
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+ModelName = Literal['mc_first_stage', 'mc_second_stage', 'np', 'nuclick', 'sam']
+InferenceBackend = Literal['torch', 'torchscript', 'onnx']
+ModelPrecision = Literal['fp32', 'int8_dynamic', 'int8_static']
+CpuAffinity = Literal['none', 'cores', 'numa']
+StainNormalizationScope = Literal['patch', 'tile', 'slide']
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -35,8 +47,62 @@ class Settings(BaseSettings):
 
     CELERY_BROKER_URL: RedisDsn
     CELERY_BACKEND_URL: RedisDsn
+    # Compression of the numpy arrays sent through the broker and the result backend
+    # (lz4 and zstd require the lz4 and zstandard packages)
+    CELERY_ARRAY_COMPRESSION: Literal['none', 'lz4', 'zstd'] = 'none'
+    # Arrays smaller than the threshold (in bytes) are never compressed
+    CELERY_ARRAY_COMPRESSION_THRESHOLD: NonNegativeInt = 64 * 1024
+    # Models loaded when a worker process starts, e.g. ["sam", "nuclick"].
+    # The other models are loaded by the first task using them.
+    CELERY_PRELOAD_MODELS: list[ModelName] = []
+    # Runs a forward pass on a synthetic input after the preloaded model is loaded
+    CELERY_PRELOAD_WARMUP: bool = True
+    # Seconds a prefork worker process may spend preloading the models
+    CELERY_PRELOAD_TIMEOUT: PositiveFloat = 300.0
+    # File created when the worker is ready to process tasks (e.g. for a readiness
+    # probe). With preloading it is created after the models are warmed up.
+    CELERY_READY_FILE: Path | None = None
+    # Processes each tile of the active learning slide scan in one task on the AL queue
+    # (the worker loads the mitotic count models), the chain of the tasks otherwise
+    AL_FUSED_TILES: bool = True
+    # Tiles of the active learning slide scans processed at once for each slide
+    # and for all the slides, the other tiles wait in Redis
+    AL_SCAN_TILES_PER_SLIDE: PositiveInt = 8
+    AL_SCAN_MAX_TILES: PositiveInt = 32
+    # Seconds after which a tile which has not completed (e.g. its worker was lost)
+    # is requeued, at most AL_SCAN_TILE_RETRIES times, then it is dropped
+    AL_SCAN_TILE_TIMEOUT: PositiveFloat = 3600.0
+    AL_SCAN_TILE_RETRIES: NonNegativeInt = 2
+    # Seconds between the periodic starts of the waiting tiles of the slide scans
+    # (requires celery beat), which resume the scans after the lost tiles time out
+    AL_SCAN_DISPATCH_INTERVAL: PositiveFloat = 60.0
+
+    # Runs the models in a single inference server process per node
+    # (python -m src.celery.inference.server), the tasks send it the model inputs
+    INFERENCE_SERVER_ENABLED: bool = False
+    # Unix socket of the inference server
+    INFERENCE_SERVER_ADDRESS: Path = Path('/tmp/annotaid-inference.sock')
+    # Shared secret of the inference server and its clients
+    INFERENCE_SERVER_AUTHKEY: SecretStr | None = None
+    # Maximum number of concurrent requests for the same model run in one batch
+    INFERENCE_MAX_BATCH_SIZE: PositiveInt = 16
+    # Milliseconds to wait for more requests for the same model before the batch
+    # is run. In the worker processes (without the inference server) the requests
+    # are batched only if set, which is useful with the threads pool.
+    INFERENCE_BATCH_WINDOW_MS: NonNegativeFloat = 0.0
+
+    # Collects the Prometheus metrics (requires the prometheus_client package),
+    # exported on /metrics by the API and on METRICS_WORKER_PORT by the workers
+    METRICS_ENABLED: bool = False
+    # Directory of the metrics of the processes of the API or the worker node
+    # (e.g. the prefork processes and the inference server), which is required
+    # with more than one process. It should be emptied before the start.
+    METRICS_MULTIPROC_DIR: Path | None = None
+    METRICS_WORKER_PORT: PositiveInt = 9808
 
     READER_URL: AnyHttpUrl
+    # Number of encoded slide regions cached in each reader worker process
+    READER_REGION_CACHE_SIZE: NonNegativeInt = 16
 
     POSTGRES_SERVER: str
     POSTGRES_USER: str
@@ -77,12 +143,115 @@ class Settings(BaseSettings):
             path=values.data.get('POSTGRES_DB') or ''
         ).unicode_string()
 
+    # Connection pool of the API (asyncpg) engine
+    POSTGRES_POOL_SIZE: PositiveInt = 5
+    POSTGRES_MAX_OVERFLOW: NonNegativeInt = 10
+    # Connection pool of the engine in each Celery worker process (psycopg2)
+    CELERY_POSTGRES_POOL_SIZE: PositiveInt = 2
+    CELERY_POSTGRES_MAX_OVERFLOW: NonNegativeInt = 0
+    # Seconds to wait for a free connection from the pool
+    POSTGRES_POOL_TIMEOUT: PositiveFloat = 30.0
+    # Seconds after which a connection is replaced, -1 disables recycling
+    POSTGRES_POOL_RECYCLE: int = 1800
+    POSTGRES_POOL_PRE_PING: bool = True
+    # Statement timeout in milliseconds, 0 disables the timeout.
+    # It is ignored in the PgBouncer mode, because PgBouncer does not forward
+    # startup parameters (set it with ALTER ROLE ... SET statement_timeout instead).
+    POSTGRES_STATEMENT_TIMEOUT: NonNegativeInt = 0
+    # Disables prepared statements of asyncpg to support PgBouncer
+    # in the transaction pooling mode
+    POSTGRES_PGBOUNCER: bool = False
+
     NUCLICK_MODEL_PATH: Path = Path('./models/nuclick_40x.pth')
     MC_FIRST_STAGE_MODEL_PATH: Path = Path('./models/MC_first_stage.pt')
     MC_SECOND_STAGE_MODEL_PATH: Path = Path('./models/MC_second_stage.pt')
     NP_MODEL_PATH: Path = Path('./models/NP_model.pt')
     SAM_MODEL_PATH: Path = Path('./models/sam_vit_b_01ec64.pth')
     SAM_MODEL_VARIANT: Literal['vit_h', 'vit_b', 'vit_l'] = 'vit_b'
+    # Precision the SAM image embeddings are stored in, the mask decoder
+    # computes in float32 either way
+    SAM_EMBEDDINGS_DTYPE: Literal['float32', 'float16'] = 'float16'
+    # Encoding of the stored low resolution masks (logits) of the SAM predictions,
+    # uint8 quantizes them linearly between their minimum and maximum
+    SAM_MASK_ENCODING: Literal['float32', 'float16', 'uint8'] = 'uint8'
+    # Seconds the SAM embeddings and masks are kept after their last use.
+    # The arrays are compressed as set by CELERY_ARRAY_COMPRESSION.
+    SAM_EMBEDDINGS_TTL: PositiveInt = 3600
+    SAM_MASK_TTL: PositiveInt = 900
+    # Bytes of the stored SAM embeddings and masks, the least recently used
+    # are evicted above it (0 disables the limit)
+    SAM_STORE_MAX_BYTES: NonNegativeInt = 0
+    # Image the H&E stains are estimated on before the stain normalization: patch
+    # (each patch of the models, as they were trained), tile (once per tile, applied
+    # to all its patches) or slide (once per slide on the thumbnail of the tissue mask,
+    # the tasks without a slide estimate the stains per tile)
+    STAIN_NORMALIZATION_SCOPE: StainNormalizationScope = 'tile'
+    # Slides whose stains are cached in each worker process
+    STAIN_CACHE_SIZE: NonNegativeInt = 64
+    # Maximum distance in pixels of the simplified polygons of the NuClick and SAM
+    # masks from their contours (Douglas-Peucker), 0 keeps all the vertices
+    POLYGON_SIMPLIFICATION_TOLERANCE: NonNegativeFloat = 0.0
+    # Directory of the manifests caching the model fingerprints. The manifests
+    # are stored next to the models if not set (the directory must be writable).
+    MODEL_FINGERPRINT_DIR: Path | None = None
+    # Device the models run on, auto selects CUDA if it is available
+    MODEL_DEVICE: Literal['auto', 'cpu', 'cuda'] = 'auto'
+    # Runtime of each model, e.g. {"nuclick": "onnx"}: torch (eager PyTorch,
+    # the default), torchscript or onnx (ONNX Runtime, requires onnxruntime).
+    # The models are exported with python -m src.scripts.export-models.
+    MODEL_BACKENDS: dict[ModelName, InferenceBackend] = {}
+    # Precision of the exported models, e.g. {"np": "int8_static"}: fp32 (the default),
+    # int8_dynamic (int8 weights, activations quantized at runtime) or int8_static
+    # (int8 weights and activations calibrated on tiles). The int8 models are ONNX only,
+    # created with python -m src.scripts.quantize-models.
+    MODEL_PRECISIONS: dict[ModelName, ModelPrecision] = {}
+    # Minimum agreement of the int8 and fp32 predictions (labels of the classifiers,
+    # IoU of the masks of the segmentation models) measured by the quantization,
+    # the fp32 model is used if the int8 model is less accurate
+    MODEL_INT8_MIN_LABEL_AGREEMENT: float = Field(default=0.98, ge=0, le=1)
+    MODEL_INT8_MIN_IOU: float = Field(default=0.95, ge=0, le=1)
+    # Directory of the exported models and their manifests
+    MODEL_EXPORT_DIR: Path = Path('./models/exported')
+    # Graph optimizations applied by ONNX Runtime when the session is created
+    ONNX_GRAPH_OPTIMIZATION: Literal['disable', 'basic', 'extended', 'all'] = 'all'
+    # Threads of ONNX Runtime within and across the operators, 0 uses the threads
+    # of torch in the process (TORCH_NUM_THREADS) and the ONNX Runtime default
+    ONNX_INTRA_OP_THREADS: NonNegativeInt = 0
+    ONNX_INTER_OP_THREADS: NonNegativeInt = 0
+    # Threads of torch (and OpenMP) within an operator in each worker process,
+    # 0 splits the CPUs of the worker between its pool processes
+    TORCH_NUM_THREADS: NonNegativeInt = 0
+    # Threads of torch across the operators, 0 keeps the torch default
+    TORCH_INTEROP_THREADS: NonNegativeInt = 0
+    # Pins the prefork pool processes to disjoint sets of CPUs: none, cores
+    # (the CPUs of the worker are split between the processes) or numa (the processes
+    # are spread over the NUMA nodes and the CPUs of each node are split between them).
+    # The workers of different queues are configured by their own environment.
+    CELERY_CPU_AFFINITY: CpuAffinity = 'none'
+    # Loads the CELERY_PRELOAD_MODELS once in the parent process of the prefork pool,
+    # the child processes share the weights (copy-on-write) instead of loading them
+    CELERY_SHARE_MODELS: bool = False
+
+    @field_validator('CELERY_SHARE_MODELS')
+    @classmethod
+    def validate_share_models(cls, value: bool, values: ValidationInfo) -> bool:
+        """Validate that the shared models run on the CPU, CUDA cannot be
+        initialized in the parent process before the fork.
+
+        Args:
+            value (bool): The value of the field.
+            values (ValidationInfo): The validation information.
+
+        Raises:
+            ValueError: If the models are shared and the device is not the CPU.
+
+        Returns:
+            bool: The value of the field.
+        """
+        if value and values.data.get('MODEL_DEVICE') != 'cpu':
+            raise ValueError('The shared models require MODEL_DEVICE=cpu')
+
+        return value
 
 
 settings = Settings()
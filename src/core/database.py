@@ -1,12 +1,80 @@
+import uuid
 from collections.abc import AsyncGenerator
+from typing import Any, Literal
 
 from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 from .config import settings
 
+
+def get_connect_args(driver: Literal['asyncpg', 'psycopg2']) -> dict[str, Any]:
+    """Get the DBAPI connection arguments for the given driver.
+
+    Args:
+        driver (Literal['asyncpg', 'psycopg2']): The database driver.
+
+    Returns:
+        dict[str, Any]: The connection arguments.
+    """
+    connect_args: dict[str, Any] = {}
+
+    if settings.POSTGRES_PGBOUNCER:
+        if driver == 'asyncpg':
+            # PgBouncer in the transaction pooling mode can route the statements
+            # to a different server connection than the one they were prepared on
+            connect_args.update({
+                'statement_cache_size': 0,
+                'prepared_statement_cache_size': 0,
+                'prepared_statement_name_func': lambda: f'__asyncpg_{uuid.uuid4()}__'
+            })
+
+        return connect_args
+
+    if settings.POSTGRES_STATEMENT_TIMEOUT > 0:
+        if driver == 'asyncpg':
+            connect_args['server_settings'] = {
+                'statement_timeout': str(settings.POSTGRES_STATEMENT_TIMEOUT)
+            }
+        else:
+            connect_args['options'] = \
+                f'-c statement_timeout={settings.POSTGRES_STATEMENT_TIMEOUT}'
+
+    return connect_args
+
+
+def get_engine_options(
+    driver: Literal['asyncpg', 'psycopg2'],
+    pool_size: int,
+    max_overflow: int
+) -> dict[str, Any]:
+    """Get the engine options based on the pool settings.
+
+    Args:
+        driver (Literal['asyncpg', 'psycopg2']): The database driver.
+        pool_size (int): The number of connections kept open in the pool.
+        max_overflow (int): The number of connections allowed above the pool size.
+
+    Returns:
+        dict[str, Any]: The keyword arguments for the engine.
+    """
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': settings.POSTGRES_POOL_TIMEOUT,
+        'pool_recycle': settings.POSTGRES_POOL_RECYCLE,
+        'pool_pre_ping': settings.POSTGRES_POOL_PRE_PING,
+        'connect_args': get_connect_args(driver)
+    }
+
+
 engine = create_async_engine(
-    settings.SQLALCHEMY_DATABASE_URI_ASYNC
+    settings.SQLALCHEMY_DATABASE_URI_ASYNC,
+    **get_engine_options(
+        'asyncpg',
+        pool_size=settings.POSTGRES_POOL_SIZE,
+        max_overflow=settings.POSTGRES_MAX_OVERFLOW
+    )
 )
 
 SessionLocal = sessionmaker(
@@ -0,0 +1,260 @@
+import inspect
+import os
+import time
+from collections.abc import Callable
+from contextlib import AbstractContextManager, nullcontext
+from functools import wraps
+from typing import TYPE_CHECKING, Any, NamedTuple, TypeVar
+
+from .config import settings
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+    from prometheus_client import CollectorRegistry, Histogram
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# The buckets of the latency in seconds, from the decoding of an image
+# to the processing of a whole tile
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0, 120.0, 300.0
+)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# 1 KiB to 256 MiB
+PAYLOAD_BUCKETS = tuple(float(4**exponent * 1024) for exponent in range(10))
+
+
+class _Metrics(NamedTuple):
+    """The histograms of the current process."""
+    stage_seconds: 'Histogram'
+    batch_size: 'Histogram'
+    payload_bytes: 'Histogram'
+    queue_wait_seconds: 'Histogram'
+
+
+def _create_metrics() -> _Metrics | None:
+    """Creates the histograms if the metrics are enabled.
+
+    Returns:
+        _Metrics | None: The histograms, None if the metrics are disabled.
+    """
+    if not settings.METRICS_ENABLED:
+        return None
+
+    if settings.METRICS_MULTIPROC_DIR is not None:
+        # read by prometheus_client when it is imported
+        settings.METRICS_MULTIPROC_DIR.mkdir(parents=True, exist_ok=True)
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = str(settings.METRICS_MULTIPROC_DIR)
+
+    from prometheus_client import Histogram
+
+    return _Metrics(
+        stage_seconds=Histogram(
+            'annotaid_stage_seconds',
+            'Latency of the processing stages, the tasks and the API handlers',
+            ['stage'],
+            buckets=LATENCY_BUCKETS
+        ),
+        batch_size=Histogram(
+            'annotaid_batch_size',
+            'Number of the requests run in one batch by the inference operations',
+            ['op'],
+            buckets=BATCH_SIZE_BUCKETS
+        ),
+        payload_bytes=Histogram(
+            'annotaid_payload_bytes',
+            'Size of the serialized messages and the uploaded request bodies',
+            ['kind'],
+            buckets=PAYLOAD_BUCKETS
+        ),
+        queue_wait_seconds=Histogram(
+            'annotaid_queue_wait_seconds',
+            'Time from the publishing of a task to its start',
+            ['task'],
+            buckets=LATENCY_BUCKETS
+        ),
+    )
+
+
+_metrics = _create_metrics()
+
+# Returned by span if the metrics are disabled, it is reentrant
+_NULL_SPAN: AbstractContextManager[None] = nullcontext()
+
+
+class _Span:
+    """Observes the time spent in the block in the stage histogram."""
+
+    def __init__(self, histogram: 'Histogram') -> None:
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: 'TracebackType | None'
+    ) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+def is_enabled() -> bool:
+    """Checks whether the metrics are collected in the current process."""
+    return _metrics is not None
+
+
+def span(stage: str) -> AbstractContextManager[None]:
+    """Measures the latency of the block as the stage, e.g.
+    `with span('mc.normalize'): ...`.
+
+    Args:
+        stage (str): The name of the stage.
+
+    Returns:
+        AbstractContextManager[None]: The context manager, a shared no-op
+        if the metrics are disabled.
+    """
+    if _metrics is None:
+        return _NULL_SPAN
+
+    return _Span(_metrics.stage_seconds.labels(stage))
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Measures the latency of each call of the function (or the coroutine
+    function) as the stage.
+
+    Args:
+        stage (str): The name of the stage.
+
+    Returns:
+        Callable[[F], F]: The decorator, returning the function unchanged
+        if the metrics are disabled.
+    """
+    def decorator(function: F) -> F:
+        if _metrics is None:
+            return function
+
+        histogram = _metrics.stage_seconds.labels(stage)
+
+        if inspect.iscoroutinefunction(function):
+            @wraps(function)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with _Span(histogram):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper  # type: ignore
+
+        @wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with _Span(histogram):
+                return function(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Records the latency of the stage measured by the caller.
+
+    Args:
+        stage (str): The name of the stage.
+        seconds (float): The latency.
+    """
+    if _metrics is not None:
+        _metrics.stage_seconds.labels(stage).observe(seconds)
+
+
+def observe_batch_size(op: str, size: int) -> None:
+    """Records the number of the requests run in one batch.
+
+    Args:
+        op (str): The name of the inference operation.
+        size (int): The number of the requests.
+    """
+    if _metrics is not None:
+        _metrics.batch_size.labels(op).observe(size)
+
+
+def observe_payload_bytes(kind: str, size: int) -> None:
+    """Records the size of the payload.
+
+    Args:
+        kind (str): The kind of the payload, e.g. the serialized message.
+        size (int): The size in bytes.
+    """
+    if _metrics is not None:
+        _metrics.payload_bytes.labels(kind).observe(size)
+
+
+def observe_queue_wait(task: str, seconds: float) -> None:
+    """Records the time the task waited in the queue.
+
+    Args:
+        task (str): The name of the task.
+        seconds (float): The time between the publishing and the start.
+    """
+    if _metrics is not None:
+        _metrics.queue_wait_seconds.labels(task).observe(max(seconds, 0.0))
+
+
+def get_registry() -> 'CollectorRegistry':
+    """Gets the registry of the exported metrics. With METRICS_MULTIPROC_DIR
+    the metrics of all the processes writing to the directory are collected.
+
+    Returns:
+        CollectorRegistry: The registry.
+    """
+    from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+
+    if settings.METRICS_MULTIPROC_DIR is None:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+
+    return registry
+
+
+def generate_metrics() -> bytes:
+    """Generates the metrics in the Prometheus text format.
+
+    Returns:
+        bytes: The metrics.
+    """
+    from prometheus_client import generate_latest
+
+    return generate_latest(get_registry())
+
+
+def start_metrics_server(port: int) -> None:
+    """Exports the metrics on the HTTP port in a background thread.
+
+    Args:
+        port (int): The port.
+    """
+    from prometheus_client import start_http_server
+
+    start_http_server(port, registry=get_registry())
+
+
+def mark_process_dead(pid: int) -> None:
+    """Removes the live metrics of the stopped process from METRICS_MULTIPROC_DIR.
+
+    Args:
+        pid (int): The process ID.
+    """
+    if _metrics is None or settings.METRICS_MULTIPROC_DIR is None:
+        return
+
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(pid)
@@ -0,0 +1,268 @@
+import importlib
+import struct
+import uuid
+from enum import Enum
+from typing import Any
+
+import msgpack
+import numpy as np
+from kombu.serialization import register
+from pydantic import BaseModel
+
+from .config import settings
+from .metrics import observe_payload_bytes
+
+SERIALIZER_NAME = 'msgpack-numpy'
+CONTENT_TYPE = 'application/x-annotaid-msgpack'
+
+_NDARRAY_EXT = 1
+_TUPLE_EXT = 2
+_UUID_EXT = 3
+_MODEL_EXT = 4
+
+_HEADER_LENGTH = struct.Struct('<I')
+
+# Only the pydantic models defined in the project can be reconstructed
+_ALLOWED_MODEL_PREFIX = 'src.'
+
+
+def _compress(data: bytes | memoryview, codec: str) -> bytes:
+    """Compresses the raw array buffer.
+
+    Args:
+        data (bytes | memoryview): The raw array buffer.
+        codec (str): The compression codec (lz4 or zstd).
+
+    Raises:
+        ImportError: If the library for the codec is not installed.
+
+    Returns:
+        bytes: The compressed buffer.
+    """
+    if codec == 'lz4':
+        import lz4.frame
+        return lz4.frame.compress(data)
+
+    import zstandard
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _decompress(data: bytes | memoryview, codec: str) -> bytes:
+    """Decompresses the raw array buffer.
+
+    Args:
+        data (bytes | memoryview): The compressed buffer.
+        codec (str): The compression codec (lz4 or zstd).
+
+    Raises:
+        ImportError: If the library for the codec is not installed.
+
+    Returns:
+        bytes: The raw array buffer.
+    """
+    if codec == 'lz4':
+        import lz4.frame
+        return lz4.frame.decompress(data)
+
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _encode_ndarray(array: np.ndarray) -> msgpack.ExtType:
+    """Encodes the array as a header (dtype, shape and compression)
+    followed by the raw buffer.
+
+    Args:
+        array (np.ndarray): The array to encode.
+
+    Raises:
+        TypeError: If the array contains Python objects.
+
+    Returns:
+        msgpack.ExtType: The encoded array.
+    """
+    if array.dtype.hasobject:
+        raise TypeError(f'Arrays of type {array.dtype} cannot be serialized')
+
+    # the contiguous copy is at least 1-D, the header keeps the original shape
+    buffer: bytes | memoryview = np.ascontiguousarray(array).data.cast('B')
+    codec = settings.CELERY_ARRAY_COMPRESSION
+
+    if codec == 'none' or array.nbytes < settings.CELERY_ARRAY_COMPRESSION_THRESHOLD:
+        codec = 'none'
+    else:
+        buffer = _compress(buffer, codec)
+
+    header = msgpack.packb([array.dtype.str, array.shape, codec])
+
+    return msgpack.ExtType(
+        _NDARRAY_EXT,
+        b''.join([_HEADER_LENGTH.pack(len(header)), header, buffer])
+    )
+
+
+def _decode_ndarray(data: bytes) -> np.ndarray:
+    """Decodes the array. The uncompressed arrays are not copied,
+    they are read-only views of the message buffer.
+
+    Args:
+        data (bytes): The encoded array.
+
+    Returns:
+        np.ndarray: The decoded array.
+    """
+    (header_length,) = _HEADER_LENGTH.unpack_from(data)
+    offset = _HEADER_LENGTH.size + header_length
+    dtype, shape, codec = msgpack.unpackb(data[_HEADER_LENGTH.size:offset])
+
+    if codec == 'none':
+        buffer: bytes | memoryview = memoryview(data)[offset:]
+    else:
+        buffer = _decompress(memoryview(data)[offset:], codec)
+
+    return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+
+
+def _load_model_class(path: str) -> type[BaseModel]:
+    """Loads the pydantic model class from the project.
+
+    Args:
+        path (str): The path to the class in the format `module:qualname`.
+
+    Raises:
+        TypeError: If the path does not point to a pydantic model of the project.
+
+    Returns:
+        type[BaseModel]: The pydantic model class.
+    """
+    module_name, _, qualname = path.partition(':')
+
+    if not module_name.startswith(_ALLOWED_MODEL_PREFIX):
+        raise TypeError(f'Model {path} cannot be deserialized')
+
+    cls: Any = importlib.import_module(module_name)
+
+    for name in qualname.split('.'):
+        cls = getattr(cls, name)
+
+    if not isinstance(cls, type) or not issubclass(cls, BaseModel):
+        raise TypeError(f'Model {path} cannot be deserialized')
+
+    return cls
+
+
+def _default(obj: Any) -> Any:
+    """Encodes the types that are not supported by msgpack.
+
+    Args:
+        obj (Any): The object to encode.
+
+    Raises:
+        TypeError: If the object type is not supported.
+
+    Returns:
+        Any: The encoded object.
+    """
+    if isinstance(obj, np.ndarray):
+        return _encode_ndarray(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(_TUPLE_EXT, dumps(list(obj)))
+    if isinstance(obj, uuid.UUID):
+        return msgpack.ExtType(_UUID_EXT, obj.bytes)
+    if isinstance(obj, BaseModel):
+        model_class = type(obj)
+        return msgpack.ExtType(_MODEL_EXT, dumps([
+            f'{model_class.__module__}:{model_class.__qualname__}',
+            obj.model_dump(mode='json')
+        ]))
+    if isinstance(obj, Enum):
+        return obj.value
+    # Subclasses of the built-in types (e.g. celery signatures)
+    if isinstance(obj, dict):
+        return dict(obj)
+    if isinstance(obj, list):
+        return list(obj)
+    if isinstance(obj, str):
+        return str(obj)
+    if isinstance(obj, int):
+        return int(obj)
+    if isinstance(obj, float):
+        return float(obj)
+    if isinstance(obj, bytes):
+        return bytes(obj)
+
+    raise TypeError(f'Object of type {type(obj).__name__} cannot be serialized')
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    """Decodes the msgpack extension types.
+
+    Args:
+        code (int): The extension type code.
+        data (bytes): The extension payload.
+
+    Returns:
+        Any: The decoded object.
+    """
+    if code == _NDARRAY_EXT:
+        return _decode_ndarray(data)
+    if code == _TUPLE_EXT:
+        return tuple(loads(data))
+    if code == _UUID_EXT:
+        return uuid.UUID(bytes=data)
+    if code == _MODEL_EXT:
+        path, values = loads(data)
+        return _load_model_class(path).model_validate(values)
+
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serializes the object using msgpack. The numpy arrays are stored
+    as raw buffers with the dtype and shape headers.
+
+    Args:
+        obj (Any): The object to serialize.
+
+    Returns:
+        bytes: The serialized object.
+    """
+    return msgpack.packb(obj, default=_default, use_bin_type=True, strict_types=True)
+
+
+def loads(data: bytes) -> Any:
+    """Deserializes the object serialized by the `dumps` function.
+
+    Args:
+        data (bytes): The serialized object.
+
+    Returns:
+        Any: The deserialized object.
+    """
+    return msgpack.unpackb(
+        data,
+        ext_hook=_ext_hook,
+        raw=False,
+        strict_map_key=False
+    )
+
+
+def _dumps_message(obj: Any) -> bytes:
+    """Serializes the message body and records its size."""
+    data = dumps(obj)
+    observe_payload_bytes('message', len(data))
+
+    return data
+
+
+def register_serializer() -> None:
+    """Registers the serializer in kombu, so it can be used by celery."""
+    register(
+        SERIALIZER_NAME,
+        _dumps_message,
+        loads,
+        content_type=CONTENT_TYPE,
+        content_encoding='binary'
+    )
@@ -1,10 +1,19 @@
 from fastapi import FastAPI
+from starlette.responses import Response
 
 from src.api.api_v1.api import api_router
 from src.core.config import settings
+from src.core.metrics import METRICS_CONTENT_TYPE, generate_metrics
 
 from .middlewares import middleware
 
 app = FastAPI(middleware=middleware)
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
+
+
+if settings.METRICS_ENABLED:
+    @app.get('/metrics', include_in_schema=False)
+    def get_metrics() -> Response:
+        """Endpoint for the Prometheus metrics of the API processes."""
+        return Response(generate_metrics(), media_type=METRICS_CONTENT_TYPE)
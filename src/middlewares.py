@@ -1,3 +1,4 @@
+import time
 from contextvars import ContextVar
 
 from starlette.middleware import Middleware
@@ -9,6 +10,8 @@ from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from starlette.responses import Response
 
+from src.core.metrics import is_enabled, observe_payload_bytes, observe_stage
+
 request_object: ContextVar[Request] = ContextVar('request')
 
 
@@ -23,6 +26,31 @@ class PaginationMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Records the latency of the handlers and the size of the request bodies."""
+
+    async def dispatch(
+        self,
+        request: Request,
+        call_next: RequestResponseEndpoint
+    ) -> Response:
+        start = time.perf_counter()
+        response = await call_next(request)
+
+        # the endpoint matched by the router, the unmatched paths are skipped
+        endpoint = request.scope.get('endpoint')
+
+        if endpoint is not None:
+            observe_stage(f'api.{endpoint.__name__}', time.perf_counter() - start)
+
+        content_length = request.headers.get('content-length')
+
+        if content_length is not None and content_length.isdigit():
+            observe_payload_bytes('request', int(content_length))
+
+        return response
+
+
 middleware = [
     Middleware(
         CORSMiddleware,
@@ -32,4 +60,7 @@ middleware = [
         allow_headers=["*"],
     ),
     Middleware(PaginationMiddleware)
-]
\ No newline at end of file
+]
+
+if is_enabled():
+    middleware.append(Middleware(MetricsMiddleware))
@@ -1,5 +1,28 @@
-from .mc.predict import predict_first_stage as predict_mc_first_stage
-from .mc.predict import predict_second_stage as predict_mc_second_stage
-from .np.predict import predict_nuclear_pleomorphism
-from .nuclick.architecture import NuClick_NN
-from .nuclick.predict import predict as predict_nuclick
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .mc.predict import predict_first_stage as predict_mc_first_stage
+    from .mc.predict import predict_second_stage as predict_mc_second_stage
+    from .np.predict import predict_nuclear_pleomorphism
+    from .nuclick.architecture import NuClick_NN
+    from .nuclick.predict import predict as predict_nuclick
+
+# The models are imported on the first access, so importing the package
+# (e.g. for the custom types) does not import torch
+_LAZY_IMPORTS = {
+    'predict_mc_first_stage': ('.mc.predict', 'predict_first_stage'),
+    'predict_mc_second_stage': ('.mc.predict', 'predict_second_stage'),
+    'predict_nuclear_pleomorphism': ('.np.predict', 'predict_nuclear_pleomorphism'),
+    'NuClick_NN': ('.nuclick.architecture', 'NuClick_NN'),
+    'predict_nuclick': ('.nuclick.predict', 'predict'),
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    module_name, attribute = _LAZY_IMPORTS[name]
+
+    return getattr(import_module(module_name, __name__), attribute)
@@ -1,35 +1,46 @@
-import albumentations as A
 import numpy as np
 import torch
-from albumentations.pytorch import ToTensorV2
-from monai.apps.pathology.transforms.stain.array import NormalizeHEStains
 from patchify import patchify
 from torch.nn import functional as F
 from torchvision.models import EfficientNet
 from ultralytics import YOLO
 from ultralytics.engine.results import Results
 
+from src.core.metrics import timed
+from src.models.stain import (
+    StainParameters,
+    has_tissue,
+    normalize_he_stains,
+    normalize_stains,
+    normalize_stains_batch,
+)
+
 from .custom_types import MitosisPrediction
-from .transforms import NormalizeHEStainsWrapper
+from .transforms import resize_patches, to_model_input
 
 FIRST_STAGE_PATCH_SIZE = (512, 512, 3)
+SECOND_STAGE_PATCH_SIZE = 64
+SECOND_STAGE_MEAN = (0.77986992, 0.54518602, 0.7211757)
+SECOND_STAGE_STD = (0.10058567, 0.12314448, 0.07771834)
 
 
+@timed('mc.first_stage')
 @torch.no_grad()
 def predict_first_stage(
     model: YOLO,
     image: np.ndarray,
+    stain_parameters: StainParameters | None = None
 ) -> list[np.ndarray]:
     """Predicts the mitotic candidates in the input image using the first stage model.
 
     Args:
         model (YOLO): The first stage model.
         image (np.ndarray): The input image.
+        stain_parameters (StainParameters | None): The stain parameters of the image,
+        the stains are estimated on each patch if not given.
     Returns:
         list[np.ndarray]: The bounding boxes of the mitotic candidates.
     """
-    normalizer = NormalizeHEStains()
-
     patches = patchify(
         image,
         FIRST_STAGE_PATCH_SIZE,
@@ -44,9 +55,14 @@ def predict_first_stage(
         for col_index in range(n_cols):
             patch = patches[row_index, col_index].squeeze()
 
-            try:
-                patch = normalizer(patch)
-            except ValueError:
+            if stain_parameters is None:
+                try:
+                    patch = normalize_he_stains(patch)
+                except ValueError:
+                    continue
+            elif has_tissue(patch):
+                patch = normalize_stains(patch, stain_parameters)
+            else:
                 continue
 
             prediction: Results = model.predict(patch)[0].cpu()
@@ -111,13 +127,56 @@ def _extract_patch_second_stage(
     return image[patch_y1:patch_y2, patch_x1:patch_x2]
 
 
+def prepare_second_stage_patches(
+    image: np.ndarray,
+    bboxes: list[np.ndarray],
+    stain_parameters: StainParameters | None = None
+) -> list[tuple[np.ndarray, torch.Tensor]]:
+    """Extracts the patches of the mitotic candidates and transforms them
+    to the model input. The patches which cannot be stain normalized are skipped.
+
+    Args:
+        image (np.ndarray): The input image.
+        bboxes (list[np.ndarray]): The bounding boxes of the mitotic candidates.
+        stain_parameters (StainParameters | None): The stain parameters of the image,
+        the stains are estimated on each patch if not given.
+    Returns:
+        list[tuple[np.ndarray, torch.Tensor]]: The bounding box
+        and the transformed patch of each candidate.
+    """
+    if not bboxes:
+        return []
+
+    patches = resize_patches(
+        [_extract_patch_second_stage(image=image, bbox=bbox) for bbox in bboxes],
+        SECOND_STAGE_PATCH_SIZE
+    )
+
+    # the candidates are normalized together, the background ones are skipped
+    patches, normalized = normalize_stains_batch(patches, stain_parameters)
+
+    inputs = to_model_input(
+        patches[normalized],
+        mean=SECOND_STAGE_MEAN,
+        std=SECOND_STAGE_STD
+    )
+
+    normalized_bboxes = [
+        bbox for bbox, is_normalized in zip(bboxes, normalized) if is_normalized
+    ]
+
+    return list(zip(normalized_bboxes, inputs))
+
+
+@timed('mc.classify')
 @torch.no_grad()
 def predict_second_stage(
     model: EfficientNet,
     image: np.ndarray,
     bboxes: list[np.ndarray],
     device: torch.device,
-    model_hash: str | None = None
+    model_hash: str | None = None,
+    stain_parameters: StainParameters | None = None
 ) -> list[MitosisPrediction]:
     """Classifies the mitotic candidates in the input image
     using the second stage model.
@@ -127,46 +186,20 @@ def predict_second_stage(
         image (np.ndarray): The input image.
         bboxes (list[np.ndarray]): The bounding boxes of the mitotic candidates.
         device (torch.device): The device to use for inference.
+        model_hash (str | None): The hash of the model stored with the results.
+        stain_parameters (StainParameters | None): The stain parameters of the image,
+        the stains are estimated on each patch if not given.
     Returns:
         list[MitosisPrediction]: The classification results.
     """
-    stain_normalize = A.Compose(
-        [
-            A.Resize(64, 64),
-            NormalizeHEStainsWrapper()
-        ]
-    )
-    basic_transforms = A.Compose(
-        [
-            stain_normalize,
-            A.Normalize(
-                mean=(0.77986992, 0.54518602, 0.7211757),
-                std=(0.10058567, 0.12314448, 0.07771834)
-            ),
-            ToTensorV2()
-        ]
-    )
-
     model.eval()
     model.to(device)
 
-    patches = (
-        _extract_patch_second_stage(
-            image=image,
-            bbox=bbox
-        )
-        for bbox in bboxes
-    )
-
     results: list[MitosisPrediction] = []
 
-    for patch, bbox in zip(patches, bboxes):
-        try:
-            patch = stain_normalize(image=patch)['image']
-            patch = basic_transforms(image=patch)['image']
-        except ValueError:
-            continue
+    patches = prepare_second_stage_patches(image, bboxes, stain_parameters)
 
+    for bbox, patch in patches:
         tensor_patch: torch.Tensor = patch[None, ...]
         tensor_patch = tensor_patch.to(device)
 
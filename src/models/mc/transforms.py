@@ -1,17 +1,44 @@
-from typing import Any
-
+import cv2
 import numpy as np
-from albumentations.core.transforms_interface import ImageOnlyTransform
-from monai.apps.pathology.transforms.stain.array import NormalizeHEStains
+import torch
+
+
+def resize_patches(patches: list[np.ndarray], size: int) -> np.ndarray:
+    """Resizes the patches as A.Resize does and stacks them.
+
+    Args:
+        patches (list[np.ndarray]): The RGB patches.
+        size (int): The height and the width of the resized patches.
+
+    Returns:
+        np.ndarray: The stack of the resized patches, Nxsizexsizex3.
+    """
+    return np.stack([
+        patch if patch.shape[:2] == (size, size)
+        else cv2.resize(patch, (size, size), interpolation=cv2.INTER_LINEAR)
+        for patch in patches
+    ])
+
+
+def to_model_input(
+    images: np.ndarray,
+    mean: tuple[float, float, float],
+    std: tuple[float, float, float]
+) -> torch.Tensor:
+    """Normalizes the stack of the uint8 images as A.Normalize does
+    and converts it to the NCHW tensor as ToTensorV2 does.
 
+    Args:
+        images (np.ndarray): The images, NxHxWx3.
+        mean (tuple[float, float, float]): The mean of each channel in [0, 1].
+        std (tuple[float, float, float]): The standard deviation of each channel.
 
-class NormalizeHEStainsWrapper(ImageOnlyTransform):
-    """Wrapper for the NormalizeHEStains class from MONAI."""
+    Returns:
+        torch.Tensor: The float32 model input, Nx3xHxW.
+    """
+    mean_array = np.array(mean, dtype=np.float32) * 255
+    denominator = np.reciprocal(np.array(std, dtype=np.float32) * 255)
 
-    def __init__(self, always_apply: bool = True, p: float = 1.0) -> None:
-        super().__init__(always_apply, p)
-        self.normalizer = NormalizeHEStains()
+    normalized = (images.astype(np.float32) - mean_array) * denominator
 
-    def apply(self, img: np.ndarray, **params: Any) -> np.ndarray:
-        image = self.normalizer(np.array(img))
-        return image
+    return torch.from_numpy(normalized.transpose(0, 3, 1, 2))
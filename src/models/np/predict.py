@@ -1,20 +1,57 @@
-import albumentations as A
 import numpy as np
 import torch
 import torch.nn as nn
-from albumentations.pytorch import ToTensorV2
 from patchify import patchify
 
-from src.models.mc.transforms import NormalizeHEStainsWrapper
+from src.core.metrics import timed
+from src.models.mc.transforms import resize_patches, to_model_input
+from src.models.stain import StainParameters, normalize_stains_batch
 
 PATCH_SIZE = (256, 256, 3)
+INPUT_SIZE = 260
+MEAN = (0.7869035601615906, 0.6227355599403381, 0.7037901878356934)
+STD = (0.16848863661289215, 0.21331951022148132, 0.15994398295879364)
 
 
+def prepare_patches(
+    image: np.ndarray,
+    stain_parameters: StainParameters | None = None
+) -> list[torch.Tensor]:
+    """Splits the image into the patches and transforms them to the model input.
+    The patches which cannot be stain normalized (e.g. the background) are skipped.
+
+    Args:
+        image (np.ndarray): The input image.
+        stain_parameters (StainParameters | None): The stain parameters of the image,
+        the stains are estimated on each patch if not given.
+    Returns:
+        list[torch.Tensor]: The transformed patches.
+    """
+    patches = patchify(
+        image,
+        PATCH_SIZE,
+        step=PATCH_SIZE[0]
+    ).reshape(-1, *PATCH_SIZE)
+
+    if len(patches) == 0:
+        return []
+
+    # the patches are normalized together, the background ones are skipped
+    patches, normalized = normalize_stains_batch(
+        resize_patches(list(patches), INPUT_SIZE),
+        stain_parameters
+    )
+
+    return list(to_model_input(patches[normalized], mean=MEAN, std=STD))
+
+
+@timed('np.predict')
 @torch.no_grad()
 def predict_nuclear_pleomorphism(
     model: nn.Module,
     image: np.ndarray,
-    device: torch.device
+    device: torch.device,
+    stain_parameters: StainParameters | None = None
 ) -> int | None:
     """Predicts the nuclear pleomorphism score of a given image.
 
@@ -22,48 +59,24 @@ def predict_nuclear_pleomorphism(
         model (nn.Module): The nuclear pleomorphism model.
         image (np.ndarray): The input image.
         device (torch.device): The device to use for the prediction.
+        stain_parameters (StainParameters | None): The stain parameters of the image,
+        the stains are estimated on each patch if not given.
     Returns:
         int | None: The predicted nuclear pleomorphism score.
     """
     model.eval()
     model.to(device)
 
-    transforms = A.Compose([
-        A.Resize(260, 260),
-        NormalizeHEStainsWrapper(),
-        A.Normalize(
-            mean=(0.7869035601615906, 0.6227355599403381, 0.7037901878356934),
-            std=(0.16848863661289215, 0.21331951022148132, 0.15994398295879364)
-        ),
-        ToTensorV2()
-    ])
-
-    patches = patchify(
-        image,
-        PATCH_SIZE,
-        step=PATCH_SIZE[0]
-    )
-
     predicted_labels = []
 
-    n_rows, n_cols = patches.shape[:2]
-
-    for row_index in range(n_rows):
-        for col_index in range(n_cols):
-            patch = patches[row_index, col_index].squeeze()
-
-            try:
-                patch = transforms(image=patch)['image']
-            except ValueError:
-                continue
-
-            tensor_patch: torch.Tensor = patch[None, ...]
-            tensor_patch = tensor_patch.to(device)
+    for patch in prepare_patches(image, stain_parameters):
+        tensor_patch: torch.Tensor = patch[None, ...]
+        tensor_patch = tensor_patch.to(device)
 
-            prediction = model(tensor_patch).cpu()
-            label = prediction.argmax().numpy()
+        prediction = model(tensor_patch).cpu()
+        label = prediction.argmax().numpy()
 
-            predicted_labels.append(label)
+        predicted_labels.append(label)
 
     if len(predicted_labels) == 0:
         return None
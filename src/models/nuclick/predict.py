@@ -2,12 +2,9 @@ from typing import Any
 
 import numpy as np
 import torch
-from skimage.morphology import (
-    reconstruction,
-    remove_small_holes,
-    remove_small_objects,
-)
+from scipy import ndimage
 
+from src.core.metrics import timed
 from src.schemas.nuclick import Keypoint
 
 from .architecture import NuClick_NN
@@ -123,6 +120,44 @@ def get_patches_and_signals(
     return patches, nuc_points, other_points
 
 
+def _label_masks(masks: np.ndarray, connectivity: int) -> tuple[np.ndarray, int]:
+    """Labels the connected components of each 2D mask of the stack in one pass,
+    the components do not connect across the masks.
+
+    Args:
+        masks (np.ndarray): The boolean masks, NxHxW.
+        connectivity (int): The connectivity within a mask, 1 (the 4-neighbors)
+        or 2 (the 8-neighbors).
+
+    Returns:
+        tuple[np.ndarray, int]: The labels of the components and their number.
+    """
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = ndimage.generate_binary_structure(2, connectivity)
+
+    return ndimage.label(masks, structure=structure)
+
+
+def _remove_small_components(masks: np.ndarray, min_size: int) -> np.ndarray:
+    """Removes the 4-connected components smaller than min_size from each mask
+    as remove_small_objects of scikit-image does for a 2D mask.
+
+    Args:
+        masks (np.ndarray): The boolean masks, NxHxW.
+        min_size (int): The minimum size of the kept components.
+
+    Returns:
+        np.ndarray: The boolean masks without the small components.
+    """
+    labels, _ = _label_masks(masks, connectivity=1)
+    sizes = np.bincount(labels.ravel())
+
+    keep = sizes >= min_size
+    keep[0] = False
+
+    return keep[labels]
+
+
 def post_processing(
     preds: np.ndarray,
     thresh: float = 0.33,
@@ -131,22 +166,38 @@ def post_processing(
     do_reconstruction: bool = False,
     nuc_points: np.ndarray | None = None
 ) -> np.ndarray:
-    masks = preds > thresh
-    masks: np.ndarray = remove_small_objects(masks, min_size=min_size)  # type: ignore
-    masks: np.ndarray = remove_small_holes(  # type: ignore
-        masks,
-        area_threshold=min_hole
-    )
-
-    if do_reconstruction:
-        for i in range(len(masks)):
-            this_mask = masks[i]
-            this_marker = nuc_points[i, 0, :, :] > 0  # type: ignore
-            try:
-                this_mask = reconstruction(this_marker, this_mask)
-                masks[i] = np.array([this_mask])
-            except Exception as e:
-                print(e)
+    """Thresholds the predicted masks, removes their small objects and holes
+    and, optionally, keeps only the objects of the clicked nuclei. Each mask
+    is processed as a 2D image, the whole stack is labelled at once.
+
+    Args:
+        preds (np.ndarray): The predicted probabilities, NxHxW.
+        thresh (float): The threshold of the probabilities.
+        min_size (int): The minimum size of the objects.
+        min_hole (int): The minimum size of the kept holes.
+        do_reconstruction (bool): Whether to keep only the objects connected
+        to the clicks (the reconstruction by dilation from the clicks).
+        nuc_points (np.ndarray | None): The signal of the click of each mask,
+        Nx1xHxW, required for the reconstruction.
+
+    Returns:
+        np.ndarray: The boolean masks, NxHxW.
+    """
+    masks = _remove_small_components(preds > thresh, min_size)
+    masks = ~_remove_small_components(~masks, min_hole)
+
+    if do_reconstruction and nuc_points is not None:
+        markers = nuc_points[:, 0] > 0
+        labels, count = _label_masks(masks, connectivity=2)
+
+        # the objects under the clicks
+        clicked = np.zeros(count + 1, dtype=bool)
+        clicked[labels[markers]] = True
+        clicked[0] = False
+
+        # the masks not covering their click are kept as they are
+        missed = (markers & ~masks).any(axis=(1, 2))
+        masks = np.where(missed[:, None, None], masks, clicked[labels])
 
     return masks
 
@@ -156,28 +207,50 @@ def get_instance_map(
     bounding_boxes: list[BoundingBox],
     image_shape: tuple[int, int]
 ) -> np.ndarray:
-    image_height, image_width = image_shape
-
-    instance_map = np.zeros((image_height, image_width), dtype=np.uint16)
+    """Pastes the masks of the patches into their windows of the map of the nuclei
+    instances, the nucleus i is labelled i + 1. The later masks win where
+    they overlap.
+
+    Args:
+        masks (np.ndarray): The boolean masks of the patches, NxHxW.
+        bounding_boxes (list[BoundingBox]): The bounding box of each patch.
+        image_shape (tuple[int, int]): The height and the width of the image.
+
+    Returns:
+        np.ndarray: The uint16 instance map of the image.
+    """
+    instance_map = np.zeros(image_shape, dtype=np.uint16)
+
+    for index, (mask, (x_start, y_start, _, _)) in enumerate(
+        zip(masks, bounding_boxes)
+    ):
+        mask_height, mask_width = mask.shape
+
+        # the window of the patch in the map, the later masks overwrite it
+        window = instance_map[
+            y_start:y_start + mask_height,
+            x_start:x_start + mask_width
+        ]
+        window[mask] = index + 1
 
-    for i in range(len(masks)):
-        this_bb = bounding_boxes[i]
-        this_mask_pos = np.argwhere(masks[i] > 0)
-        this_mask_pos[:, 0] = this_mask_pos[:, 0] + this_bb[1]
-        this_mask_pos[:, 1] = this_mask_pos[:, 1] + this_bb[0]
-        instance_map[this_mask_pos[:, 0], this_mask_pos[:, 1]] = i + 1
     return instance_map
 
 
-@torch.no_grad()
-def predict(
-    model: NuClick_NN,
+def prepare_input(
     image: np.ndarray,
-    keypoints: list[Keypoint],
-    device: torch.device
-) -> np.ndarray[Any, np.dtype[np.uint8]]:
-    model.eval()
-
+    keypoints: list[Keypoint]
+) -> tuple[np.ndarray, np.ndarray, list[BoundingBox]]:
+    """Prepares the model input, a patch around each keypoint with the signal
+    of the keypoint and the signal of the other keypoints.
+
+    Args:
+        image (np.ndarray): The input image.
+        keypoints (list[Keypoint]): The user-defined keypoints.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, list[BoundingBox]]: The model input,
+        the signal of each keypoint and the bounding box of each patch.
+    """
     image_shape = image.shape[:2]
 
     click_map, bounding_boxes = get_clickmap_boundingbox(
@@ -201,6 +274,24 @@ def predict(
     input = np.concatenate(
         (patches, nuc_points, other_points),
         axis=1, dtype=np.float32)
+
+    return input, nuc_points, bounding_boxes
+
+
+@timed('nuclick.predict')
+@torch.no_grad()
+def predict(
+    model: NuClick_NN,
+    image: np.ndarray,
+    keypoints: list[Keypoint],
+    device: torch.device
+) -> np.ndarray[Any, np.dtype[np.uint8]]:
+    model.eval()
+
+    image_shape = image.shape[:2]
+
+    input, nuc_points, bounding_boxes = prepare_input(image, keypoints)
+
     input = torch.from_numpy(input)
     input = input.to(device=device, dtype=torch.float32, non_blocking=True)
 
@@ -0,0 +1,316 @@
+from typing import TypedDict
+
+import numpy as np
+
+# The defaults of NormalizeHEStains of MONAI (the Macenko method)
+TRANSMITTED_INTENSITY = 240
+ANGLE_PERCENTILE = 1
+ABSORBANCE_THRESHOLD = 0.15
+MAX_CONCENTRATION_PERCENTILE = 99
+TARGET_STAIN_MATRIX = np.array(
+    ((0.5626, 0.2159), (0.7201, 0.8012), (0.4062, 0.5581)),
+    dtype=np.float32
+)
+TARGET_MAX_CONCENTRATIONS = np.array((1.9705, 1.0308), dtype=np.float32)
+
+# The absorbance (optical density) of each 8-bit intensity
+_ABSORBANCE_TABLE = -np.log(np.minimum(
+    np.arange(256, dtype=np.float32) + 1,
+    TRANSMITTED_INTENSITY
+) / TRANSMITTED_INTENSITY)
+
+
+class StainParameters(TypedDict):
+    """The stains of an image, estimated once and applied to any of its patches."""
+    # The absorbance of the hematoxylin and the eosin (the columns), 3x2
+    stain_matrix: np.ndarray
+    # The 99th percentile of the concentration of each stain
+    max_concentrations: np.ndarray
+
+
+def _to_absorbance(image: np.ndarray) -> np.ndarray:
+    """Converts the RGB intensities to the absorbance.
+
+    Args:
+        image (np.ndarray): The RGB image (or images) with the values in [0, 255].
+
+    Returns:
+        np.ndarray: The float32 absorbance of the same shape.
+    """
+    if image.dtype == np.uint8:
+        return _ABSORBANCE_TABLE[image]
+
+    intensities = np.minimum(image.astype(np.float32) + 1, TRANSMITTED_INTENSITY)
+
+    return -np.log(intensities / TRANSMITTED_INTENSITY)
+
+
+def has_tissue(image: np.ndarray) -> bool:
+    """Checks whether the image contains a stained pixel, the stains cannot be
+    estimated on the background.
+
+    Args:
+        image (np.ndarray): The RGB image.
+
+    Returns:
+        bool: True if any pixel is above the absorbance threshold in all channels.
+    """
+    return bool(np.all(_to_absorbance(image) > ABSORBANCE_THRESHOLD, axis=-1).any())
+
+
+def estimate_stain_parameters(image: np.ndarray) -> StainParameters:
+    """Estimates the stain matrix and the maximum concentrations of the image
+    as NormalizeHEStains of MONAI does before the normalization.
+
+    Args:
+        image (np.ndarray): The RGB image, e.g. the tile or the slide thumbnail.
+
+    Raises:
+        ValueError: If all the pixels are below the absorbance threshold
+        (the background).
+
+    Returns:
+        StainParameters: The stain parameters.
+    """
+    absorbance = _to_absorbance(image).reshape(-1, 3)
+
+    # the transparent pixels are excluded from the stain vectors
+    stained = absorbance[np.all(absorbance > ABSORBANCE_THRESHOLD, axis=1)]
+
+    if len(stained) == 0:
+        raise ValueError(
+            'All pixels of the input image are below the absorbance threshold.'
+        )
+
+    # the plane of the two largest eigenvectors
+    _, eigenvectors = np.linalg.eigh(np.cov(stained.T).astype(np.float32))
+    plane = eigenvectors[:, 1:3]
+
+    projection = stained @ plane
+    angles = np.arctan2(projection[:, 1], projection[:, 0])
+    min_angle, max_angle = np.percentile(
+        angles,
+        (ANGLE_PERCENTILE, 100 - ANGLE_PERCENTILE)
+    )
+
+    v_min = plane @ np.array((np.cos(min_angle), np.sin(min_angle)), dtype=np.float32)
+    v_max = plane @ np.array((np.cos(max_angle), np.sin(max_angle)), dtype=np.float32)
+
+    # the hematoxylin is the first stain
+    if v_min[0] > v_max[0]:
+        stain_matrix = np.stack((v_min, v_max), axis=1)
+    else:
+        stain_matrix = np.stack((v_max, v_min), axis=1)
+
+    # the least squares concentrations of all the pixels
+    concentrations = absorbance @ np.linalg.pinv(stain_matrix).T
+
+    return {
+        'stain_matrix': stain_matrix.astype(np.float32),
+        'max_concentrations': np.percentile(
+            concentrations,
+            MAX_CONCENTRATION_PERCENTILE,
+            axis=0
+        ).astype(np.float32),
+    }
+
+
+def _masked_percentile(
+    values: np.ndarray,
+    mask: np.ndarray,
+    percentiles: tuple[float, ...]
+) -> np.ndarray:
+    """Computes the percentiles of the masked values of each row as np.percentile
+    (the linear interpolation) does.
+
+    Args:
+        values (np.ndarray): The values, NxP.
+        mask (np.ndarray): The values included in the percentiles, NxP.
+        percentiles (tuple[float, ...]): The percentiles in [0, 100].
+
+    Returns:
+        np.ndarray: The percentiles of each row, Nxlen(percentiles).
+    """
+    # the excluded values are sorted after the included ones
+    values = np.sort(np.where(mask, values, np.inf), axis=1)
+    last = np.maximum(mask.sum(axis=1), 1)[:, None] - 1
+
+    positions = last * (np.asarray(percentiles) / 100)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, last)
+
+    lower_values = np.take_along_axis(values, lower, axis=1)
+    upper_values = np.take_along_axis(values, upper, axis=1)
+
+    return lower_values + (upper_values - lower_values) * (positions - lower)
+
+
+def estimate_stain_parameters_batch(
+    images: np.ndarray
+) -> tuple[StainParameters, np.ndarray]:
+    """Estimates the stains of each image of the stack in a single pass,
+    as estimate_stain_parameters does for one image.
+
+    Args:
+        images (np.ndarray): The RGB images of the same size, NxHxWx3.
+
+    Returns:
+        tuple[StainParameters, np.ndarray]: The stain parameters with the leading
+        dimension of the images and the mask of the fitted images. The images
+        with less than two stained pixels (the background) are not fitted,
+        their parameters are the target stains.
+    """
+    count = len(images)
+    absorbance = _to_absorbance(images).reshape(count, -1, 3)
+
+    stained = np.all(absorbance > ABSORBANCE_THRESHOLD, axis=2)
+    stained_counts = stained.sum(axis=1)
+    fitted = stained_counts > 1
+
+    stain_matrix = np.broadcast_to(TARGET_STAIN_MATRIX, (count, 3, 2)).copy()
+    max_concentrations = np.broadcast_to(
+        TARGET_MAX_CONCENTRATIONS,
+        (count, 2)
+    ).copy()
+
+    if not fitted.any():
+        return {
+            'stain_matrix': stain_matrix,
+            'max_concentrations': max_concentrations,
+        }, fitted
+
+    absorbance = absorbance[fitted]
+    stained = stained[fitted]
+    stained_counts = stained_counts[fitted]
+
+    # the covariance of the stained pixels of each image
+    weights = stained[..., None].astype(np.float32)
+    means = (absorbance * weights).sum(axis=1) / stained_counts[:, None].astype(
+        np.float32
+    )
+    centered = (absorbance - means[:, None]) * weights
+    covariances = np.swapaxes(centered, 1, 2) @ centered
+    covariances /= (stained_counts - 1)[:, None, None]
+
+    # the planes of the two largest eigenvectors
+    _, eigenvectors = np.linalg.eigh(covariances)
+    planes = eigenvectors[..., 1:3]
+
+    projections = absorbance @ planes
+    angles = np.arctan2(projections[..., 1], projections[..., 0])
+    min_angles, max_angles = _masked_percentile(
+        angles,
+        stained,
+        (ANGLE_PERCENTILE, 100 - ANGLE_PERCENTILE)
+    ).T
+
+    v_min = planes @ np.stack((np.cos(min_angles), np.sin(min_angles)), axis=1)[
+        ..., None
+    ].astype(np.float32)
+    v_max = planes @ np.stack((np.cos(max_angles), np.sin(max_angles)), axis=1)[
+        ..., None
+    ].astype(np.float32)
+
+    # the hematoxylin is the first stain
+    swapped = (v_min[:, 0] > v_max[:, 0])[:, None]
+    fitted_stain_matrix = np.where(
+        swapped,
+        np.concatenate((v_min, v_max), axis=2),
+        np.concatenate((v_max, v_min), axis=2)
+    )
+
+    # the least squares concentrations of all the pixels
+    concentrations = absorbance @ np.swapaxes(np.linalg.pinv(fitted_stain_matrix), 1, 2)
+
+    stain_matrix[fitted] = fitted_stain_matrix
+    max_concentrations[fitted] = np.percentile(
+        concentrations,
+        MAX_CONCENTRATION_PERCENTILE,
+        axis=1
+    )
+
+    return {
+        'stain_matrix': stain_matrix,
+        'max_concentrations': max_concentrations,
+    }, fitted
+
+
+def normalize_stains(
+    image: np.ndarray,
+    stain_parameters: StainParameters
+) -> np.ndarray:
+    """Normalizes the stains of the image (or a stack of the images) to the target
+    stains. The concentrations are rescaled and reconstructed in a single linear
+    transform of the absorbance.
+
+    Args:
+        image (np.ndarray): The RGB image, the last axis are the channels.
+        stain_parameters (StainParameters): The stain parameters estimated
+        on the image or on the tile (slide) it is cropped from. The parameters
+        of a stack of the images may have the leading dimension of the images.
+
+    Returns:
+        np.ndarray: The normalized uint8 image of the same shape.
+    """
+    scale = TARGET_MAX_CONCENTRATIONS / stain_parameters['max_concentrations']
+    transforms = (TARGET_STAIN_MATRIX * scale[..., None, :]) @ np.linalg.pinv(
+        stain_parameters['stain_matrix']
+    )
+    transforms = np.swapaxes(transforms, -1, -2).astype(np.float32)
+
+    if transforms.ndim == 2:
+        absorbance = _to_absorbance(image) @ transforms
+    else:
+        # the transform of each image of the stack
+        absorbance = (
+            _to_absorbance(image).reshape(len(image), -1, 3) @ transforms
+        ).reshape(image.shape)
+    normalized = TRANSMITTED_INTENSITY * np.exp(-absorbance)
+
+    # the overflowing intensities are set to 254 by MONAI
+    normalized[normalized > 255] = 254
+
+    return normalized.astype(np.uint8)
+
+
+def normalize_he_stains(image: np.ndarray) -> np.ndarray:
+    """Estimates the stains of the image and normalizes it,
+    the drop-in replacement of NormalizeHEStains of MONAI.
+
+    Args:
+        image (np.ndarray): The RGB image.
+
+    Raises:
+        ValueError: If the image is the background.
+
+    Returns:
+        np.ndarray: The normalized uint8 image.
+    """
+    return normalize_stains(image, estimate_stain_parameters(image))
+
+
+def normalize_stains_batch(
+    images: np.ndarray,
+    stain_parameters: StainParameters | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Normalizes the stains of the stack of the images in a single pass.
+    The images which cannot be normalized (the background) are reported
+    by the mask instead of raising ValueError.
+
+    Args:
+        images (np.ndarray): The RGB images of the same size, NxHxWx3.
+        stain_parameters (StainParameters | None): The stain parameters shared
+        by the images (e.g. of their tile), the stains are estimated
+        on each image if not given.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The normalized uint8 images and the mask
+        of the normalized images, the other images are undefined.
+    """
+    if stain_parameters is None:
+        stain_parameters, normalized = estimate_stain_parameters_batch(images)
+    else:
+        absorbance = _to_absorbance(images).reshape(len(images), -1, 3)
+        normalized = np.all(absorbance > ABSORBANCE_THRESHOLD, axis=2).any(axis=1)
+
+    return normalize_stains(images, stain_parameters), normalized
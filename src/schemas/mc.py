@@ -8,7 +8,7 @@ from pydantic import BaseModel, Field, NonNegativeFloat, field_validator
 from src.schemas.nuclick import Keypoint
 from src.utils.utils import read_file
 
-from .shared import BoundingBox
+from .shared import BoundingBox, ImageSourceRequest
 
 
 class MitosisLabel(str, Enum):
@@ -34,14 +34,11 @@ class Mitosis(BaseModel):
         return round(value, 3)
 
 
-class MCPredictRequest(BaseModel):
+class MCPredictRequest(ImageSourceRequest):
     """Represents a request containing information about an image.
     The image must be at least 512x512px.
+    When the region is provided, the offset defaults to the origin of the region.
     """
-    image: str = Field(
-        default=...,
-        description="A base64-encoded string representing an RGB image."
-    )
     offset: Keypoint | None = Field(
         default=None,
         description="An optional keypoint representing the offset "
@@ -55,6 +52,15 @@ class MCPredictRequest(BaseModel):
                     "image": read_file(Path('./src/examples/image_512.txt')),
                     "offset": {"x": 1000, "y": 1500}
                 },
+                {
+                    "region": {
+                        "slide_path": "/mnt/slide_HE.vsi",
+                        "x": 1000,
+                        "y": 1500,
+                        "w": 512,
+                        "h": 512
+                    }
+                },
             ]
         }
     }
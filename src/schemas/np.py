@@ -3,10 +3,12 @@ from __future__ import annotations
 from enum import Enum
 from pathlib import Path
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 
 from src.utils.utils import read_file
 
+from .shared import ImageSourceRequest
+
 
 class NPLabel(str, Enum):
     """Represents nuclear pleomorphism scores.
@@ -18,21 +20,25 @@ class NPLabel(str, Enum):
     score_3 = 'score_3'
 
 
-class NPPredictRequest(BaseModel):
+class NPPredictRequest(ImageSourceRequest):
     """Represents a request containing information abount an image.
     The image must be at least 256x256px from x20 magnification.
     """
-    image: str = Field(
-        default=...,
-        description="A base64-encoded string representing an RGB image."
-    )
-
     model_config = {
         "json_schema_extra": {
             "examples": [
                 {
                     "image": read_file(Path('./src/examples/image_512.txt')),
                 },
+                {
+                    "region": {
+                        "slide_path": "/mnt/slide_HE.vsi",
+                        "x": 1000,
+                        "y": 1500,
+                        "w": 512,
+                        "h": 512
+                    }
+                },
             ]
         }
     }
@@ -6,7 +6,7 @@ from pydantic import BaseModel, ConfigDict, Field, PositiveInt
 
 from src.utils.utils import read_file
 
-from .shared import BoundingBox, Keypoint
+from .shared import BoundingBox, ImageSourceRequest, Keypoint
 
 
 class SAMKeypointLabel(str, Enum):
@@ -151,18 +151,23 @@ class SAMPredictResponse(BaseModel):
     previous_predict_task_id: uuid.UUID
 
 
-class GetSAMEmbeddingsRequest(BaseModel):
-    image: str = Field(
-        default=...,
-        description="A base64-encoded string representing an RGB image."
-    )
-
+class GetSAMEmbeddingsRequest(ImageSourceRequest):
+    """Represents a request for the extraction of SAM encoder embeddings."""
     model_config = {
         "json_schema_extra": {
             "examples": [
                 {
                     "image": read_file(Path('./src/examples/image_512.txt')),
                 },
+                {
+                    "region": {
+                        "slide_path": "/mnt/slide_HE.vsi",
+                        "x": 1000,
+                        "y": 1500,
+                        "w": 1024,
+                        "h": 1024
+                    }
+                },
             ]
         }
     }
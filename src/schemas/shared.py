@@ -1,7 +1,15 @@
 from typing import Annotated
+from uuid import UUID
 
 from geoalchemy2 import WKTElement
-from pydantic import BaseModel, Field, NonNegativeFloat, PositiveFloat
+from pydantic import (
+    BaseModel,
+    Field,
+    NonNegativeFloat,
+    NonNegativeInt,
+    PositiveFloat,
+    model_validator,
+)
 
 
 class Keypoint(BaseModel):
@@ -26,6 +34,57 @@ class BoundingBox(BaseModel):
         )
 
 
+class SlideRegion(BaseModel):
+    """Represents a region of a whole slide image from the slide store."""
+    slide_id: UUID | None = Field(
+        default=None,
+        description="The ID of the slide. Either slide_id or slide_path "
+        "must be provided."
+    )
+    slide_path: str | None = Field(
+        default=None,
+        max_length=256,
+        description="The path to the slide in the slide store."
+    )
+    level: NonNegativeInt | None = Field(
+        default=None,
+        description="The level of the slide passed to the reader. When null, "
+        "the region is cropped from the full resolution slide."
+    )
+    x: NonNegativeInt
+    y: NonNegativeInt
+    w: int = Field(default=..., gt=0, le=8192)
+    h: int = Field(default=..., gt=0, le=8192)
+
+    @model_validator(mode='after')
+    def check_slide(self) -> 'SlideRegion':
+        if (self.slide_id is None) == (self.slide_path is None):
+            raise ValueError('Exactly one of slide_id or slide_path must be provided')
+
+        return self
+
+
+class ImageSourceRequest(BaseModel):
+    """Represents a request with an image provided either as a base64-encoded string
+    or as a reference to a region of a slide, which is read by the worker.
+    """
+    image: str | None = Field(
+        default=None,
+        description="A base64-encoded string representing an RGB image."
+    )
+    region: SlideRegion | None = Field(
+        default=None,
+        description="A region of a slide to be used instead of the image."
+    )
+
+    @model_validator(mode='after')
+    def check_image_source(self) -> 'ImageSourceRequest':
+        if (self.image is None) == (self.region is None):
+            raise ValueError('Exactly one of image or region must be provided')
+
+        return self
+
+
 class HTTPError(BaseModel):
     """Represents an HTTP error."""
     detail: str
@@ -0,0 +1,179 @@
+import argparse
+import json
+import logging
+import statistics
+import subprocess
+import sys
+from typing import Any
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# The statements measured in a fresh interpreter
+TARGETS = {
+    # The API process sends the tasks by name
+    'api': 'import src.main',
+    # The task registration of the workers, the celery CLI and flower,
+    # the models are loaded on the first task call
+    'tasks': (
+        'from src.core.celery import celery_app\n'
+        'celery_app.loader.import_default_modules()'
+    ),
+}
+
+# The modules that must not be imported by any of the targets
+HEAVY_MODULES = (
+    'torch',
+    'torchvision',
+    'ultralytics',
+    'sahi',
+    'monai',
+    'segment_anything',
+    'efficientnet_pytorch',
+    'albumentations',
+    'imantics',
+    'skimage',
+    'patchify',
+)
+
+PROBE = '''
+import json
+import resource
+import sys
+import time
+
+namespace = {{}}
+start = time.perf_counter()
+exec({statement!r}, namespace)
+seconds = time.perf_counter() - start
+
+celery_app = namespace.get('celery_app')
+
+print(json.dumps({{
+    'seconds': seconds,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': sorted(sys.modules),
+    'tasks': sorted(celery_app.tasks) if celery_app is not None else [],
+}}))
+'''
+
+
+def probe(statement: str) -> dict[str, Any]:
+    """Runs the statement in a fresh interpreter.
+
+    Args:
+        statement (str): The statement to measure.
+
+    Raises:
+        subprocess.CalledProcessError: If the statement fails.
+
+    Returns:
+        dict[str, Any]: The import time, the peak RSS, the imported modules
+        and the registered celery tasks.
+    """
+    process = subprocess.run(
+        [sys.executable, '-c', PROBE.format(statement=statement)],
+        capture_output=True,
+        check=True,
+        text=True
+    )
+
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def get_unregistered_tasks(tasks: list[str]) -> list[str]:
+    """Gets the task names sent by the API that are not registered by the workers.
+
+    Args:
+        tasks (list[str]): The registered task names.
+
+    Returns:
+        list[str]: The unregistered task names.
+    """
+    import src.celery.registry as registry
+
+    names = [
+        value for name, value in vars(registry).items()
+        if name.endswith('_TASK_NAME')
+    ]
+
+    return sorted(set(names) - set(tasks))
+
+
+def benchmark(target: str, repeat: int) -> dict[str, Any]:
+    """Measures the import of the target.
+
+    Args:
+        target (str): The name of the target.
+        repeat (int): The number of measurements.
+
+    Returns:
+        dict[str, Any]: The benchmark result.
+    """
+    probes = [probe(TARGETS[target]) for _ in range(repeat)]
+    modules = probes[0]['modules']
+
+    return {
+        'target': target,
+        'median_seconds': statistics.median(p['seconds'] for p in probes),
+        'max_seconds': max(p['seconds'] for p in probes),
+        'max_rss_mb': max(p['max_rss_mb'] for p in probes),
+        'modules': len(modules),
+        'heavy_modules': [
+            module for module in HEAVY_MODULES if module in modules
+        ],
+        'unregistered_tasks': get_unregistered_tasks(probes[0]['tasks'])
+        if target == 'tasks' else [],
+    }
+
+
+def main() -> None:
+    """Run the main script. Exits with a non-zero code on a regression."""
+    parser = argparse.ArgumentParser(
+        description='Measures the import time of the API and the celery tasks.'
+    )
+    parser.add_argument('--target', choices=list(TARGETS), action='append')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=3.0)
+    parser.add_argument('--max-rss-mb', type=float, default=300.0)
+    args = parser.parse_args()
+
+    results = [
+        benchmark(target, args.repeat) for target in args.target or list(TARGETS)
+    ]
+
+    print(json.dumps(results, indent=2))
+
+    failed = False
+
+    for result in results:
+        target = result['target']
+
+        if result['heavy_modules']:
+            logger.error(f'{target} imports {", ".join(result["heavy_modules"])}')
+            failed = True
+        if result['unregistered_tasks']:
+            logger.error(
+                f'{target} does not register '
+                f'{", ".join(result["unregistered_tasks"])}'
+            )
+            failed = True
+        if result['median_seconds'] > args.max_seconds:
+            logger.error(
+                f'{target} import takes {result["median_seconds"]:.2f}s '
+                f'(budget {args.max_seconds:.2f}s)'
+            )
+            failed = True
+        if result['max_rss_mb'] > args.max_rss_mb:
+            logger.error(
+                f'{target} uses {result["max_rss_mb"]:.0f} MB '
+                f'(budget {args.max_rss_mb:.0f} MB)'
+            )
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,651 @@
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from queue import Empty
+from typing import TYPE_CHECKING, Any, get_args
+
+import numpy as np
+
+from src.celery.registry import TASK_PACKAGES
+from src.celery.shared.quantization import load_tiles, sample_nuclei_points
+from src.core.config import CpuAffinity
+
+if TYPE_CHECKING:
+    import torch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The prompts sampled on the nuclei of each tile
+POINTS = 64
+NUCLICK_CLICKS = 16
+SAM_CLICKS = 8
+
+# The tile is the tissue mask of a slide with 8 times larger dimensions
+SLIDE_MAGNIFICATION = 3
+
+
+class StageTimer:
+    """Sums the time spent in the stages of a pipeline run."""
+
+    def __init__(self) -> None:
+        self.seconds: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.seconds[name] = \
+                self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+
+PipelineFunction = Callable[
+    [dict[str, Any], 'torch.device | None', np.ndarray, np.ndarray, StageTimer],
+    None
+]
+
+
+@dataclass(frozen=True)
+class Pipeline:
+    """The benchmarked pipeline, run on a tile with the points sampled
+    on its nuclei."""
+    model_names: tuple[str, ...]
+    run: PipelineFunction
+
+
+def run_nuclick(
+    models: dict[str, Any],
+    device: 'torch.device | None',
+    tile: np.ndarray,
+    points: np.ndarray,
+    timer: StageTimer
+) -> None:
+    from src.models import predict_nuclick
+    from src.schemas.shared import Keypoint
+    from src.utils.polygons import instance_map_to_polygons
+
+    keypoints = [Keypoint(x=x, y=y) for x, y in points[:NUCLICK_CLICKS]]
+
+    with timer.stage('predict'):
+        instance_map = predict_nuclick(
+            model=models['nuclick'],
+            image=tile,
+            keypoints=keypoints,
+            device=device
+        )
+
+    with timer.stage('polygons'):
+        instance_map_to_polygons(instance_map)
+
+
+def run_mc(
+    models: dict[str, Any],
+    device: 'torch.device | None',
+    tile: np.ndarray,
+    points: np.ndarray,
+    timer: StageTimer
+) -> None:
+    from src.celery.mc.definitions import detect_mitotic_candidates
+    from src.celery.shared.stain import get_tile_stain_parameters
+    from src.models import predict_mc_second_stage
+    from src.models.stain import normalize_he_stains, normalize_stains
+
+    with timer.stage('normalize'):
+        stain_parameters = get_tile_stain_parameters(tile)
+
+        try:
+            if stain_parameters is None:
+                normalized_tile = normalize_he_stains(tile)
+            else:
+                normalized_tile = normalize_stains(tile, stain_parameters)
+        except ValueError:
+            # the background tile, skipped as by the first stage task
+            return
+
+    with timer.stage('detect'):
+        candidates = detect_mitotic_candidates(
+            models['mc_first_stage'],
+            device,
+            normalized_tile
+        )
+
+    # the first stage with random weights detects no or arbitrary candidates,
+    # the candidates are sampled on the nuclei instead
+    if not candidates:
+        candidates = [
+            np.array([x - 16, y - 16, x + 16, y + 16]) for x, y in points
+        ]
+
+    with timer.stage('classify'):
+        predict_mc_second_stage(
+            model=models['mc_second_stage'],
+            image=tile,
+            bboxes=candidates,
+            device=device,
+            stain_parameters=stain_parameters
+        )
+
+
+def run_np(
+    models: dict[str, Any],
+    device: 'torch.device | None',
+    tile: np.ndarray,
+    points: np.ndarray,
+    timer: StageTimer
+) -> None:
+    from src.celery.shared.stain import get_tile_stain_parameters
+    from src.models import predict_nuclear_pleomorphism
+
+    with timer.stage('predict'):
+        predict_nuclear_pleomorphism(
+            model=models['np'],
+            image=tile,
+            device=device,
+            stain_parameters=get_tile_stain_parameters(tile)
+        )
+
+
+def run_sam(
+    models: dict[str, Any],
+    device: 'torch.device | None',
+    tile: np.ndarray,
+    points: np.ndarray,
+    timer: StageTimer
+) -> None:
+    from src.celery.sam.definitions import get_sam_embeddings, predict_sam_masks
+
+    with timer.stage('embed'):
+        predictor_config, = get_sam_embeddings(models['sam'], device, [(tile,)])
+
+    # a request for each click, decoded together as the concurrent requests
+    requests = [
+        ('benchmark', predictor_config, point[None], np.array([1]), None, None, True)
+        for point in points[:SAM_CLICKS].astype(np.float64)
+    ]
+
+    with timer.stage('predict'):
+        predict_sam_masks(models['sam'], device, requests)
+
+
+def run_tissue_mask(
+    models: dict[str, Any],
+    device: 'torch.device | None',
+    tile: np.ndarray,
+    points: np.ndarray,
+    timer: StageTimer
+) -> None:
+    from src.celery.active_learning.tasks import (
+        create_tissue_mask,
+        get_tiles_coords_from_tissue_mask,
+    )
+
+    with timer.stage('tissue_mask'):
+        mask = create_tissue_mask(tile)
+
+    magnifier = 2**SLIDE_MAGNIFICATION
+
+    with timer.stage('tile_coords'):
+        get_tiles_coords_from_tissue_mask(
+            mask,
+            slide_width=tile.shape[1] * magnifier,
+            slide_height=tile.shape[0] * magnifier,
+            mask_magnification=0,
+            slide_magnification=SLIDE_MAGNIFICATION
+        )
+
+
+PIPELINES = {
+    'nuclick': Pipeline(('nuclick',), run_nuclick),
+    'mc': Pipeline(('mc_first_stage', 'mc_second_stage'), run_mc),
+    'np': Pipeline(('np',), run_np),
+    'sam': Pipeline(('sam',), run_sam),
+    'tissue_mask': Pipeline((), run_tissue_mask),
+}
+
+
+def create_synthetic_tile(size: int, seed: int = 0) -> np.ndarray:
+    """Creates the tile resembling an H&E stained tissue, the pink stroma
+    with the purple nuclei, so the stain normalization and the tissue
+    detection process it as a real tile.
+
+    Args:
+        size (int): The width and the height of the tile.
+        seed (int): The seed of the tile.
+
+    Returns:
+        np.ndarray: The RGB tile.
+    """
+    import cv2
+
+    rng = np.random.default_rng(seed)
+
+    tile: np.ndarray = np.empty((size, size, 3), dtype=np.uint8)
+    tile[:] = (240, 220, 235)
+
+    # the stroma covering most of the tile, the rest is the background
+    stroma: np.ndarray = np.zeros((size, size), dtype=np.uint8)
+
+    for _ in range(max(1, size // 64)):
+        center = tuple(int(x) for x in rng.integers(0, size, 2))
+        cv2.circle(stroma, center, int(rng.integers(size // 8, size // 3)), 1, -1)
+
+    tile[stroma == 1] = (220, 140, 190)
+
+    # about a nucleus per 40x40 pixels
+    for _ in range(size * size // 1600):
+        center = tuple(int(x) for x in rng.integers(0, size, 2))
+        axes = tuple(int(x) for x in rng.integers(4, 10, 2))
+        color = tuple(int(x) for x in rng.integers((60, 30, 110), (110, 70, 160)))
+
+        cv2.ellipse(tile, center, axes, int(rng.integers(0, 180)), 0, 360, color, -1)
+
+    noise = rng.normal(0, 6, tile.shape)
+
+    return np.clip(tile + noise, 0, 255).astype(np.uint8)
+
+
+def load_models(
+    model_names: tuple[str, ...],
+    weights: str
+) -> tuple[dict[str, Any], 'torch.device | None']:
+    """Loads the models of the pipeline in the current process.
+
+    Args:
+        model_names (tuple[str, ...]): The names of the models.
+        weights (str): Whether the models are created with the random weights
+        or loaded from the weights (and the exported models) as by the workers.
+
+    Returns:
+        tuple[dict[str, Any], torch.device | None]: The models by their name
+        and the device they are loaded on (None without the models).
+    """
+    from src.celery.shared.definitions import get_device, get_model_task
+
+    models: dict[str, Any] = {}
+
+    # e.g. the tissue detection runs without torch
+    if not model_names:
+        return models, None
+
+    import torch
+
+    device = get_device()
+
+    for model_name in model_names:
+        task_class = get_model_task(model_name)
+
+        if weights == 'random':
+            torch.manual_seed(0)
+            model = task_class.create_model(device)
+        else:
+            model = task_class.get_loaded_model().model
+
+        task_class.warmup(model, device)
+        models[model_name] = model
+
+    return models, device
+
+
+def run_worker(
+    index: int,
+    processes: int,
+    pipeline_name: str,
+    weights: str,
+    tiles: list[tuple[str, np.ndarray]],
+    warmup: int,
+    repeat: int,
+    barrier: Any,
+    results: Any
+) -> None:
+    """Runs the pipeline on the tiles in a pool process configured
+    as a worker process. The processes start each measurement together,
+    so their runs compete for the CPUs as in a worker.
+
+    Args:
+        index (int): The index of the process in the pool.
+        processes (int): The number of the processes in the pool.
+        pipeline_name (str): The name of the pipeline.
+        weights (str): The weights of the models.
+        tiles (list[tuple[str, np.ndarray]]): The names and the tiles.
+        warmup (int): The number of the runs before the measurement.
+        repeat (int): The number of the measured runs.
+        barrier (Any): The barrier of the pool processes.
+        results (Any): The queue of the measurements.
+    """
+    from src.celery.shared.cpu import configure_process
+
+    configure_process(index, processes)
+
+    # registers the model task bases and the inference operations
+    for package in TASK_PACKAGES:
+        importlib.import_module(f'{package}.definitions')
+
+    pipeline = PIPELINES[pipeline_name]
+    models, device = load_models(pipeline.model_names, weights)
+
+    for tile_name, tile in tiles:
+        points = sample_nuclei_points(tile, count=POINTS)
+
+        for _ in range(warmup):
+            pipeline.run(models, device, tile, points, StageTimer())
+
+        barrier.wait()
+
+        seconds: list[float] = []
+        stages: list[dict[str, float]] = []
+        start = time.perf_counter()
+
+        for _ in range(repeat):
+            timer = StageTimer()
+            run_start = time.perf_counter()
+
+            pipeline.run(models, device, tile, points, timer)
+
+            seconds.append(time.perf_counter() - run_start)
+            stages.append(timer.seconds)
+
+        results.put({
+            'tile': tile_name,
+            'index': index,
+            'seconds': seconds,
+            'stages': stages,
+            'wall_seconds': time.perf_counter() - start,
+            # the peak of the process so far, the tiles are ordered by their size
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        })
+
+
+def benchmark(
+    pipeline_name: str,
+    tiles: list[tuple[str, np.ndarray]],
+    weights: str,
+    processes: int,
+    warmup: int,
+    repeat: int
+) -> list[dict[str, Any]]:
+    """Measures the pipeline on the tiles in the fresh pool processes.
+
+    Args:
+        pipeline_name (str): The name of the pipeline.
+        tiles (list[tuple[str, np.ndarray]]): The names and the tiles.
+        weights (str): The weights of the models.
+        processes (int): The number of the concurrent processes.
+        warmup (int): The number of the runs before the measurement.
+        repeat (int): The number of the measured runs in each process.
+
+    Raises:
+        RuntimeError: If a process fails.
+
+    Returns:
+        list[dict[str, Any]]: The benchmark result of each tile.
+    """
+    # the processes do not inherit the state of torch and the thread pools
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(processes)
+    queue = context.Queue()
+
+    workers = [
+        context.Process(
+            target=run_worker,
+            args=(
+                index,
+                processes,
+                pipeline_name,
+                weights,
+                tiles,
+                warmup,
+                repeat,
+                barrier,
+                queue
+            )
+        )
+        for index in range(processes)
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    measurements: list[dict[str, Any]] = []
+
+    while len(measurements) < processes * len(tiles):
+        try:
+            measurements.append(queue.get(timeout=1))
+        except Empty:
+            # the other processes would wait for the failed one at the barrier
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                for worker in workers:
+                    worker.terminate()
+
+                raise RuntimeError(f'Benchmark of {pipeline_name} failed')
+
+    for worker in workers:
+        worker.join()
+
+    results: list[dict[str, Any]] = []
+
+    for tile_name, tile in tiles:
+        tile_measurements = [m for m in measurements if m['tile'] == tile_name]
+
+        seconds = np.array([s for m in tile_measurements for s in m['seconds']])
+        stages = [s for m in tile_measurements for s in m['stages']]
+        wall_seconds = max(m['wall_seconds'] for m in tile_measurements)
+
+        results.append({
+            'pipeline': pipeline_name,
+            'tile': tile_name,
+            'height': tile.shape[0],
+            'width': tile.shape[1],
+            'runs': len(seconds),
+            'latency_ms': {
+                'p50': float(np.percentile(seconds, 50) * 1000),
+                'p90': float(np.percentile(seconds, 90) * 1000),
+                'p99': float(np.percentile(seconds, 99) * 1000),
+                'mean': float(seconds.mean() * 1000),
+            },
+            'throughput_per_second': len(seconds) / wall_seconds,
+            'megapixels_per_second':
+                len(seconds) * tile.shape[0] * tile.shape[1] / wall_seconds / 1e6,
+            'max_rss_mb': max(m['max_rss_mb'] for m in tile_measurements),
+            # the median time of each stage (a stage is skipped e.g. on the background)
+            'stages_ms': {
+                name: float(np.median([s.get(name, 0.0) for s in stages]) * 1000)
+                for name in dict.fromkeys(name for s in stages for name in s)
+            },
+        })
+
+    return results
+
+
+def compare(
+    results: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    max_regression: float
+) -> list[dict[str, Any]]:
+    """Compares the median latency and the throughput with the baseline.
+
+    Args:
+        results (list[dict[str, Any]]): The benchmark results.
+        baseline (list[dict[str, Any]]): The benchmark results of the baseline.
+        max_regression (float): The tolerated relative slowdown.
+
+    Returns:
+        list[dict[str, Any]]: The comparison of each result in the baseline.
+    """
+    baseline_results = {
+        (result['pipeline'], result['tile']): result for result in baseline
+    }
+
+    comparisons: list[dict[str, Any]] = []
+    max_ratio = 1 + max_regression
+
+    for result in results:
+        baseline_result = baseline_results.get((result['pipeline'], result['tile']))
+
+        if baseline_result is None:
+            continue
+
+        latency_ratio = \
+            result['latency_ms']['p50'] / baseline_result['latency_ms']['p50']
+        throughput_ratio = \
+            result['throughput_per_second'] / baseline_result['throughput_per_second']
+
+        comparisons.append({
+            'pipeline': result['pipeline'],
+            'tile': result['tile'],
+            'latency_ratio': latency_ratio,
+            'throughput_ratio': throughput_ratio,
+            'regressed': latency_ratio > max_ratio or throughput_ratio < 1 / max_ratio,
+        })
+
+    return comparisons
+
+
+def main() -> None:
+    """Run the main script. Exits with a non-zero code on a regression
+    against the baseline."""
+    parser = argparse.ArgumentParser(
+        description='Measures the inference pipelines on the CPU.'
+    )
+    parser.add_argument('--pipeline', choices=list(PIPELINES), action='append')
+    parser.add_argument(
+        '--size',
+        type=int,
+        action='append',
+        help='size of the synthetic tiles (default 512, 1024 and 2048)'
+    )
+    parser.add_argument(
+        '--tiles',
+        type=Path,
+        help='directory of the sample tiles (png, jpg or tif)'
+    )
+    parser.add_argument(
+        '--weights',
+        choices=['random', 'pretrained'],
+        default='random',
+        help='random weights or the weights (and the exported models) '
+        'used by the workers'
+    )
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=1,
+        help='number of the concurrent processes, as the worker concurrency'
+    )
+    parser.add_argument('--threads', type=int, help='overrides TORCH_NUM_THREADS')
+    parser.add_argument(
+        '--interop-threads',
+        type=int,
+        help='overrides TORCH_INTEROP_THREADS'
+    )
+    parser.add_argument(
+        '--cpu-affinity',
+        choices=get_args(CpuAffinity),
+        help='overrides CELERY_CPU_AFFINITY'
+    )
+    parser.add_argument('--output', type=Path, help='file of the results')
+    parser.add_argument('--baseline', type=Path, help='file of the baseline results')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    args = parser.parse_args()
+
+    # read by the settings of the spawned processes
+    os.environ['MODEL_DEVICE'] = 'cpu'
+    os.environ['INFERENCE_SERVER_ENABLED'] = 'false'
+
+    overrides = {
+        'TORCH_NUM_THREADS': args.threads,
+        'TORCH_INTEROP_THREADS': args.interop_threads,
+        'CELERY_CPU_AFFINITY': args.cpu_affinity,
+    }
+
+    for name, value in overrides.items():
+        if value is not None:
+            os.environ[name] = str(value)
+
+    tiles = [
+        (f'synthetic-{size}', create_synthetic_tile(size))
+        for size in sorted(args.size or [512, 1024, 2048])
+    ]
+
+    if args.tiles is not None:
+        tiles.extend(
+            (f'sample-{index}-{tile.shape[1]}x{tile.shape[0]}', tile)
+            for index, tile in enumerate(load_tiles(args.tiles))
+        )
+
+    # the peak RSS of the processes grows with the tile size
+    tiles.sort(key=lambda x: x[1].size)
+
+    results: list[dict[str, Any]] = []
+
+    for pipeline_name in args.pipeline or list(PIPELINES):
+        logger.info(f'Benchmarking {pipeline_name}')
+
+        results.extend(benchmark(
+            pipeline_name,
+            tiles,
+            args.weights,
+            args.processes,
+            args.warmup,
+            args.repeat
+        ))
+
+    report: dict[str, Any] = {
+        'config': {
+            'weights': args.weights,
+            'processes': args.processes,
+            'cpus': len(os.sched_getaffinity(0)),
+            **{
+                name.lower(): os.environ.get(name) for name in overrides
+            },
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+        'comparisons': [],
+    }
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())
+        report['comparisons'] = compare(
+            results,
+            baseline['results'],
+            args.max_regression
+        )
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    print(json.dumps(report, indent=2))
+
+    failed = False
+
+    for comparison in report['comparisons']:
+        if comparison['regressed']:
+            logger.error(
+                f'{comparison["pipeline"]} on {comparison["tile"]} regressed: '
+                f'latency {comparison["latency_ratio"]:.2f}x, '
+                f'throughput {comparison["throughput_ratio"]:.2f}x of the baseline'
+            )
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import itertools
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from src.celery.sam.definitions import (
+    SamPredictorConfig,
+    SAMTask,
+    get_sam_embeddings,
+    predict_sam_masks,
+)
+from src.celery.sam.store import (
+    decode_embeddings,
+    decode_mask,
+    encode_embeddings,
+    encode_mask,
+)
+from src.celery.shared.definitions import get_device
+from src.celery.shared.quantization import (
+    compare_predictions,
+    load_tiles,
+    sample_nuclei_points,
+)
+from src.core.config import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def predict(
+    model: Any,
+    device: Any,
+    predictor_config: SamPredictorConfig,
+    points: np.ndarray,
+    mask_inputs: list[np.ndarray | None]
+) -> list[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Predicts a single mask for a click on each of the points.
+
+    Args:
+        model (Any): The SAM model.
+        device (Any): The device the model is loaded on.
+        predictor_config (SamPredictorConfig): The configuration for the SAM predictor.
+        points (np.ndarray): The x and y coordinates of the clicks.
+        mask_inputs (list[np.ndarray | None]): The low resolution mask
+        of the previous prediction of each click.
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray, np.ndarray]]: The masks, their scores
+        and the low resolution logits of each click.
+    """
+    return predict_sam_masks(
+        model,
+        device,
+        [
+            (
+                'check',
+                predictor_config,
+                point[None],
+                np.array([1]),
+                None if mask_input is None else mask_input[None],
+                None,
+                False
+            )
+            for point, mask_input in zip(points, mask_inputs)
+        ]
+    )
+
+
+def main() -> None:
+    """Run the main script. Exits with a non-zero code if the masks decoded
+    from the stored embeddings and masks differ from the float32 ones."""
+    parser = argparse.ArgumentParser(
+        description='Compares the SAM masks decoded from the float32 embeddings '
+        'and masks with the masks decoded from their stored encoding '
+        '(SAM_EMBEDDINGS_DTYPE, SAM_MASK_ENCODING).'
+    )
+    parser.add_argument(
+        '--tiles',
+        type=Path,
+        required=True,
+        help='directory of the saved tiles (png, jpg or tif)'
+    )
+    parser.add_argument('--max-tiles', type=int, default=16)
+    parser.add_argument(
+        '--clicks',
+        type=int,
+        default=16,
+        help='number of the clicks sampled on the nuclei of each tile'
+    )
+    parser.add_argument('--min-iou', type=float, default=0.99)
+    args = parser.parse_args()
+
+    device = get_device()
+    model = SAMTask.get_loaded_model().model
+
+    references: dict[str, list[np.ndarray]] = {'embeddings': [], 'mask': []}
+    predictions: dict[str, list[np.ndarray]] = {'embeddings': [], 'mask': []}
+    sizes: dict[str, list[int]] = {
+        'embeddings_fp32': [],
+        'embeddings': [],
+        'mask_fp32': [],
+        'mask': [],
+    }
+
+    for tile in itertools.islice(load_tiles(args.tiles), args.max_tiles):
+        (predictor_config,) = get_sam_embeddings(model, device, [(tile,)])
+
+        data = encode_embeddings(predictor_config)
+        stored_config = decode_embeddings(data)
+
+        sizes['embeddings_fp32'].append(predictor_config['features'].nbytes)
+        sizes['embeddings'].append(len(data))
+
+        # the first click on each nucleus and the refinement with its mask
+        points = sample_nuclei_points(tile, count=args.clicks)
+        no_masks: list[np.ndarray | None] = [None] * len(points)
+
+        first = predict(model, device, predictor_config, points, no_masks)
+        stored_first = predict(model, device, stored_config, points, no_masks)
+
+        references['embeddings'].append(np.concatenate([m for m, _, _ in first]))
+        predictions['embeddings'].append(
+            np.concatenate([m for m, _, _ in stored_first])
+        )
+
+        logits = [low_res_masks[0] for _, _, low_res_masks in first]
+        encoded_masks = [encode_mask(mask) for mask in logits]
+
+        sizes['mask_fp32'].extend(mask.nbytes for mask in logits)
+        sizes['mask'].extend(len(data) for data in encoded_masks)
+
+        refined = predict(model, device, predictor_config, points, list(logits))
+        stored_refined = predict(
+            model,
+            device,
+            stored_config,
+            points,
+            [decode_mask(data) for data in encoded_masks]
+        )
+
+        references['mask'].append(np.concatenate([m for m, _, _ in refined]))
+        predictions['mask'].append(np.concatenate([m for m, _, _ in stored_refined]))
+
+    if not references['embeddings']:
+        parser.error(f'{args.tiles} has no tiles')
+
+    report: dict[str, Any] = {
+        'embeddings_dtype': settings.SAM_EMBEDDINGS_DTYPE,
+        'mask_encoding': settings.SAM_MASK_ENCODING,
+        'compression': settings.CELERY_ARRAY_COMPRESSION,
+        'bytes': {name: int(np.mean(values)) for name, values in sizes.items()},
+    }
+
+    failed = False
+
+    for name in ('embeddings', 'mask'):
+        value, samples = compare_predictions(
+            'iou',
+            references[name],
+            predictions[name]
+        )
+        report[f'{name}_iou'] = {'value': value, 'samples': samples}
+
+        if value < args.min_iou:
+            logger.error(f'The masks decoded from the stored {name} have IoU '
+                         f'{value:.4f}, below {args.min_iou}')
+            failed = True
+
+    print(json.dumps(report, indent=2))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import importlib
+import json
+import logging
+import sys
+from typing import get_args
+
+from src.celery.registry import TASK_PACKAGES
+from src.celery.shared.backends import (
+    ExportManifest,
+    check_parity,
+    get_export_path,
+    write_export_manifest,
+)
+from src.celery.shared.definitions import get_model_task
+from src.celery.shared.fingerprint import get_model_fingerprint
+from src.core.config import InferenceBackend, ModelName
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def export_model(
+    model_name: str,
+    backend: InferenceBackend,
+    atol: float,
+    rtol: float
+) -> ExportManifest | None:
+    """Exports the model on the CPU and compares the outputs of the exported
+    graphs with the torch model. The manifest is written only if all the graphs
+    pass the parity check.
+
+    Args:
+        model_name (str): The name of the model.
+        backend (InferenceBackend): The backend to export the model for.
+        atol (float): The absolute tolerance of the parity check.
+        rtol (float): The relative tolerance of the parity check.
+
+    Raises:
+        ValueError: If the model cannot be exported for the backend.
+
+    Returns:
+        ExportManifest | None: The manifest, None if the parity check failed.
+    """
+    import torch
+
+    task_class = get_model_task(model_name)
+
+    if backend not in task_class.export_backends:
+        raise ValueError(f'Model {model_name} cannot be exported for {backend}')
+
+    device = torch.device('cpu')
+    model = task_class.load_model(device)
+    graphs = task_class.get_export_graphs(model, device)
+
+    manifest: ExportManifest = {
+        'model_name': model_name,
+        'backend': backend,
+        'precision': 'fp32',
+        'source_fingerprint': get_model_fingerprint(task_class.get_model_path()),
+        'graphs': {},
+        'parity': {},
+        'metadata': task_class.get_export_metadata(model),
+        'accuracy': None,
+    }
+
+    for graph_name, graph in graphs.items():
+        path = get_export_path(model_name, graph_name, backend, 'fp32')
+
+        task_class.export_graph(graph, backend, path)
+
+        manifest['graphs'][graph_name] = path.name
+        manifest['parity'][graph_name] = check_parity(graph, path, backend, atol, rtol)
+
+    if not all(report['passed'] for report in manifest['parity'].values()):
+        logger.error(f'Model {model_name} exported for {backend} differs from torch')
+        return None
+
+    write_export_manifest(manifest)
+
+    return manifest
+
+
+def main() -> None:
+    """Run the main script. Exits with a non-zero code if an export fails."""
+    parser = argparse.ArgumentParser(
+        description='Exports the models for the torchscript or onnx backend.'
+    )
+    parser.add_argument('--model', choices=get_args(ModelName), action='append')
+    parser.add_argument(
+        '--backend',
+        choices=[x for x in get_args(InferenceBackend) if x != 'torch'],
+        default='onnx'
+    )
+    parser.add_argument('--atol', type=float, default=1e-3)
+    parser.add_argument('--rtol', type=float, default=1e-3)
+    args = parser.parse_args()
+
+    # registers the model task bases
+    for package in TASK_PACKAGES:
+        importlib.import_module(f'{package}.definitions')
+
+    model_names = args.model or [
+        model_name for model_name in get_args(ModelName)
+        if args.backend in get_model_task(model_name).export_backends
+    ]
+
+    failed = False
+
+    for model_name in model_names:
+        manifest = export_model(model_name, args.backend, args.atol, args.rtol)
+
+        if manifest is None:
+            failed = True
+            continue
+
+        print(json.dumps(manifest, indent=2))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
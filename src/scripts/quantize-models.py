@@ -0,0 +1,260 @@
+import argparse
+import importlib
+import itertools
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Literal, get_args
+
+import numpy as np
+
+from src.celery.registry import TASK_PACKAGES
+from src.celery.shared.backends import (
+    AccuracyReport,
+    ExportManifest,
+    get_export_path,
+    is_accuracy_accepted,
+    read_export_manifest,
+    write_export_manifest,
+)
+from src.celery.shared.definitions import ModelTask, get_model_task
+from src.celery.shared.fingerprint import get_model_fingerprint
+from src.celery.shared.quantization import (
+    CalibrationMethod,
+    compare_predictions,
+    load_tiles,
+    quantize_onnx_dynamic,
+    quantize_onnx_static,
+)
+from src.core.config import ModelName, ModelPrecision, settings
+
+if TYPE_CHECKING:
+    import torch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def evaluate(
+    task_class: type[ModelTask],
+    metric: Literal['label_agreement', 'iou'],
+    fp32_model: Any,
+    model: Any,
+    device: 'torch.device',
+    tiles: list[np.ndarray]
+) -> AccuracyReport:
+    """Compares the predictions and the prediction time of the int8 model
+    with the fp32 model on the tiles.
+
+    Args:
+        task_class (type[ModelTask]): The task base of the model.
+        metric (Literal['label_agreement', 'iou']): The accuracy metric.
+        fp32_model (Any): The fp32 exported model.
+        model (Any): The int8 exported model.
+        device (torch.device): The device the models are loaded on.
+        tiles (list[np.ndarray]): The evaluation tiles.
+
+    Returns:
+        AccuracyReport: The accuracy of the int8 model.
+    """
+    predictions: list[list[np.ndarray]] = []
+    seconds: list[float] = []
+
+    for evaluated_model in (fp32_model, model):
+        # the first prediction initializes the session
+        task_class.predict_for_evaluation(evaluated_model, device, tiles[0])
+
+        start = time.perf_counter()
+        predictions.append([
+            task_class.predict_for_evaluation(evaluated_model, device, tile)
+            for tile in tiles
+        ])
+        seconds.append(time.perf_counter() - start)
+
+    value, samples = compare_predictions(metric, predictions[0], predictions[1])
+
+    return {
+        'metric': metric,
+        'value': value,
+        'samples': samples,
+        'fp32_seconds': seconds[0],
+        'seconds': seconds[1],
+    }
+
+
+def quantize_model(
+    model_name: str,
+    precision: ModelPrecision,
+    calibration_tiles: list[np.ndarray],
+    evaluation_tiles: list[np.ndarray],
+    calibration_method: CalibrationMethod
+) -> ExportManifest:
+    """Quantizes the fp32 ONNX model exported from the current weights
+    and evaluates the int8 model against it.
+
+    Args:
+        model_name (str): The name of the model.
+        precision (ModelPrecision): The int8 precision.
+        calibration_tiles (list[np.ndarray]): The tiles the activation ranges
+        of the statically quantized graphs are calibrated on.
+        evaluation_tiles (list[np.ndarray]): The tiles the int8 model
+        is evaluated on.
+        calibration_method (CalibrationMethod): The method of the range calibration.
+
+    Raises:
+        FileNotFoundError: If the fp32 model is not exported.
+        ValueError: If the model cannot be quantized or the fp32 model
+        is outdated.
+
+    Returns:
+        ExportManifest: The manifest of the int8 model.
+    """
+    import torch
+
+    task_class = get_model_task(model_name)
+
+    if task_class.accuracy_metric is None or 'onnx' not in task_class.export_backends:
+        raise ValueError(f'Model {model_name} cannot be quantized')
+
+    device = torch.device('cpu')
+
+    fp32_manifest = read_export_manifest(
+        model_name,
+        'onnx',
+        'fp32',
+        get_model_fingerprint(task_class.get_model_path())
+    )
+    fp32_model = task_class.load_exported_model(fp32_manifest, device)
+
+    calibration_inputs: dict[str, list[tuple[np.ndarray, ...]]] = {}
+
+    if precision == 'int8_static':
+        for image in calibration_tiles:
+            inputs = task_class.get_calibration_inputs(fp32_model, device, image)
+
+            for graph_name, graph_inputs in inputs.items():
+                calibration_inputs.setdefault(graph_name, []).extend(graph_inputs)
+
+    manifest: ExportManifest = {
+        **fp32_manifest,
+        'precision': precision,
+        'graphs': dict(fp32_manifest['graphs']),
+        'parity': {},
+        'accuracy': None,
+    }
+
+    for graph_name in task_class.quantized_graphs:
+        fp32_path = settings.MODEL_EXPORT_DIR / fp32_manifest['graphs'][graph_name]
+        path = get_export_path(model_name, graph_name, 'onnx', precision)
+
+        if precision == 'int8_dynamic':
+            quantize_onnx_dynamic(fp32_path, path)
+        else:
+            quantize_onnx_static(
+                fp32_path,
+                path,
+                calibration_inputs[graph_name],
+                calibration_method
+            )
+
+        manifest['graphs'][graph_name] = path.name
+
+    manifest['accuracy'] = evaluate(
+        task_class,
+        task_class.accuracy_metric,
+        fp32_model,
+        task_class.load_exported_model(manifest, device),
+        device,
+        evaluation_tiles
+    )
+
+    write_export_manifest(manifest)
+
+    return manifest
+
+
+def main() -> None:
+    """Run the main script. Exits with a non-zero code if an int8 model
+    does not reach the configured minimum accuracy."""
+    parser = argparse.ArgumentParser(
+        description='Quantizes the exported onnx models to int8 and evaluates them.'
+    )
+    parser.add_argument(
+        '--tiles',
+        type=Path,
+        required=True,
+        help='directory of the saved tiles (png, jpg or tif)'
+    )
+    parser.add_argument('--model', choices=get_args(ModelName), action='append')
+    parser.add_argument(
+        '--precision',
+        choices=[x for x in get_args(ModelPrecision) if x != 'fp32'],
+        action='append'
+    )
+    parser.add_argument(
+        '--calibration-tiles',
+        type=int,
+        default=16,
+        help='number of the tiles used for the calibration, the rest is evaluated'
+    )
+    parser.add_argument('--max-tiles', type=int, default=64)
+    parser.add_argument(
+        '--calibration-method',
+        choices=get_args(CalibrationMethod),
+        default='minmax'
+    )
+    args = parser.parse_args()
+
+    tiles = list(itertools.islice(load_tiles(args.tiles), args.max_tiles))
+
+    if len(tiles) <= args.calibration_tiles:
+        parser.error(
+            f'{args.tiles} has {len(tiles)} tiles, more than '
+            f'{args.calibration_tiles} calibration tiles are needed'
+        )
+
+    # registers the model task bases
+    for package in TASK_PACKAGES:
+        importlib.import_module(f'{package}.definitions')
+
+    model_names = args.model or [
+        model_name for model_name in get_args(ModelName)
+        if get_model_task(model_name).accuracy_metric is not None
+    ]
+
+    failed = False
+
+    for model_name in model_names:
+        for precision in args.precision or ['int8_static']:
+            manifest = quantize_model(
+                model_name,
+                precision,
+                tiles[:args.calibration_tiles],
+                tiles[args.calibration_tiles:],
+                args.calibration_method
+            )
+
+            print(json.dumps(manifest, indent=2))
+
+            accuracy: AccuracyReport = manifest['accuracy']  # type: ignore
+
+            logger.info(
+                f'Model {model_name} in {precision}: {accuracy["metric"]} '
+                f'{accuracy["value"]:.4f}, '
+                f'{accuracy["fp32_seconds"] / accuracy["seconds"]:.2f}x faster'
+            )
+
+            if not is_accuracy_accepted(manifest):
+                logger.error(
+                    f'Model {model_name} in {precision} does not reach '
+                    'the minimum accuracy, the workers use fp32 instead'
+                )
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
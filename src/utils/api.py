@@ -1,12 +1,52 @@
 import base64
 import uuid
 from io import BytesIO
+from typing import Annotated, Any
 
-from fastapi import UploadFile
-from PIL import Image
+from fastapi import HTTPException, Query, Request, UploadFile
+from PIL import Image, ImageFile
 from redis import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import UploadFile as FormFile
 
+import src.db_models as db_models
+from celery.result import AsyncResult
+from src.celery import READER_QUEUE
+from src.celery.registry import DOWNLOAD_REGION_TASK_NAME
+from src.core.celery import celery_app, store_pending_result
+from src.core.metrics import timed
+from src.schemas.shared import BoundingBox, Keypoint, SlideRegion
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+IMAGE_MEDIA_TYPES = ('image/png', 'image/jpeg', 'application/octet-stream')
+
+IMAGE_UPLOAD_OPENAPI_EXTRA = {
+    'requestBody': {
+        'required': True,
+        'description': 'The image uploaded as a raw request body '
+        'or as the `image` field of a multipart form.',
+        'content': {
+            **{
+                media_type: {'schema': {'type': 'string', 'format': 'binary'}}
+                for media_type in IMAGE_MEDIA_TYPES
+            },
+            'multipart/form-data': {
+                'schema': {
+                    'type': 'object',
+                    'required': ['image'],
+                    'properties': {
+                        'image': {'type': 'string', 'format': 'binary'}
+                    }
+                }
+            }
+        }
+    }
+}
+
+
+@timed('api.load_image')
 async def load_image(image: UploadFile | str) -> Image:
     """Loads an image from a file or a base64 string.
 
@@ -22,6 +62,152 @@ async def load_image(image: UploadFile | str) -> Image:
     return Image.open(BytesIO(bytes))
 
 
+@timed('api.load_uploaded_image')
+async def load_uploaded_image(request: Request) -> Image:
+    """Loads an image uploaded as a raw request body (PNG, JPEG or an octet stream)
+    or as the `image` field of a multipart form. The raw body is decoded
+    incrementally while it is being received.
+
+    Args:
+        request (Request): The incoming request.
+
+    Raises:
+        HTTPException: If the media type is not supported or the image is invalid.
+
+    Returns:
+        Image: The uploaded image.
+    """
+    media_type = request.headers.get('content-type', '').split(';')[0].strip()
+    parser = ImageFile.Parser()
+
+    if media_type == 'multipart/form-data':
+        form = await request.form()
+        upload = form.get('image')
+
+        if not isinstance(upload, FormFile):
+            raise HTTPException(status_code=422, detail='Missing image file')
+
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            parser.feed(chunk)
+    elif media_type in IMAGE_MEDIA_TYPES:
+        async for chunk in request.stream():
+            parser.feed(chunk)
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail=f'Unsupported media type: {media_type or None}'
+        )
+
+    try:
+        return parser.close()
+    except OSError:
+        raise HTTPException(status_code=422, detail='Invalid image')
+
+
+def get_offset(
+    offset_x: Annotated[
+        float | None,
+        Query(ge=0, description="The x coordinate of the offset "
+              "to be added to the keypoints in the response.")
+    ] = None,
+    offset_y: Annotated[
+        float | None,
+        Query(ge=0, description="The y coordinate of the offset "
+              "to be added to the keypoints in the response.")
+    ] = None
+) -> Keypoint | None:
+    """Dependency to get the optional offset from the query parameters.
+
+    Args:
+        offset_x (float | None): The x coordinate of the offset.
+        offset_y (float | None): The y coordinate of the offset.
+
+    Returns:
+        Keypoint | None: The offset.
+    """
+    if offset_x is None and offset_y is None:
+        return None
+
+    return Keypoint(x=offset_x or 0, y=offset_y or 0)
+
+
+def _parse_numbers(value: str, count: int) -> list[float]:
+    """Parses a comma separated list of numbers.
+
+    Args:
+        value (str): The comma separated numbers.
+        count (int): The expected number of numbers.
+
+    Raises:
+        HTTPException: If the value is not valid.
+
+    Returns:
+        list[float]: The parsed numbers.
+    """
+    try:
+        numbers = [float(number) for number in value.split(',')]
+    except ValueError:
+        numbers = []
+
+    if len(numbers) != count:
+        raise HTTPException(status_code=422, detail=f'Invalid value: {value}')
+
+    return numbers
+
+
+def parse_keypoints(values: list[str]) -> list[Keypoint]:
+    """Parses the keypoints in the format `x,y`.
+
+    Args:
+        values (list[str]): The keypoints.
+
+    Raises:
+        HTTPException: If any of the keypoints is not valid.
+
+    Returns:
+        list[Keypoint]: The parsed keypoints.
+    """
+    keypoints = []
+
+    for value in values:
+        x, y = _parse_numbers(value, 2)
+
+        if x < 0 or y < 0:
+            raise HTTPException(status_code=422, detail=f'Invalid keypoint: {value}')
+
+        keypoints.append(Keypoint(x=x, y=y))
+
+    return keypoints
+
+
+def parse_bboxes(values: list[str]) -> list[BoundingBox]:
+    """Parses the bounding boxes in the format `x,y,width,height`.
+
+    Args:
+        values (list[str]): The bounding boxes.
+
+    Raises:
+        HTTPException: If any of the bounding boxes is not valid.
+
+    Returns:
+        list[BoundingBox]: The parsed bounding boxes.
+    """
+    bboxes = []
+
+    for value in values:
+        x, y, width, height = _parse_numbers(value, 4)
+
+        if x < 0 or y < 0 or width <= 0 or height <= 0:
+            raise HTTPException(
+                status_code=422,
+                detail=f'Invalid bounding box: {value}'
+            )
+
+        bboxes.append(BoundingBox(x=x, y=y, width=width, height=height))
+
+    return bboxes
+
+
 def exist_task(redis: Redis, task_id: uuid.UUID) -> bool:
     """Checks if a task exists in the Redis database.
 
@@ -32,3 +218,77 @@ def exist_task(redis: Redis, task_id: uuid.UUID) -> bool:
         bool: True if the task exists, False otherwise.
     """
     return redis.exists(f"celery-task-meta-{str(task_id)}")
+
+
+async def get_slide_path(db: AsyncSession, region: SlideRegion) -> str:
+    """Gets the path to the slide of the region.
+
+    Args:
+        db (AsyncSession): The database session.
+        region (SlideRegion): The slide region.
+
+    Raises:
+        HTTPException: If the slide is not found.
+
+    Returns:
+        str: The path to the slide.
+    """
+    if region.slide_path is not None:
+        return region.slide_path
+
+    result = await db.execute(
+        select(
+            db_models.WholeSlideImage.path
+        ).where(
+            db_models.WholeSlideImage.id == region.slide_id
+        )
+    )
+
+    slide = result.fetchone()
+
+    if slide is None:
+        raise HTTPException(status_code=404, detail="Slide not found")
+
+    return slide.path
+
+
+def send_task_with_region(
+    task_name: str,
+    region: SlideRegion,
+    slide_path: str,
+    kwargs: dict[str, Any]
+) -> AsyncResult:
+    """Sends a task which receives the image of the slide region as the first
+    argument. The region is downloaded from the reader service by the worker.
+
+    Args:
+        task_name (str): The name of the task.
+        region (SlideRegion): The slide region.
+        slide_path (str): The path to the slide.
+        kwargs (dict[str, Any]): The keyword arguments of the task.
+
+    Returns:
+        AsyncResult: The result of the task.
+    """
+    download_sig = celery_app.signature(
+        DOWNLOAD_REGION_TASK_NAME,
+        kwargs={
+            'slide_path': slide_path,
+            'x': region.x,
+            'y': region.y,
+            'width': region.w,
+            'height': region.h,
+            'level': region.level
+        },
+        queue=READER_QUEUE,
+        ignore_result=True
+    )
+    task_sig = celery_app.signature(task_name, kwargs=kwargs)
+    task_id = task_sig.freeze().id
+
+    # The task message is published by the worker after the region is downloaded
+    store_pending_result(task_id, task_name)
+
+    (download_sig | task_sig).apply_async()
+
+    return celery_app.AsyncResult(task_id)
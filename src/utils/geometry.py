@@ -0,0 +1,158 @@
+from typing import Annotated, Any, Literal, NamedTuple
+
+import numpy as np
+from fastapi import Query, Request, Response
+
+# The compact geometry encoded as JSON
+GEOMETRY_JSON_MEDIA_TYPE = 'application/vnd.annotaid.geometry+json'
+# The compact geometry encoded as MessagePack, the arrays are little-endian bytes
+GEOMETRY_MSGPACK_MEDIA_TYPE = 'application/vnd.annotaid.geometry+msgpack'
+
+GeometryFormat = Literal['keypoints', 'flat', 'delta']
+
+GEOMETRY_RESPONSES: dict[int | str, dict[str, Any]] = {
+    200: {
+        'description': 'The geometry as the lists of the keypoints (bounding '
+        'boxes) or, if it is negotiated, in the compact format: the flat int32 '
+        '`coordinates` (x, y of the vertices) of all the polygons with their '
+        '`offsets` (N+1, the polygon i are the vertices offsets[i]:offsets[i+1]), '
+        'optionally delta-encoded (the vertices after the first one of a polygon '
+        'are relative to the previous one), and the flat int32 `bboxes` '
+        '(x, y, width, height) with the float32 `confidences` and the `labels`.',
+        'content': {
+            GEOMETRY_JSON_MEDIA_TYPE: {'schema': {'type': 'object'}},
+            GEOMETRY_MSGPACK_MEDIA_TYPE: {
+                'schema': {'type': 'string', 'format': 'binary'}
+            }
+        }
+    }
+}
+
+
+class GeometryEncoding(NamedTuple):
+    """The negotiated compact format of the geometry in the response."""
+    # The vertices are relative to the previous vertex of the polygon
+    delta: bool
+    # The response is MessagePack instead of JSON
+    binary: bool
+
+
+def get_geometry_encoding(
+    request: Request,
+    geometry: Annotated[
+        GeometryFormat | None,
+        Query(description="The format of the geometry in the response: keypoints "
+              "(the lists of the keypoints), flat (the flat int32 coordinates "
+              "with the offsets of the polygons) or delta (flat, delta-encoded). "
+              "The compact formats are also selected by `Accept: "
+              f"{GEOMETRY_JSON_MEDIA_TYPE}` or `{GEOMETRY_MSGPACK_MEDIA_TYPE}` "
+              "(binary).")
+    ] = None
+) -> GeometryEncoding | None:
+    """Dependency to negotiate the compact format of the geometry from the query
+    parameter and the Accept header.
+
+    Args:
+        request (Request): The incoming request.
+        geometry (GeometryFormat | None): The requested format.
+
+    Returns:
+        GeometryEncoding | None: The compact format, None for the keypoints.
+    """
+    accept = request.headers.get('accept', '')
+    binary = GEOMETRY_MSGPACK_MEDIA_TYPE in accept
+
+    if geometry == 'keypoints':
+        return None
+
+    if geometry is None and not binary and GEOMETRY_JSON_MEDIA_TYPE not in accept:
+        return None
+
+    return GeometryEncoding(delta=geometry == 'delta', binary=binary)
+
+
+def pack_polygons(polygons: list[np.ndarray], delta: bool = False) -> dict[str, Any]:
+    """Packs the polygons to the flat arrays of the compact format.
+
+    Args:
+        polygons (list[np.ndarray]): The polygons, Kx2 arrays of the (x, y) vertices.
+        delta (bool): Whether the vertices after the first one of each polygon
+        are encoded relative to the previous vertex.
+
+    Returns:
+        dict[str, Any]: The int32 `coordinates` of the vertices rounded
+        to the pixels, the int32 `offsets` of the polygons (N+1, polygon i are
+        the vertices offsets[i]:offsets[i + 1]) and the `delta` flag.
+    """
+    offsets = np.zeros(len(polygons) + 1, dtype=np.int32)
+    np.cumsum([len(polygon) for polygon in polygons], out=offsets[1:])
+
+    vertices = np.rint(
+        np.concatenate(polygons) if polygons else np.empty((0, 2))
+    ).astype(np.int32)
+
+    if delta and len(vertices) > 0:
+        starts = offsets[:-1][offsets[:-1] < offsets[1:]]
+        deltas = np.diff(vertices, axis=0, prepend=vertices[:1])
+        deltas[starts] = vertices[starts]
+        vertices = deltas
+
+    return {
+        'coordinates': vertices.reshape(-1),
+        'offsets': offsets,
+        'delta': delta,
+    }
+
+
+def pack_bboxes(bboxes: list[np.ndarray]) -> np.ndarray:
+    """Packs the bounding boxes to the flat array of the compact format.
+
+    Args:
+        bboxes (list[np.ndarray]): The bounding boxes (x1, y1, x2, y2).
+
+    Returns:
+        np.ndarray: The int32 (x, y, width, height) of the bounding boxes
+        rounded to the pixels, flattened.
+    """
+    corners = np.rint(np.reshape(bboxes, (-1, 4))).astype(np.int32)
+    corners[:, 2:] -= corners[:, :2]
+
+    return corners.reshape(-1)
+
+
+def _encode_array(value: Any) -> Any:
+    """Encodes the arrays of the MessagePack response as little-endian bytes."""
+    if isinstance(value, np.ndarray):
+        return np.ascontiguousarray(
+            value,
+            dtype=value.dtype.newbyteorder('<')
+        ).tobytes()
+
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+def geometry_response(content: dict[str, Any], encoding: GeometryEncoding) -> Response:
+    """Encodes the content with the packed geometry, skipping the validation
+    of the response model.
+
+    Args:
+        content (dict[str, Any]): The content with the arrays of the compact format.
+        encoding (GeometryEncoding): The negotiated format.
+
+    Returns:
+        Response: The encoded response.
+    """
+    if encoding.binary:
+        import msgpack
+
+        return Response(
+            msgpack.packb(content, default=_encode_array),
+            media_type=GEOMETRY_MSGPACK_MEDIA_TYPE
+        )
+
+    import orjson
+
+    return Response(
+        orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type=GEOMETRY_JSON_MEDIA_TYPE
+    )
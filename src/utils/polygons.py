@@ -0,0 +1,115 @@
+from collections.abc import Iterable
+
+import numpy as np
+
+
+def _find_contours(mask: np.ndarray, tolerance: float) -> list[np.ndarray]:
+    """Finds the contours of the binary mask as imantics does (the outlines
+    and the holes, the vertices of the straight segments are dropped).
+
+    Args:
+        mask (np.ndarray): The uint8 binary mask.
+        tolerance (float): The maximum distance (in pixels) of the simplified
+        contour from the original one, 0 keeps all the vertices.
+
+    Returns:
+        list[np.ndarray]: The contours, Kx2 int32 arrays of the (x, y) vertices.
+    """
+    import cv2
+
+    # the border closes the contours touching the edges of the mask
+    padded = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    contours, _ = cv2.findContours(
+        padded,
+        cv2.RETR_LIST,
+        cv2.CHAIN_APPROX_SIMPLE,
+        offset=(-1, -1)
+    )
+
+    if tolerance > 0:
+        # the Douglas-Peucker simplification
+        contours = [
+            cv2.approxPolyDP(contour, tolerance, closed=True) for contour in contours
+        ]
+
+    return [contour.reshape(-1, 2) for contour in contours]
+
+
+def mask_to_polygons(
+    mask: np.ndarray,
+    tolerance: float = 0.0,
+    offset: tuple[float, float] = (0, 0)
+) -> list[np.ndarray]:
+    """Extracts the polygons of the binary mask, the drop-in replacement
+    of imantics.Mask(mask).polygons().
+
+    Args:
+        mask (np.ndarray): The mask, the non-zero pixels are the objects.
+        tolerance (float): The maximum distance (in pixels) of the simplified
+        polygons from the contours, 0 keeps all the vertices.
+        offset (tuple[float, float]): The offset added to the vertices.
+
+    Returns:
+        list[np.ndarray]: The polygons, Kx2 arrays of the (x, y) vertices.
+    """
+    contours = _find_contours((mask > 0).astype(np.uint8), tolerance)
+
+    return [contour + np.asarray(offset) for contour in contours]
+
+
+def instance_map_to_polygons(
+    instance_map: np.ndarray,
+    tolerance: float = 0.0,
+    offset: tuple[float, float] = (0, 0)
+) -> list[np.ndarray]:
+    """Extracts the polygons of each instance of the instance map. The bounding
+    boxes of all the instances are found in one pass over the map, the contours
+    of an instance are found only in its bounding box.
+
+    Args:
+        instance_map (np.ndarray): The map of the integer labels of the instances,
+        0 is the background.
+        tolerance (float): The maximum distance (in pixels) of the simplified
+        polygons from the contours, 0 keeps all the vertices.
+        offset (tuple[float, float]): The offset added to the vertices.
+
+    Returns:
+        list[np.ndarray]: The polygons of the instances ordered by their labels,
+        Kx2 arrays of the (x, y) vertices.
+    """
+    from scipy.ndimage import find_objects
+
+    polygons: list[np.ndarray] = []
+
+    for label, bbox in enumerate(find_objects(instance_map), start=1):
+        if bbox is None:
+            continue
+
+        rows, columns = bbox
+        instance_mask = (instance_map[bbox] == label).astype(np.uint8)
+        bbox_offset = np.asarray(offset) + (columns.start, rows.start)
+
+        polygons.extend(
+            contour + bbox_offset
+            for contour in _find_contours(instance_mask, tolerance)
+        )
+
+    return polygons
+
+
+def polygons_to_keypoints(
+    polygons: Iterable[np.ndarray]
+) -> list[list[dict[str, float]]]:
+    """Converts the polygons to the lists of the keypoints of the responses.
+
+    Args:
+        polygons (Iterable[np.ndarray]): The polygons, Kx2 arrays
+        of the (x, y) vertices.
+
+    Returns:
+        list[list[dict[str, float]]]: The keypoints of each polygon.
+    """
+    return [
+        [{'x': x, 'y': y} for x, y in np.asarray(polygon).tolist()]
+        for polygon in polygons
+    ]
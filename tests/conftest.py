@@ -0,0 +1,9 @@
+import os
+
+# The required settings, the tests do not connect to the services
+os.environ.setdefault('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+os.environ.setdefault('CELERY_BACKEND_URL', 'redis://localhost:6379/0')
+os.environ.setdefault('READER_URL', 'http://localhost:9000')
+os.environ.setdefault('POSTGRES_SERVER', 'localhost')
+os.environ.setdefault('POSTGRES_USER', 'postgres')
+os.environ.setdefault('POSTGRES_PASSWORD', 'postgres')
@@ -0,0 +1,52 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pytest
+
+from src.celery.shared.backends import (
+    check_parity,
+    export_onnx,
+    export_torchscript,
+    get_forward_graph,
+)
+
+if TYPE_CHECKING:
+    import torch
+else:
+    torch = pytest.importorskip('torch')
+
+
+def create_module() -> 'torch.nn.Module':
+    """Creates the small convolutional classifier with random weights."""
+    torch.manual_seed(0)
+
+    return torch.nn.Sequential(
+        torch.nn.Conv2d(3, 8, kernel_size=3, padding=1),
+        torch.nn.BatchNorm2d(8),
+        torch.nn.ReLU(),
+        torch.nn.AdaptiveAvgPool2d(1),
+        torch.nn.Flatten(),
+        torch.nn.Linear(8, 4),
+    )
+
+
+def test_onnx_export_parity(tmp_path: Path) -> None:
+    pytest.importorskip('onnxruntime')
+
+    graph = get_forward_graph(create_module(), torch.rand(1, 3, 32, 32))
+    path = tmp_path / 'model.onnx'
+
+    export_onnx(graph, path)
+    report = check_parity(graph, path, 'onnx', atol=1e-4, rtol=1e-4)
+
+    assert report['passed'], report
+
+
+def test_torchscript_export_parity(tmp_path: Path) -> None:
+    graph = get_forward_graph(create_module(), torch.rand(1, 3, 32, 32))
+    path = tmp_path / 'model.torchscript'
+
+    export_torchscript(graph, path)
+    report = check_parity(graph, path, 'torchscript', atol=1e-4, rtol=1e-4)
+
+    assert report['passed'], report
@@ -0,0 +1,31 @@
+import pytest
+
+from src.celery.inference.batching import MicroBatcher
+
+
+def test_results_are_returned_to_their_requests() -> None:
+    batcher: MicroBatcher[int, int] = MicroBatcher(
+        lambda items: [item * 2 for item in items],
+        max_batch_size=4,
+        window=0.05,
+        name='test-batcher'
+    )
+
+    futures = [batcher.submit(item) for item in range(10)]
+
+    assert [future.result(timeout=5) for future in futures] == list(range(0, 20, 2))
+
+
+def test_missing_results_fail_the_batch() -> None:
+    batcher: MicroBatcher[int, int] = MicroBatcher(
+        lambda items: items[1:],
+        max_batch_size=2,
+        window=1.0,
+        name='test-batcher'
+    )
+
+    futures = [batcher.submit(item) for item in range(2)]
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
@@ -0,0 +1,104 @@
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pytest
+
+from src.celery.shared.backends import (
+    OnnxModel,
+    create_onnx_session,
+    export_onnx,
+    get_forward_graph,
+)
+from src.celery.shared.quantization import (
+    CalibrationMethod,
+    compare_predictions,
+    quantize_onnx_dynamic,
+    quantize_onnx_static,
+)
+
+if TYPE_CHECKING:
+    import torch
+else:
+    torch = pytest.importorskip('torch')
+
+pytest.importorskip('onnxruntime')
+
+
+def create_module() -> 'torch.nn.Module':
+    """Creates the small convolutional classifier with random weights."""
+    torch.manual_seed(0)
+
+    return torch.nn.Sequential(
+        torch.nn.Conv2d(3, 8, kernel_size=3, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.Conv2d(8, 8, kernel_size=3, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.AdaptiveAvgPool2d(1),
+        torch.nn.Flatten(),
+        torch.nn.Linear(8, 4),
+    )
+
+
+def run(path: Path, inputs: np.ndarray) -> np.ndarray:
+    """Runs the ONNX graph on the CPU."""
+    session = create_onnx_session(path, torch.device('cpu'))
+    (outputs,) = OnnxModel(session).run(inputs)
+
+    return outputs
+
+
+@pytest.fixture
+def onnx_path(tmp_path: Path) -> Path:
+    path = tmp_path / 'model.onnx'
+    export_onnx(get_forward_graph(create_module(), torch.rand(1, 3, 32, 32)), path)
+
+    return path
+
+
+@pytest.fixture
+def inputs() -> np.ndarray:
+    return np.random.default_rng(0).random((16, 3, 32, 32), dtype=np.float32)
+
+
+def test_dynamic_quantization(onnx_path: Path, inputs: np.ndarray) -> None:
+    quantized_path = onnx_path.with_name('model.int8.onnx')
+
+    quantize_onnx_dynamic(onnx_path, quantized_path)
+
+    expected = run(onnx_path, inputs)
+    actual = run(quantized_path, inputs)
+
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, atol=0.05)
+
+
+@pytest.mark.parametrize('calibration_method', ['minmax', 'entropy', 'percentile'])
+def test_static_quantization(
+    onnx_path: Path,
+    inputs: np.ndarray,
+    calibration_method: CalibrationMethod
+) -> None:
+    quantized_path = onnx_path.with_name('model.int8.onnx')
+
+    quantize_onnx_static(
+        onnx_path,
+        quantized_path,
+        [(x[None],) for x in inputs],
+        calibration_method
+    )
+
+    expected = run(onnx_path, inputs)
+    actual = run(quantized_path, inputs)
+
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, atol=0.05)
+
+    agreement, samples = compare_predictions(
+        'label_agreement',
+        [expected.argmax(axis=1)],
+        [actual.argmax(axis=1)]
+    )
+
+    assert samples == len(inputs)
+    assert agreement >= 0.75
@@ -0,0 +1,129 @@
+import uuid
+from enum import Enum
+
+import msgpack
+import numpy as np
+import pytest
+
+from src.core.config import settings
+from src.core.serialization import _HEADER_LENGTH, _NDARRAY_EXT, dumps, loads
+from src.schemas.shared import Keypoint
+
+
+class Color(Enum):
+    red = 'red'
+
+
+def get_array_codec(data: bytes) -> str:
+    """Gets the compression codec from the header of the serialized array."""
+    ext = msgpack.unpackb(data)
+
+    assert ext.code == _NDARRAY_EXT
+
+    (header_length,) = _HEADER_LENGTH.unpack_from(ext.data)
+    _, _, codec = msgpack.unpackb(
+        ext.data[_HEADER_LENGTH.size:_HEADER_LENGTH.size + header_length]
+    )
+
+    return codec
+
+
+@pytest.mark.parametrize('dtype', ['uint8', 'int32', 'float16', 'float32', 'bool'])
+def test_array_round_trip(dtype: str) -> None:
+    array: np.ndarray = np.arange(24).reshape(2, 3, 4).astype(dtype)
+
+    decoded = loads(dumps(array))
+
+    assert decoded.dtype == array.dtype
+    assert decoded.shape == array.shape
+    np.testing.assert_array_equal(decoded, array)
+
+
+def test_non_contiguous_array_round_trip() -> None:
+    array: np.ndarray = np.arange(64, dtype=np.float32).reshape(8, 8)[::2, 1::3].T
+
+    np.testing.assert_array_equal(loads(dumps(array)), array)
+
+
+def test_zero_dimensional_array_round_trip() -> None:
+    decoded = loads(dumps(np.array(3.5)))
+
+    assert decoded.shape == ()
+    assert decoded == 3.5
+
+
+def test_decoded_array_is_read_only() -> None:
+    decoded = loads(dumps(np.zeros((4, 4), dtype=np.float32)))
+
+    assert not decoded.flags.writeable
+
+    with pytest.raises(ValueError):
+        decoded[0, 0] = 1
+
+
+def test_object_array_is_rejected() -> None:
+    with pytest.raises(TypeError):
+        dumps(np.array([{}, None], dtype=object))
+
+
+def test_nested_round_trip() -> None:
+    task_id = uuid.uuid4()
+    obj = {
+        'image': np.ones((2, 2, 3), dtype=np.uint8),
+        'size': (512, 512),
+        'task_id': task_id,
+        'score': np.float32(0.5),
+        'color': Color.red,
+        'keypoint': Keypoint(x=1, y=2),
+        'items': [(1, 'a'), None, True],
+        3: 'integer key',
+    }
+
+    decoded = loads(dumps(obj))
+
+    np.testing.assert_array_equal(decoded['image'], obj['image'])
+    assert decoded['size'] == (512, 512)
+    assert decoded['task_id'] == task_id
+    assert decoded['score'] == 0.5
+    assert decoded['color'] == 'red'
+    assert decoded['keypoint'] == Keypoint(x=1, y=2)
+    assert decoded['items'] == [(1, 'a'), None, True]
+    assert decoded[3] == 'integer key'
+
+
+def test_builtin_subclasses_are_serialized() -> None:
+    class Kwargs(dict[str, int]):
+        pass
+
+    assert loads(dumps(Kwargs(a=1))) == {'a': 1}
+
+
+def test_unsupported_type_is_rejected() -> None:
+    with pytest.raises(TypeError):
+        dumps(object())
+
+
+@pytest.mark.parametrize('codec', ['lz4', 'zstd'])
+def test_compression_threshold(codec: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    pytest.importorskip('lz4.frame' if codec == 'lz4' else 'zstandard')
+
+    monkeypatch.setattr(settings, 'CELERY_ARRAY_COMPRESSION', codec)
+    monkeypatch.setattr(settings, 'CELERY_ARRAY_COMPRESSION_THRESHOLD', 1024)
+
+    small: np.ndarray = np.zeros(16, dtype=np.float32)
+    large: np.ndarray = np.zeros((64, 64), dtype=np.float32)
+
+    assert get_array_codec(dumps(small)) == 'none'
+    assert get_array_codec(dumps(large)) == codec
+
+    compressed = dumps(large)
+
+    assert len(compressed) < large.nbytes
+    np.testing.assert_array_equal(loads(compressed), large)
+
+
+def test_compression_disabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, 'CELERY_ARRAY_COMPRESSION', 'none')
+    monkeypatch.setattr(settings, 'CELERY_ARRAY_COMPRESSION_THRESHOLD', 0)
+
+    assert get_array_codec(dumps(np.zeros((64, 64), dtype=np.float32))) == 'none'